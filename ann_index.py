@@ -0,0 +1,234 @@
+from __future__ import annotations
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# =========================
+# 0) 索引类型与默认参数
+# =========================
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# 非 Flat 索引无法无损还原向量（IVF 需要 direct map，PQ 有损），原始向量单独保存，供增量构建复用
+VECTORS_NAME = "vectors.npy"
+
+PARAM_KEYS = {
+    "flat": (),
+    "hnsw": ("M", "ef_construction", "ef_search"),
+    "ivf_flat": ("nlist", "nprobe"),
+    "ivf_pq": ("nlist", "nprobe", "m", "nbits"),
+}
+
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+NPROBE_SWEEP = (1, 2, 4, 8, 16, 32, 64)
+
+
+def default_params(kind: str, n: int, dim: int) -> dict:
+    """
+    按条目数 / 维度给出一组保守的默认参数
+    - hnsw：M、ef_construction，检索期 ef_search
+    - ivf_*：nlist ≈ 4·sqrt(n)（每个簇至少约 39 个训练点），检索期 nprobe
+    - ivf_pq：m 个子量化器（需整除维度），每个 nbits 位
+    """
+    if kind == "flat":
+        return {}
+    if kind == "hnsw":
+        return {"M": 32, "ef_construction": 200, "ef_search": 64}
+
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+    params = {"nlist": nlist, "nprobe": min(8, nlist)}
+    if kind == "ivf_pq":
+        m = next(c for c in (dim // 8, dim // 4, dim // 2, dim, 1) if c and dim % c == 0)
+        # 每个子量化器有 2^nbits 个中心，训练点太少时减小 nbits
+        nbits = max(4, min(8, int(math.log2(max(n, 2) / 39)) if n > 39 else 4))
+        params.update({"m": m, "nbits": nbits})
+    return params
+
+
+def resolve_params(kind: str, n: int, dim: int, overrides: Optional[dict] = None) -> dict:
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"未知的索引类型：{kind}（可选 {' / '.join(INDEX_TYPES)}）")
+    params = default_params(kind, n, dim)
+    for key, value in (overrides or {}).items():
+        # 其他索引类型的参数直接忽略
+        if value is not None and key in PARAM_KEYS[kind]:
+            params[key] = value
+    return params
+
+
+# =========================
+# 1) 构建 / 检索参数
+# =========================
+def build_ann_index(vectors: np.ndarray, kind: str, params: dict):
+    """
+    用全部向量构建指定类型的索引（L2 距离，与 LangChain FAISS 默认的 IndexFlatL2 一致）
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(params["M"]))
+        index.hnsw.efConstruction = int(params["ef_construction"])
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, int(params["nlist"]))
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, int(params["nlist"]), int(params["m"]), int(params["nbits"]))
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_defaults(index, params)
+    return index
+
+
+def apply_search_defaults(index, params: dict) -> None:
+    """
+    ef_search / nprobe 不会随索引文件保存，加载后按 manifest 中的参数设置
+    """
+    if hasattr(index, "hnsw") and params.get("ef_search"):
+        index.hnsw.efSearch = int(params["ef_search"])
+    if hasattr(index, "nprobe") and params.get("nprobe"):
+        index.nprobe = int(params["nprobe"])
+
+
+def search_parameters(index, selector=None, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+    """
+    组合 IDSelector 与检索期参数；没有任何参数时返回 None。
+    未显式给出的 ef_search / nprobe 沿用索引当前值（SearchParameters 自带的默认值会覆盖索引设置）。
+    """
+    import faiss
+
+    if hasattr(index, "hnsw"):
+        if selector is None and ef_search is None:
+            return None
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(ef_search or index.hnsw.efSearch))
+    if hasattr(index, "nprobe"):
+        if selector is None and nprobe is None:
+            return None
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(nprobe or index.nprobe))
+    if selector is None:
+        return None
+    return faiss.SearchParameters(sel=selector)
+
+
+def index_nbytes(index) -> int:
+    import faiss
+
+    return int(faiss.serialize_index(index).size)
+
+
+def save_vectors(out_dir: str, vectors: np.ndarray) -> None:
+    tmp_path = os.path.join(out_dir, VECTORS_NAME + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, os.path.join(out_dir, VECTORS_NAME))
+
+
+def load_vectors(out_dir: str) -> Optional[np.ndarray]:
+    path = os.path.join(out_dir, VECTORS_NAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+# =========================
+# 2) 召回率 / 延迟报告
+# =========================
+def _search_latency(index, queries: np.ndarray, k: int, params) -> "tuple[np.ndarray, float, float]":
+    samples: List[float] = []
+    rows = []
+    for q in queries:
+        start = time.perf_counter()
+        if params is None:
+            _, ids = index.search(q[None, :], k)
+        else:
+            _, ids = index.search(q[None, :], k, params=params)
+        samples.append((time.perf_counter() - start) * 1000)
+        rows.append(ids[0])
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return np.array(rows), sum(samples) / len(samples), p95
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(f[:k]) - {-1}) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def ann_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    kinds: Sequence[str],
+    k: int = 5,
+    overrides: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """
+    与精确检索（Flat）对比：各索引类型在不同 ef_search / nprobe 下的 recall@k、
+    单条查询平均 / p95 延迟（毫秒）与索引大小
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    n, dim = vectors.shape
+    k = min(k, n)
+
+    exact = build_ann_index(vectors, "flat", {})
+    truth, exact_ms, exact_p95 = _search_latency(exact, queries, k, None)
+    report = {
+        "entries": n,
+        "queries": len(queries),
+        "k": k,
+        "results": [{
+            "type": "flat", "params": {}, "recall": 1.0,
+            "avg_ms": round(exact_ms, 4), "p95_ms": round(exact_p95, 4),
+            "build_seconds": 0.0, "index_bytes": index_nbytes(exact),
+        }],
+    }
+
+    for kind in kinds:
+        if kind == "flat":
+            continue
+        params = resolve_params(kind, n, dim, (overrides or {}).get(kind))
+        start = time.perf_counter()
+        index = build_ann_index(vectors, kind, params)
+        build_seconds = time.perf_counter() - start
+        size = index_nbytes(index)
+
+        if kind == "hnsw":
+            sweep = [("ef_search", v) for v in sorted(set(EF_SEARCH_SWEEP) | {params["ef_search"]})]
+        else:
+            sweep = [("nprobe", v) for v in sorted(set(NPROBE_SWEEP) | {params["nprobe"]}) if v <= params["nlist"]]
+        for knob, value in sweep:
+            found, avg_ms, p95_ms = _search_latency(
+                index, queries, k, search_parameters(index, **{knob: value})
+            )
+            report["results"].append({
+                "type": kind,
+                "params": {**params, knob: value},
+                "recall": round(recall_at_k(truth, found, k), 4),
+                "avg_ms": round(avg_ms, 4),
+                "p95_ms": round(p95_ms, 4),
+                "build_seconds": round(build_seconds, 3),
+                "index_bytes": size,
+                "default": value == params.get(knob),
+            })
+    return report
+
+
+def format_ann_report(report: dict) -> str:
+    lines = [
+        f"【ANN 报告】{report['entries']} 条，{report['queries']} 个查询，recall@{report['k']} 以 Flat 精确检索为基准",
+        f"  {'类型':<10}{'检索参数':<16}{'recall':>8}{'avg_ms':>10}{'p95_ms':>10}{'大小(KB)':>12}",
+    ]
+    for r in report["results"]:
+        knob = next((f"{key}={r['params'][key]}" for key in ("ef_search", "nprobe") if key in r["params"]), "-")
+        mark = " *" if r.get("default") else ""
+        lines.append(
+            f"  {r['type']:<10}{knob:<16}{r['recall']:>8.3f}{r['avg_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+            f"{r['index_bytes'] / 1024:>12.1f}{mark}"
+        )
+    lines.append("  （* 为写入 manifest 的默认检索参数）")
+    return "\n".join(lines)
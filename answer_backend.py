@@ -0,0 +1,272 @@
+from __future__ import annotations
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple, Union
+
+# =========================
+# 0) 配置
+# =========================
+# 设置后前端（UI / CLI）只作为瘦客户端，问答交给独立的推理服务（answer_service.py）
+ANSWER_SERVICE_URL = os.getenv("ANSWER_SERVICE_URL", "")
+# 非流式请求的超时（秒）；流式请求为相邻两次事件之间的超时
+ANSWER_SERVICE_TIMEOUT = float(os.getenv("ANSWER_SERVICE_TIMEOUT", "120"))
+
+
+class AnswerServiceError(RuntimeError):
+    """
+    payload：服务返回的 JSON 响应体（如 /readyz 的 503 仍带有各组件加载耗时），无法解析时为空 dict
+    """
+
+    def __init__(self, status: int, message: str, payload: Optional[dict] = None):
+        super().__init__(f"推理服务返回 {status}：{message}")
+        self.status = status
+        self.payload = payload or {}
+
+
+# =========================
+# 1) 接口
+# =========================
+class AnswerBackend(ABC):
+    """
+    前端使用的问答接口：同进程直接调用（LocalAnswerBackend），或经 HTTP 调用推理服务（RemoteAnswerBackend）
+    - get_hebei_answer()：参数与返回值同 hebei_agent_faiss_main.get_hebei_answer（stream=True 时为事件生成器）
+    - search()：只检索，返回 (知识内容, evidence)
+    - readiness()：是否就绪与各组件加载耗时（未加载为 None）
+    - status()：readiness() 之外再加内存、会话存储、检索 / 首字统计
+    - last_trace()：某个 user_id 最近一次问答的 trace（dict，含 breakdown）
+    readiness() / status() / last_trace() 是观测接口，后端不可用时降级返回而不抛异常
+    """
+
+    uniapi_enabled: bool = False
+
+    @abstractmethod
+    def get_hebei_answer(
+        self,
+        user_query: str,
+        user_id: str = "default",
+        use_llm_enhance: bool = False,
+        return_evidence: bool = False,
+        filters: Optional[dict] = None,
+        stream: bool = False,
+    ) -> Union[str, Tuple[str, List[dict]], Iterator[dict]]:
+        ...
+
+    @abstractmethod
+    def search(
+        self, query: str, user_id: str = "default", top_k: int = 5, filters: Optional[dict] = None
+    ) -> Tuple[str, List[dict]]:
+        ...
+
+    @abstractmethod
+    def clear_history(self, user_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def warmup(self) -> None:
+        ...
+
+    @abstractmethod
+    def readiness(self) -> dict:
+        ...
+
+    @abstractmethod
+    def status(self) -> dict:
+        ...
+
+    @abstractmethod
+    def last_trace(self, user_id: str) -> Optional[dict]:
+        ...
+
+
+# =========================
+# 2) 同进程实现
+# =========================
+class LocalAnswerBackend(AnswerBackend):
+    """
+    直接调用本进程的引擎（模型与向量库加载在本进程）；推理服务本身也通过它对外提供接口
+    """
+
+    def __init__(self):
+        import hebei_agent_faiss_main
+
+        self._main = hebei_agent_faiss_main
+
+    @property
+    def uniapi_enabled(self) -> bool:
+        return self._main.get_engine().uniapi_enabled
+
+    def get_hebei_answer(self, user_query, user_id="default", use_llm_enhance=False,
+                         return_evidence=False, filters=None, stream=False):
+        return self._main.get_hebei_answer(
+            user_query,
+            user_id,
+            use_llm_enhance=use_llm_enhance,
+            return_evidence=return_evidence,
+            filters=filters,
+            stream=stream,
+        )
+
+    def search(self, query, user_id="default", top_k=5, filters=None):
+        self._main.get_engine().maybe_reload_index()
+        return self._main.retrieve_relevant_knowledge(
+            query, user_id, top_k=top_k, return_evidence=True, filters=filters
+        )
+
+    def clear_history(self, user_id: str) -> None:
+        self._main.clear_history(user_id)
+
+    def warmup(self) -> None:
+        self._main.get_engine().warmup(background=True)
+
+    def readiness(self) -> dict:
+        eng = self._main.get_engine()
+        return {"ready": eng.is_ready(), "components": eng.startup_report()}
+
+    def status(self) -> dict:
+        eng = self._main.get_engine()
+        return {
+            **self.readiness(),
+            "uniapi_enabled": eng.uniapi_enabled,
+            "memory": eng.memory_report(),
+            "conversations": self._main.get_conversation_store().stats(),
+            "retrieval": eng.retrieval_stats(),
+            "ttft": eng.ttft_stats(),
+        }
+
+    def last_trace(self, user_id: str) -> Optional[dict]:
+        import tracing
+
+        trace = tracing.last_trace(user_id)
+        if trace is None:
+            return None
+        return {**trace.to_dict(), "breakdown": trace.breakdown()}
+
+
+# =========================
+# 3) HTTP 瘦客户端
+# =========================
+class RemoteAnswerBackend(AnswerBackend):
+    """
+    调用 answer_service.py 暴露的 HTTP 接口，本进程不加载模型与向量库；
+    流式接口为 SSE（data: {事件}），事件格式与本地 stream=True 完全一致
+    """
+
+    def __init__(self, base_url: str = ANSWER_SERVICE_URL, timeout: float = ANSWER_SERVICE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._uniapi_enabled: Optional[bool] = None
+
+    def _open(self, method: str, path: str, payload: Optional[dict] = None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                payload = json.loads(e.read() or b"{}")
+            except ValueError:
+                payload = {}
+            if not isinstance(payload, dict):
+                payload = {}
+            message = payload.get("error", {}).get("message", e.reason)
+            raise AnswerServiceError(e.code, message, payload) from None
+
+    def _json(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        with self._open(method, path, payload) as resp:
+            return json.loads(resp.read())
+
+    def _stream(self, payload: dict) -> Iterator[dict]:
+        with self._open("POST", "/v1/answer/stream", payload) as resp:
+            for line in resp:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    return
+                event = json.loads(data)
+                if event.get("type") == "error":
+                    raise AnswerServiceError(500, event.get("message", ""))
+                yield event
+
+    @property
+    def uniapi_enabled(self) -> bool:
+        if self._uniapi_enabled is None:
+            status = self.status()
+            if "error" in status:
+                # 服务暂不可达：先按未启用处理，下次再问
+                return False
+            self._uniapi_enabled = bool(status.get("uniapi_enabled"))
+        return self._uniapi_enabled
+
+    def get_hebei_answer(self, user_query, user_id="default", use_llm_enhance=False,
+                         return_evidence=False, filters=None, stream=False):
+        payload = {
+            "query": user_query,
+            "user_id": user_id,
+            "use_llm_enhance": use_llm_enhance,
+            "filters": filters,
+        }
+        if stream:
+            return self._stream(payload)
+        result = self._json("POST", "/v1/answer", payload)
+        return (result["answer"], result["evidence"]) if return_evidence else result["answer"]
+
+    def search(self, query, user_id="default", top_k=5, filters=None):
+        result = self._json("POST", "/v1/search", {
+            "query": query, "user_id": user_id, "top_k": top_k, "filters": filters,
+        })
+        return result["knowledge"], result["evidence"]
+
+    def clear_history(self, user_id: str) -> None:
+        self._json("POST", "/v1/history/clear", {"user_id": user_id})
+
+    def warmup(self) -> None:
+        # 推理服务启动时自行预热，前端无需触发
+        pass
+
+    def readiness(self) -> dict:
+        try:
+            return self._json("GET", "/readyz")
+        except AnswerServiceError as e:
+            # 未就绪时服务返回 503，响应体里仍有各组件加载耗时
+            if "ready" in e.payload:
+                return e.payload
+            return {"ready": False, "error": str(e)}
+        except OSError as e:
+            # 连接失败同样视为未就绪
+            return {"ready": False, "error": str(e)}
+
+    def status(self) -> dict:
+        try:
+            return self._json("GET", "/v1/status")
+        except (AnswerServiceError, OSError) as e:
+            return {"ready": False, "error": str(e)}
+
+    def last_trace(self, user_id: str) -> Optional[dict]:
+        query = urllib.parse.urlencode({"user_id": user_id})
+        try:
+            return self._json("GET", f"/v1/trace?{query}")["trace"]
+        except (AnswerServiceError, OSError):
+            return None
+
+
+# =========================
+# 4) 工厂
+# =========================
+def create_answer_backend(service_url: str = ANSWER_SERVICE_URL) -> AnswerBackend:
+    """
+    service_url 为空时同进程问答，否则作为瘦客户端连接推理服务
+    """
+    if service_url:
+        return RemoteAnswerBackend(service_url)
+    return LocalAnswerBackend()
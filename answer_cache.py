@@ -0,0 +1,288 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# =========================
+# 0) 配置
+# =========================
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# 余弦距离阈值，0 表示关闭语义命中
+ANSWER_CACHE_SEMANTIC_DISTANCE = float(os.getenv("ANSWER_CACHE_SEMANTIC_DISTANCE", "0.05"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+# 落盘防抖间隔（秒）：写入只标记脏，由后台定时器合并写盘
+ANSWER_CACHE_FLUSH_INTERVAL = float(os.getenv("ANSWER_CACHE_FLUSH_INTERVAL", "5"))
+
+_IGNORED_CHARS = re.compile(r"[\s？?！!。，,、~～]+")
+
+
+def normalize_query(query: str) -> str:
+    return _IGNORED_CHARS.sub("", unicodedata.normalize("NFKC", query)).lower()
+
+
+def cosine_distance(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    if not na or not nb:
+        return 1.0
+    return 1 - dot / (na * nb)
+
+
+# =========================
+# 1) 回答缓存
+# =========================
+class AnswerCache:
+    """
+    get_hebei_answer 的回答缓存
+    - 精确命中：key = (归一化问题, 检索证据 id, 模式 local/enhanced)
+    - 语义命中：检索证据与模式相同，且问题向量的余弦距离 <= semantic_distance
+    - TTL 过期 + LRU 淘汰；可选 JSON 落盘（防抖合并，在后台定时器线程写文件，不占请求路径）
+    - 语义比较时的问题向量在锁外计算，不让并发的 get / put 排队等模型
+    - 绑定向量库版本，向量库重建后整体失效
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        semantic_distance: float = ANSWER_CACHE_SEMANTIC_DISTANCE,
+        persist_path: str = ANSWER_CACHE_PATH,
+        flush_interval: float = ANSWER_CACHE_FLUSH_INTERVAL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_distance = semantic_distance
+        self.persist_path = persist_path
+        self.flush_interval = flush_interval
+        self.index_version: Optional[str] = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # (证据 id, 模式) -> 该分组下的 key，语义命中只在同组内比较
+        self._groups: Dict[Tuple[Tuple, str], List[str]] = {}
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        # 串行化写文件，与 self._lock 分开：写盘期间 get / put 不受影响
+        self._io_lock = threading.Lock()
+        # 快照序号：并发 flush 时旧快照不会覆盖已写入的新快照
+        self._snapshot_seq = 0
+        self._written_seq = 0
+
+        self._load()
+        if self.persist_path:
+            atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.semantic_distance > 0
+
+    @staticmethod
+    def make_key(query: str, evidence_ids: Sequence, mode: str) -> str:
+        raw = json.dumps([normalize_query(query), list(evidence_ids), mode], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # ---------- 内部维护 ----------
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        group = (tuple(entry["evidence"]), entry["mode"])
+        keys = self._groups.get(group)
+        if keys and key in keys:
+            keys.remove(key)
+            if not keys:
+                del self._groups[group]
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl > 0 and time.time() - entry["created"] > self.ttl
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._groups.clear()
+
+    # ---------- 对外接口 ----------
+    def bind_index(self, index_version: Optional[str]) -> None:
+        """
+        绑定当前向量库版本；版本变化（向量库重建）时清空缓存
+        """
+        with self._lock:
+            if self.index_version is not None and index_version != self.index_version:
+                self._clear_locked()
+            self.index_version = index_version
+            self._mark_dirty_locked()
+
+    def get(
+        self,
+        query: str,
+        evidence_ids: Sequence,
+        mode: str,
+        embed_fn: Optional[Callable[[], Sequence[float]]] = None,
+    ) -> Optional[str]:
+        """
+        先查精确命中；未命中且同组存在候选时才调用 embed_fn 计算问题向量做语义比较
+        """
+        if not self.enabled:
+            return None
+        key = self.make_key(query, evidence_ids, mode)
+        group = (tuple(evidence_ids), mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["answer"]
+
+            # 锁内只取候选快照，模型调用放到锁外
+            candidates: List[Tuple[str, dict]] = []
+            if embed_fn is not None and self.semantic_enabled:
+                for k in list(self._groups.get(group, [])):
+                    cand = self._entries[k]
+                    if self._expired(cand):
+                        self._remove(k)
+                    elif cand.get("vector") is not None:
+                        candidates.append((k, cand))
+            if not candidates:
+                self.misses += 1
+                return None
+
+        query_vector = embed_fn()
+
+        with self._lock:
+            best_key, best_dist = None, self.semantic_distance
+            for k, cand in candidates:
+                # 计算向量期间条目可能已被淘汰或覆盖
+                if self._entries.get(k) is not cand:
+                    continue
+                dist = cosine_distance(query_vector, cand["vector"])
+                if dist <= best_dist:
+                    best_key, best_dist = k, dist
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._entries[best_key]["answer"]
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        query: str,
+        evidence_ids: Sequence,
+        mode: str,
+        answer: str,
+        query_vector: Optional[Sequence[float]] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        key = self.make_key(query, evidence_ids, mode)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "query": query,
+                "evidence": list(evidence_ids),
+                "mode": mode,
+                "answer": answer,
+                "created": time.time(),
+                "vector": list(map(float, query_vector)) if query_vector is not None else None,
+            }
+            self._groups.setdefault((tuple(evidence_ids), mode), []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._mark_dirty_locked()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_locked()
+            self._mark_dirty_locked()
+
+    def stats(self) -> dict:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    # ---------- 落盘 ----------
+    def _load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.index_version = data.get("index_version")
+        for key, entry in data.get("entries", []):
+            if self._expired(entry):
+                continue
+            self._entries[key] = entry
+            self._groups.setdefault((tuple(entry["evidence"]), entry["mode"]), []).append(key)
+
+    def _mark_dirty_locked(self) -> None:
+        """
+        只标记脏并按需启动一次防抖定时器；flush_interval <= 0 时同步写盘
+        """
+        if not self.persist_path:
+            return
+        self._dirty = True
+        if self.flush_interval <= 0:
+            self._write(*self._snapshot_locked())
+            return
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _snapshot_locked(self) -> Tuple[int, dict]:
+        # 条目 dict 写入后不再修改，浅拷贝列表即可在锁外序列化
+        self._dirty = False
+        self._snapshot_seq += 1
+        return self._snapshot_seq, {
+            "index_version": self.index_version,
+            "entries": list(self._entries.items()),
+        }
+
+    def flush(self) -> None:
+        """
+        把尚未落盘的改动写入文件（定时器线程与进程退出时调用）
+        """
+        with self._lock:
+            self._flush_timer = None
+            if not self.persist_path or not self._dirty:
+                return
+            seq, data = self._snapshot_locked()
+        self._write(seq, data)
+
+    def _write(self, seq: int, data: dict) -> None:
+        with self._io_lock:
+            if seq <= self._written_seq:
+                return
+            self._written_seq = seq
+            tmp_path = self.persist_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
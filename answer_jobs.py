@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+# =========================
+# 0) 配置
+# =========================
+# 同时在后台生成回答的会话数（超出的排队）
+UI_JOB_WORKERS = int(os.getenv("UI_JOB_WORKERS", "4"))
+# 页面轮询任务进度的间隔（秒）
+UI_POLL_SECONDS = float(os.getenv("UI_POLL_SECONDS", "0.3"))
+
+QUEUED, RETRIEVING, GENERATING, DONE, ERROR, CANCELLED = (
+    "queued", "retrieving", "generating", "done", "error", "cancelled",
+)
+FINISHED = (DONE, ERROR, CANCELLED)
+
+STATUS_TEXT = {
+    QUEUED: "⏳ 排队中...",
+    RETRIEVING: "🔍 正在检索知识库...",
+    GENERATING: "✍️ 正在生成答案...",
+    DONE: "✅ 已完成",
+    ERROR: "❌ 生成失败",
+    CANCELLED: "⏹ 已取消",
+}
+
+
+# =========================
+# 1) 单次回答任务
+# =========================
+@dataclass
+class AnswerJob:
+    """
+    一个会话的一次提问；后台线程消费流式事件并更新字段，页面每次重跑读取 snapshot()
+    """
+    session_id: str
+    query: str
+    use_llm_enhance: bool = False
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = QUEUED
+    answer: str = ""
+    evidence: List[dict] = field(default_factory=list)
+    ttft: Optional[float] = None
+    cached: bool = False
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def update(self, **changes) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                setattr(self, key, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "query": self.query,
+                "status": self.status,
+                "status_text": STATUS_TEXT[self.status],
+                "answer": self.answer,
+                "evidence": list(self.evidence),
+                "ttft": self.ttft,
+                "cached": self.cached,
+                "error": self.error,
+                "elapsed": (self.finished_at or time.time()) - self.created,
+                "finished": self.status in FINISHED,
+            }
+
+
+# =========================
+# 2) 任务管理：每个会话同一时间只有一个任务
+# =========================
+class AnswerJobManager:
+    """
+    - submit()：提交问题，立即返回；回答在线程池里生成，页面不被阻塞
+    - current()：会话当前（或刚完成、尚未取走）的任务
+    - collect()：取走已完成的任务，页面把结果写入消息历史
+    answer_fn 为流式问答函数（默认 get_hebei_answer(stream=True)），便于换成 HTTP 客户端
+    """
+
+    def __init__(self, answer_fn: Callable[..., Iterator[dict]], workers: int = UI_JOB_WORKERS):
+        self.answer_fn = answer_fn
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="answer-job")
+        self._jobs: Dict[str, AnswerJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id: str, query: str, use_llm_enhance: bool = False) -> AnswerJob:
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is not None and not job.finished:
+                # 上一个问题还在生成，不重复提交
+                return job
+            job = AnswerJob(session_id=session_id, query=query, use_llm_enhance=use_llm_enhance)
+            self._jobs[session_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def current(self, session_id: str) -> Optional[AnswerJob]:
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    def busy(self, session_id: str) -> bool:
+        job = self.current(session_id)
+        return job is not None and not job.finished
+
+    def collect(self, session_id: str) -> Optional[AnswerJob]:
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is None or not job.finished:
+                return None
+            return self._jobs.pop(session_id)
+
+    def cancel(self, session_id: str) -> None:
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+        if job is not None:
+            job._cancel.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "sessions": len(jobs),
+            "running": sum(1 for j in jobs if j.status in (RETRIEVING, GENERATING)),
+            "queued": sum(1 for j in jobs if j.status == QUEUED),
+        }
+
+    def _run(self, job: AnswerJob) -> None:
+        if job._cancel.is_set():
+            job.update(status=CANCELLED, finished_at=time.time())
+            return
+        job.update(status=RETRIEVING)
+        events = None
+        try:
+            # 调用本身出错（后端不可用、构造请求失败）同样记为 ERROR，否则任务会一直停在“检索中”
+            events = self.answer_fn(job.query, job.session_id, use_llm_enhance=job.use_llm_enhance, stream=True)
+            for event in events:
+                if job._cancel.is_set():
+                    job.update(status=CANCELLED, finished_at=time.time())
+                    return
+                kind = event["type"]
+                if kind == "evidence":
+                    job.update(evidence=event["evidence"], status=GENERATING)
+                elif kind == "delta":
+                    with job._lock:
+                        job.answer += event["text"]
+                elif kind == "replace":
+                    job.update(answer=event["text"])
+                elif kind == "done":
+                    job.update(
+                        answer=event["answer"],
+                        ttft=event.get("ttft"),
+                        cached=event.get("cached", False),
+                        status=DONE,
+                        finished_at=time.time(),
+                    )
+        except Exception as e:
+            job.update(status=ERROR, error=f"{type(e).__name__}: {e}", finished_at=time.time())
+        finally:
+            close = getattr(events, "close", None) if events is not None else None
+            if close is not None:
+                close()
+        if not job.finished:
+            job.update(status=DONE, finished_at=time.time())
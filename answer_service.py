@@ -0,0 +1,298 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from answer_backend import LocalAnswerBackend
+
+# =========================
+# 0) 配置
+# =========================
+SERVICE_HOST = os.getenv("ANSWER_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("ANSWER_SERVICE_PORT", "8900"))
+# 同时执行的问答 / 检索请求数；超出的请求排队
+SERVICE_WORKERS = int(os.getenv("ANSWER_SERVICE_WORKERS", "8"))
+# 排队超过该秒数仍没有空闲 worker 时返回 503
+SERVICE_QUEUE_TIMEOUT = float(os.getenv("ANSWER_SERVICE_QUEUE_TIMEOUT", "30"))
+MAX_BODY_BYTES = 1 << 20
+# /v1/search 的 top_k 上限：超出的按上限处理
+SERVICE_MAX_TOP_K = int(os.getenv("ANSWER_SERVICE_MAX_TOP_K", "20"))
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# =========================
+# 1) 请求处理
+# =========================
+class AnswerServiceHandler(BaseHTTPRequestHandler):
+    """
+    - GET  /healthz：进程存活即 200
+    - GET  /readyz：模型、向量库与 LLM 客户端全部加载后 200，否则 503（并在后台触发预热）；
+      返回各组件加载耗时，未加载的为 null
+    - GET  /v1/status：组件加载耗时、内存、会话存储、检索 / 首字统计与 worker 占用
+    - GET  /v1/trace?user_id=...：该会话最近一次问答的分阶段 trace
+    - POST /v1/answer：{"query", "user_id"?, "use_llm_enhance"?, "filters"?} -> {"answer", "evidence"}
+    - POST /v1/answer/stream：同上，SSE 逐条输出 evidence / delta / replace / done 事件
+    - POST /v1/search：{"query", "user_id"?, "top_k"?, "filters"?} -> {"knowledge", "evidence"}，只检索不生成
+    - POST /v1/history/clear：{"user_id"} 清空该会话记忆
+    """
+
+    server: "AnswerServiceServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"message": message}})
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise RequestError(400, "invalid json") from None
+        if not isinstance(body, dict):
+            raise RequestError(400, "request body must be a json object")
+        return body
+
+    @staticmethod
+    def _query(body: dict) -> str:
+        query = str(body.get("query") or body.get("question") or "").strip()
+        if not query:
+            raise RequestError(400, "missing query")
+        return query
+
+    @staticmethod
+    def _filters(body: dict) -> Optional[dict]:
+        filters = body.get("filters")
+        if filters is None:
+            return None
+        if not isinstance(filters, dict) or not all(
+            isinstance(k, str) and (isinstance(v, str) or (isinstance(v, list) and all(isinstance(x, str) for x in v)))
+            for k, v in filters.items()
+        ):
+            raise RequestError(400, "filters must be an object of string -> string or list of strings")
+        return filters
+
+    @staticmethod
+    def _top_k(body: dict) -> int:
+        top_k = body.get("top_k")
+        if top_k is None:
+            return 5
+        if isinstance(top_k, bool) or not isinstance(top_k, (int, str)):
+            raise RequestError(400, "top_k must be an integer")
+        try:
+            top_k = int(top_k)
+        except ValueError:
+            raise RequestError(400, "top_k must be an integer") from None
+        return max(1, min(top_k, SERVICE_MAX_TOP_K))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        backend = self.server.backend
+        try:
+            if path == "/healthz":
+                self._send_json(200, {"status": "ok", "uptime": round(time.time() - self.server.started, 1)})
+            elif path == "/readyz":
+                readiness = backend.readiness()
+                if not readiness["ready"]:
+                    # 向量库热更新后组件被卸载时，由就绪检查重新拉起预热
+                    backend.warmup()
+                self._send_json(200 if readiness["ready"] else 503, {**readiness, "workers": self.server.worker_stats()})
+            elif path == "/v1/status":
+                self._send_json(200, {**backend.status(), "workers": self.server.worker_stats()})
+            elif path == "/v1/trace":
+                user_id = parse_qs(url.query).get("user_id", ["default"])[0]
+                self._send_json(200, {"trace": backend.last_trace(user_id)})
+            else:
+                self._send_error(404, f"unknown path {self.path}")
+        except Exception as e:
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        routes = {
+            "/v1/answer": self._answer,
+            "/v1/answer/stream": self._answer_stream,
+            "/v1/search": self._search,
+            "/v1/history/clear": self._clear_history,
+        }
+        handler = routes.get(path)
+        if handler is None:
+            self._send_error(404, f"unknown path {self.path}")
+            return
+        try:
+            body = self._read_json()
+            if path == "/v1/history/clear":
+                handler(body)
+                return
+            # 问答与检索占用 worker；健康检查等轻量接口不受限
+            if not self.server.acquire_worker():
+                raise RequestError(503, "all workers busy, retry later")
+            try:
+                handler(body)
+            finally:
+                self.server.release_worker()
+        except RequestError as e:
+            self._send_error(e.status, str(e))
+        except Exception as e:
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    def _answer(self, body: dict) -> None:
+        answer, evidence = self.server.backend.get_hebei_answer(
+            self._query(body),
+            str(body.get("user_id") or "default"),
+            use_llm_enhance=bool(body.get("use_llm_enhance")),
+            return_evidence=True,
+            filters=self._filters(body),
+        )
+        self._send_json(200, {"answer": answer, "evidence": evidence})
+
+    def _answer_stream(self, body: dict) -> None:
+        events = self.server.backend.get_hebei_answer(
+            self._query(body),
+            str(body.get("user_id") or "default"),
+            use_llm_enhance=bool(body.get("use_llm_enhance")),
+            filters=self._filters(body),
+            stream=True,
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for event in events:
+                self._send_event(event)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开：停止生成，释放 worker
+            pass
+        except Exception as e:
+            # 响应头已发出，错误以事件形式告知客户端
+            self._send_event({"type": "error", "message": f"{type(e).__name__}: {e}"})
+        finally:
+            events.close()
+
+    def _send_event(self, payload: dict) -> None:
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _search(self, body: dict) -> None:
+        knowledge, evidence = self.server.backend.search(
+            self._query(body),
+            str(body.get("user_id") or "default"),
+            top_k=self._top_k(body),
+            filters=self._filters(body),
+        )
+        self._send_json(200, {"knowledge": knowledge, "evidence": evidence})
+
+    def _clear_history(self, body: dict) -> None:
+        user_id = str(body.get("user_id") or "").strip()
+        if not user_id:
+            raise RequestError(400, "missing user_id")
+        self.server.backend.clear_history(user_id)
+        self._send_json(200, {"cleared": user_id})
+
+
+# =========================
+# 2) 服务
+# =========================
+class AnswerServiceServer(ThreadingHTTPServer):
+    """
+    独立的推理服务：模型、向量库与会话记忆只在本进程加载一份，UI / CLI 通过 HTTP 调用
+    - workers：同时执行的问答 / 检索请求数（共用同一个引擎，超出的请求最多排队 queue_timeout 秒）
+    - 启动即在后台预热，/readyz 在全部组件加载完成前返回 503
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = (SERVICE_HOST, SERVICE_PORT),
+        workers: int = SERVICE_WORKERS,
+        queue_timeout: float = SERVICE_QUEUE_TIMEOUT,
+        backend: Optional[LocalAnswerBackend] = None,
+    ):
+        super().__init__(address, AnswerServiceHandler)
+        self.backend = backend or LocalAnswerBackend()
+        self.workers = max(1, workers)
+        self.queue_timeout = queue_timeout
+        self.started = time.time()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def acquire_worker(self) -> bool:
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            return False
+        with self._lock:
+            self._busy += 1
+        return True
+
+    def release_worker(self) -> None:
+        with self._lock:
+            self._busy -= 1
+        self._slots.release()
+
+    def worker_stats(self) -> dict:
+        with self._lock:
+            return {"size": self.workers, "busy": self._busy}
+
+    def start(self) -> "AnswerServiceServer":
+        self.backend.warmup()
+        self._thread = threading.Thread(target=self.serve_forever, name="answer-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="河北旅游智能体推理服务（HTTP）")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="同时执行的问答 / 检索请求数")
+    parser.add_argument("--faiss-dir", default=None, help="向量库目录（默认 FAISS_DIR）")
+    args = parser.parse_args()
+
+    if args.faiss_dir:
+        from hebei_agent_faiss_main import configure_engine
+
+        configure_engine(faiss_dir=args.faiss_dir)
+
+    server = AnswerServiceServer((args.host, args.port), workers=args.workers)
+    server.backend.warmup()
+    print(f"🚀 推理服务已启动：{server.base_url}（workers={server.workers}，就绪检查 {server.base_url}/readyz）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import tracing
+from hebei_agent_faiss_main import (
+    clear_history,
+    generate_answer,
+    get_engine,
+    prepare_answer,
+    retrieve_batch,
+)
+
+# =========================
+# 0) 配置
+# =========================
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_RPS = float(os.getenv("BATCH_RPS", "2"))
+
+
+# =========================
+# 1) 输入 / 断点续跑
+# =========================
+def read_questions(path: str) -> List[dict]:
+    """
+    每行一个 JSON：{"id": "...", "question": "...", "user_id"?, "filters"?, "use_llm_enhance"?}
+    - 缺少 id 时使用行号
+    - question 也可写作 query
+    """
+    records: List[dict] = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                print(f"[跳过] 第 {lineno} 行不是合法 JSON：{e}")
+                continue
+            question = rec.get("question") or rec.get("query")
+            if not question:
+                print(f"[跳过] 第 {lineno} 行缺少 question")
+                continue
+            rec["id"] = str(rec.get("id", lineno))
+            rec["question"] = question
+            records.append(rec)
+    return records
+
+
+def load_done_ids(path: str) -> Set[str]:
+    """
+    已成功写出的 id；出错的记录不算完成，续跑时会重试
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # 上次中断时可能留下半行
+                continue
+            if "error" not in rec:
+                done.add(str(rec.get("id")))
+    return done
+
+
+# =========================
+# 2) 限速
+# =========================
+class RateLimiter:
+    """
+    按固定间隔放行的请求速率限制（每秒最多 rps 次 LLM 调用）；rps <= 0 表示不限速
+    """
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# =========================
+# 3) 批量问答
+# =========================
+async def run_batch(
+    records: List[dict],
+    output_path: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    rps: float = BATCH_RPS,
+    use_llm_enhance: bool = False,
+    top_k: int = 5,
+) -> dict:
+    """
+    - 全部问题一次批量检索（一次 embedding 调用 + 一次多查询 FAISS 检索）
+    - LLM 调用由 concurrency 个并发位 + rps 限速控制
+    - 每条结果完成即追加写入 output_path 并 flush，中断后可续跑
+    """
+    eng = get_engine()
+    start = time.perf_counter()
+
+    retrieved = await eng.in_executor(
+        retrieve_batch,
+        [rec["question"] for rec in records],
+        top_k,
+        [rec.get("filters") for rec in records],
+        return_paths=True,
+    )
+    retrieve_seconds = time.perf_counter() - start
+    print(f"📚 批量检索完成：{len(records)} 条，耗时 {retrieve_seconds:.2f}s")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rps)
+    write_lock = asyncio.Lock()
+    counts: Dict[str, int] = {"ok": 0, "cached": 0, "error": 0}
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def write(result: dict) -> None:
+            async with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+
+        async def answer_one(rec: dict, hits) -> None:
+            t0 = time.perf_counter()
+            enhance = bool(rec.get("use_llm_enhance", use_llm_enhance))
+            user_id = rec.get("user_id") or f"batch-{rec['id']}"
+            result = {"id": rec["id"], "question": rec["question"]}
+            async with semaphore:
+                with tracing.trace("batch_answer", id=rec["id"]) as t:
+                    try:
+                        ctx = await prepare_answer(
+                            rec["question"], user_id, enhance, rec.get("filters"), retrieved=hits
+                        )
+                        if ctx.early_answer is not None:
+                            answer = ctx.early_answer
+                        else:
+                            await limiter.acquire()
+                            answer = await generate_answer(ctx, enhance)
+                        result.update({
+                            "answer": answer,
+                            "evidence": ctx.evidence,
+                            "mode": ctx.mode,
+                            "cached": ctx.cached,
+                            "route": ctx.route,
+                        })
+                        if ctx.packing is not None:
+                            result["context_tokens"] = ctx.packing.stats()
+                        counts["cached" if ctx.cached else "ok"] += 1
+                    except Exception as e:
+                        result["error"] = f"{type(e).__name__}: {e}"
+                        counts["error"] += 1
+                    finally:
+                        if not rec.get("user_id"):
+                            clear_history(user_id)
+            result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            result["stages_ms"] = t.breakdown()
+            await write(result)
+
+            finished = sum(counts.values())
+            if finished % 10 == 0 or finished == len(records):
+                print(f"  进度 {finished}/{len(records)}（失败 {counts['error']}）")
+
+        await asyncio.gather(*(answer_one(rec, hits) for rec, hits in zip(records, retrieved)))
+
+    return {
+        "total": len(records),
+        "answered": counts["ok"],
+        "cached": counts["cached"],
+        "errors": counts["error"],
+        "retrieve_seconds": round(retrieve_seconds, 3),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def answer_file(
+    input_path: str,
+    output_path: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    rps: float = BATCH_RPS,
+    use_llm_enhance: bool = False,
+    top_k: int = 5,
+) -> dict:
+    records = read_questions(input_path)
+    done = load_done_ids(output_path)
+    pending = [rec for rec in records if rec["id"] not in done]
+    print(f"📥 共 {len(records)} 个问题，已完成 {len(records) - len(pending)}，本次处理 {len(pending)}")
+    if not pending:
+        return {"total": 0, "answered": 0, "cached": 0, "errors": 0}
+
+    get_engine().maybe_reload_index()
+    return get_engine().run(
+        run_batch(pending, output_path, concurrency, rps, use_llm_enhance, top_k)
+    )
+
+
+# =========================
+# 4) CLI
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 JSONL 批量生成回答（可断点续跑）")
+    parser.add_argument("input", help="问题文件（JSONL）")
+    parser.add_argument("output", help="结果文件（JSONL，追加写入）")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="同时进行的 LLM 调用数")
+    parser.add_argument("--rps", type=float, default=BATCH_RPS, help="每秒最多发起的 LLM 调用数，0 为不限速")
+    parser.add_argument("--enhance", action="store_true", help="默认启用 UniAPI 润色（单条记录可用 use_llm_enhance 覆盖）")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    summary = answer_file(args.input, args.output, args.concurrency, args.rps, args.enhance, args.top_k)
+    print(f"✅ 完成：{json.dumps(summary, ensure_ascii=False)}")
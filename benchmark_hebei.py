@@ -0,0 +1,358 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+# =========================
+# 0) 配置
+# =========================
+DEFAULT_FACTORS = (1, 10, 100)
+
+BENCH_QUERIES = [
+    "清东陵门票多少钱",
+    "承德避暑山庄怎么去",
+    "推荐一个石家庄两日游行程",
+    "秦皇岛有什么适合带孩子玩的地方",
+    "正定古城有哪些必吃美食",
+    "去白洋淀要注意哪些坑",
+    "山海关和老龙头怎么安排一天",
+    "张家口冬天滑雪去哪里",
+]
+
+_NAME_LINE = re.compile(r"^(【名称】)(.*)$")
+
+
+# =========================
+# 1) 语料放大 / 统计工具
+# =========================
+def enlarge_corpus(src: str, factor: int, out_path: str) -> str:
+    """
+    把知识库复制 factor 份；第 i 份的名称加“（副本i）”，保证每条文本与条目 key 都不同。
+    """
+    with open(src, "r", encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+
+    with open(out_path, "w", encoding="utf-8") as out:
+        for i in range(factor):
+            for line in lines:
+                m = _NAME_LINE.match(line)
+                if m and i:
+                    line = f"{m.group(1)}{m.group(2)}（副本{i}）"
+                out.write(line + "\n")
+            out.write("\n")
+    return out_path
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """
+    最近秩法分位数
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q * len(ordered) / 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples_ms: Sequence[float]) -> dict:
+    return {
+        "n": len(samples_ms),
+        "mean": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        "p50": round(percentile(samples_ms, 50), 3),
+        "p95": round(percentile(samples_ms, 95), 3),
+        "p99": round(percentile(samples_ms, 99), 3),
+    }
+
+
+def time_calls(fn: Callable[[int], object], iterations: int, warmup: int = 2) -> dict:
+    for i in range(warmup):
+        fn(i)
+    samples: List[float] = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def rss_mb() -> float:
+    """
+    当前进程常驻内存（MB）；读不到 /proc 时退化为峰值 RSS
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+# =========================
+# 2) 单个语料规模的压测
+# =========================
+def bench_corpus(
+    txt_path: str,
+    factor: int,
+    work_dir: str,
+    llm_url: str,
+    iterations: int,
+    answer_iterations: int,
+    enhance: bool,
+    mmap: bool = False,
+) -> dict:
+    import build_faiss_hebei as builder
+    import hebei_agent_faiss_main as agent
+    import tracing
+    from memory_report import process_memory
+
+    result: Dict[str, object] = {"factor": factor}
+    if factor > 1:
+        txt_path = enlarge_corpus(txt_path, factor, os.path.join(work_dir, f"corpus_x{factor}.txt"))
+    out_dir = os.path.join(work_dir, f"faiss_x{factor}")
+
+    # --- 解析 ---
+    start = time.perf_counter()
+    with quiet():
+        docs = builder.build_documents_from_txt(txt_path)
+    result["entries"] = len(docs)
+    result["parse_seconds"] = round(time.perf_counter() - start, 3)
+
+    # --- 构建（全量） ---
+    start = time.perf_counter()
+    with quiet():
+        builder.build_faiss(txt_path, out_dir, full=True)
+    build_seconds = time.perf_counter() - start
+    result["build_seconds"] = round(build_seconds, 3)
+    result["build_entries_per_sec"] = round(len(docs) / build_seconds, 1) if build_seconds > 0 else 0.0
+    result["index_bytes"] = dir_size(out_dir)
+
+    # --- 加载 ---
+    eng = agent.configure_engine(
+        faiss_dir=out_dir,
+        deepseek_api_key="bench",
+        deepseek_base_url=llm_url,
+        uniapi_key="bench" if enhance else None,
+        uniapi_base=llm_url if enhance else None,
+        mmap=mmap,
+    )
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    eng.warmup()
+    result["load_seconds"] = round(time.perf_counter() - start, 3)
+    result["rss_mb"] = rss_mb()
+    result["rss_delta_mb"] = round(result["rss_mb"] - rss_before, 1)
+    result["memory"] = process_memory()
+
+    # --- 分阶段耗时 ---
+    queries = BENCH_QUERIES
+    pick = lambda i: queries[i % len(queries)]
+    vectors = eng.embeddings.embed_documents(queries)
+
+    tracing.metrics.reset()
+    latency: Dict[str, dict] = {}
+    with quiet():
+        # 每次用不同文本，避免命中 embedding 缓存
+        latency["embed_query"] = time_calls(
+            lambda i: eng.embeddings.embed_query(f"{pick(i)} #{i}"), iterations
+        )
+        latency["faiss_search"] = time_calls(
+            lambda i: agent.filtered_search(vectors[i % len(vectors)], 5, agent.DEFAULT_FILTERS),
+            iterations,
+        )
+        knowledge = [agent.retrieve_relevant_knowledge(q, "bench") for q in queries]
+        latency["prompt_build"] = time_calls(
+            lambda i: agent.build_generation_prompt(
+                agent.pack_context(knowledge[i % len(queries)]).text, pick(i)
+            ),
+            iterations,
+        )
+        packs = [agent.pack_context(k) for k in knowledge]
+        result["context_tokens"] = {
+            key: round(sum(getattr(p, key) for p in packs) / len(packs), 1)
+            for key in ("raw_tokens", "packed_tokens", "saved_tokens")
+        }
+        latency["retrieve"] = time_calls(
+            lambda i: agent.retrieve_relevant_knowledge(pick(i), f"bench-r{i}"), iterations
+        )
+
+        def answer(i: int, use_llm_enhance: bool) -> None:
+            user_id = f"bench-a{i}"
+            agent.get_hebei_answer(pick(i), user_id, use_llm_enhance=use_llm_enhance)
+            agent.clear_history(user_id)
+
+        latency["answer"] = time_calls(lambda i: answer(i, False), answer_iterations, warmup=1)
+        if enhance:
+            latency["answer_enhanced"] = time_calls(lambda i: answer(i, True), answer_iterations, warmup=1)
+
+    result["latency_ms"] = latency
+    # 各阶段内部耗时（encode / faiss_search / deepseek 等）来自 tracing 指标
+    result["stage_metrics"] = tracing.metrics.snapshot()
+    result["retrieval_paths"] = eng.retrieval_stats()
+    result["rss_mb_after_queries"] = rss_mb()
+    return result
+
+
+# =========================
+# 3) 整体流程 / 结果对比
+# =========================
+def run_benchmark(
+    txt_path: str = "hebei_knowledge.txt",
+    factors: Sequence[int] = DEFAULT_FACTORS,
+    iterations: int = 200,
+    answer_iterations: int = 30,
+    llm_latency: float = 0.2,
+    llm_token_latency: float = 0.01,
+    enhance: bool = False,
+    work_dir: Optional[str] = None,
+    mmap: bool = False,
+) -> dict:
+    from llm_stub import LLMStubServer
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="hebei_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    stub = LLMStubServer(latency=llm_latency, token_latency=llm_token_latency).start()
+    started = time.time()
+    try:
+        corpora = []
+        for factor in factors:
+            print(f"▶ 语料 x{factor} ...")
+            corpora.append(bench_corpus(
+                txt_path, factor, work_dir, stub.base_url, iterations, answer_iterations, enhance, mmap
+            ))
+            lat = corpora[-1]["latency_ms"]
+            print(
+                f"  条目 {corpora[-1]['entries']}，构建 {corpora[-1]['build_seconds']}s，"
+                f"retrieve p95 {lat['retrieve']['p95']}ms，answer p95 {lat['answer']['p95']}ms"
+            )
+    finally:
+        stub.stop()
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    import build_faiss_hebei as builder
+    return {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "seconds": round(time.time() - started, 1),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embed_model": builder.MODEL_NAME,
+            "embed_engine": os.getenv("EMBED_ENGINE", "torch"),
+            "iterations": iterations,
+            "answer_iterations": answer_iterations,
+            "llm_latency": llm_latency,
+            "llm_token_latency": llm_token_latency,
+            "enhance": enhance,
+            "mmap": mmap,
+            "embed_cache": float(os.getenv("EMBED_CACHE_MAX_MB", "256")) > 0,
+        },
+        "corpora": corpora,
+    }
+
+
+def compare_results(baseline: dict, current: dict) -> List[str]:
+    """
+    与历史结果对比：同一语料规模下各阶段 p50 / p95 的变化百分比
+    """
+    lines: List[str] = []
+    old_by_factor = {c["factor"]: c for c in baseline.get("corpora", [])}
+    for corpus in current.get("corpora", []):
+        old = old_by_factor.get(corpus["factor"])
+        if old is None:
+            continue
+        for stage, stats in corpus["latency_ms"].items():
+            old_stats = old.get("latency_ms", {}).get(stage)
+            if not old_stats:
+                continue
+            parts = []
+            for q in ("p50", "p95"):
+                if old_stats[q]:
+                    change = (stats[q] - old_stats[q]) / old_stats[q]
+                    parts.append(f"{q} {old_stats[q]} -> {stats[q]}ms（{change:+.1%}）")
+            lines.append(f"x{corpus['factor']} {stage}: " + "，".join(parts))
+        if old.get("build_seconds"):
+            change = (corpus["build_seconds"] - old["build_seconds"]) / old["build_seconds"]
+            lines.append(f"x{corpus['factor']} build: {old['build_seconds']} -> {corpus['build_seconds']}s（{change:+.1%}）")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线分阶段压测（本地 LLM 桩服务 + 放大语料）")
+    parser.add_argument("--txt", default="hebei_knowledge.txt", help="基础知识库")
+    parser.add_argument("--factors", type=int, nargs="+", default=list(DEFAULT_FACTORS), help="语料放大倍数")
+    parser.add_argument("--iterations", type=int, default=200, help="检索类阶段每项调用次数")
+    parser.add_argument("--answer-iterations", type=int, default=30, help="get_hebei_answer 调用次数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="桩服务首字延迟（秒）")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="桩服务流式分段间隔（秒）")
+    parser.add_argument("--enhance", action="store_true", help="同时压测 UniAPI 润色链路")
+    parser.add_argument("--mmap", action="store_true", help="以只读 mmap 方式加载索引")
+    parser.add_argument("--engine", default=None, help="embedding 推理引擎：torch / onnx-int8（默认读取 EMBED_ENGINE）")
+    parser.add_argument("--embed-cache", action="store_true", help="保留 embedding 缓存（默认关闭以测量模型本身）")
+    parser.add_argument("--work-dir", default=None, help="放大语料与索引的目录（默认临时目录，结束后删除）")
+    parser.add_argument("--out", default="bench_results.json", help="结果 JSON 路径")
+    parser.add_argument("--compare", default=None, help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    # 模块级配置在导入时读取环境变量，必须在导入智能体模块之前设置
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ["ANSWER_CACHE_PATH"] = ""
+    if not args.embed_cache:
+        os.environ["EMBED_CACHE_MAX_MB"] = "0"
+    if args.engine:
+        os.environ["EMBED_ENGINE"] = args.engine
+
+    results = run_benchmark(
+        txt_path=args.txt,
+        factors=args.factors,
+        iterations=args.iterations,
+        answer_iterations=args.answer_iterations,
+        llm_latency=args.llm_latency,
+        llm_token_latency=args.llm_token_latency,
+        enhance=args.enhance,
+        work_dir=args.work_dir,
+        mmap=args.mmap,
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已写入 {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n与基线对比：")
+        for line in compare_results(baseline, results):
+            print("  " + line)
@@ -1,66 +1,69 @@
 from __future__ import annotations
+import argparse
+import hashlib
+import itertools
+import json
 import os
+import random
 import re
-from typing import List
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Union
 from langchain_core.documents import Document
-from langchain_core.embeddings import Embeddings
-from langchain_community.vectorstores import FAISS
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import ann_index
+from compact_docstore import CompactDocstore
+from embedding_backend import EMBED_ENGINE, ENGINES, MODEL_NAME, LocalEmbeddings
+from embedding_pipeline import format_throughput, merge_throughput
+from entity_graph import ENTITY_GRAPH_NAME, EntityGraph
+from fact_table import FACT_DB_NAME, FactTable
+from itinerary_planner import TRAVEL_GRAPH_NAME, TravelGraph
+from lexical_index import LEXICAL_INDEX_NAME, LexicalIndex
+from metadata_index import META_INDEX_NAME, MetadataIndex
 
 
 # =========================
 # 0) Embedding
 # =========================
-class LocalEmbeddings(Embeddings):
-    def __init__(self):
-        self.model = SentenceTransformer(
-            "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-            local_files_only=True
-        )
-
-    def embed_documents(self, texts):
-        return self.model.encode(texts, show_progress_bar=False).tolist()
-
-    def embed_query(self, text):
-        return self.model.encode([text], show_progress_bar=False)[0].tolist()
+# LocalEmbeddings 与在线服务共用（embedding_backend.py），引擎由 --engine / EMBED_ENGINE 选择
 
 # =========================
-# 1) 从 hebei_knowledge.txt 解析为条目
+# 1) 从 hebei_knowledge.txt 解析为条目（单遍流式）
 # =========================
-def load_entries_structured(path: str) -> List[str]:
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"未找到知识库文件：{path}")
-
-    raw = open(path, "r", encoding="utf-8").read().strip()
-    if not raw:
-        return []
-
-    # 以 --- 作为“组分隔”
-    groups = [g.strip() for g in raw.split("---") if g.strip()]
-
-    entries: List[str] = []
-    for g in groups:
-        parts = re.split(r"(?=【类型】)", g)
-        for p in parts:
-            p = p.strip()
-            if not p:
-                continue
-            if not p.startswith("【类型】"):
-                continue
-            entries.append(p)
+RECORD_FIELDS = ("类型", "城市", "名称", "内容")
+FIELD_LINE = re.compile(r"^【(类型|城市|名称|内容)】(.*)$")
+GROUP_SEPARATOR = "---"
 
-    return entries
+
+class ParseIssue(NamedTuple):
+    path: str
+    line: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path}:{self.line} {self.message}"
 
 
-def block_to_document(block: str, idx: int) -> Document:
-    def extract(field: str) -> str:
-        m = re.search(rf"【{field}】([^\n]+)", block)
-        return m.group(1).strip() if m else ""
+def iter_knowledge_files(paths: Union[str, Sequence[str]]) -> Iterator[str]:
+    """
+    支持单个文件、多个文件或目录（目录下按文件名顺序读取全部 .txt）
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".txt"):
+                    yield os.path.join(path, name)
+        elif os.path.exists(path):
+            yield path
+        else:
+            raise FileNotFoundError(f"未找到知识库文件：{path}")
 
-    entry_type = extract("类型")
-    city = extract("城市")
-    name = extract("名称")
-    content = extract("内容")
+
+def _record_to_document(fields: Dict[str, str], idx: int) -> Document:
+    entry_type = fields.get("类型", "")
+    city = fields.get("城市", "")
+    name = fields.get("名称", "")
+    content = fields.get("内容", "")
 
     page_content = (
         f"【类型】{entry_type}\n"
@@ -83,37 +86,536 @@ def block_to_document(block: str, idx: int) -> Document:
     )
 
 
-def build_documents_from_txt(path: str) -> List[Document]:
-    entries = load_entries_structured(path)
-    docs: List[Document] = []
-    for i, e in enumerate(entries):
-        docs.append(block_to_document(e, i))
+def iter_documents(
+    paths: Union[str, Sequence[str]],
+    issues: Optional[List[ParseIssue]] = None,
+) -> Iterator[Document]:
+    """
+    逐行扫描知识库，遇到【类型】开始新条目，遇到 --- 或下一个【类型】结束当前条目。
+    条目一结束就立即产出 Document，不把整个文件读进内存。
+    格式问题（缺字段 / 重复字段 / 无法识别的行）带行号记录到 issues。
+    """
+    idx = 0
+    for path in iter_knowledge_files(paths):
+        fields: Optional[Dict[str, str]] = None
+        start_line = 0
+
+        def flush() -> Optional[Document]:
+            nonlocal fields, idx
+            if fields is None:
+                return None
+            missing = [f for f in RECORD_FIELDS if f not in fields]
+            if missing and issues is not None:
+                issues.append(ParseIssue(path, start_line, f"条目缺少字段：{'、'.join(missing)}"))
+            doc = _record_to_document(fields, idx)
+            idx += 1
+            fields = None
+            return doc
+
+        with open(path, "r", encoding="utf-8-sig") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+
+                if line == GROUP_SEPARATOR:
+                    doc = flush()
+                    if doc is not None:
+                        yield doc
+                    continue
+
+                m = FIELD_LINE.match(line)
+                if m is None:
+                    if issues is not None:
+                        issues.append(ParseIssue(path, lineno, f"无法识别的行，已忽略：{line[:30]}"))
+                    continue
+
+                field, value = m.group(1), m.group(2).strip()
+                if field == "类型":
+                    doc = flush()
+                    if doc is not None:
+                        yield doc
+                    fields = {}
+                    start_line = lineno
+                elif fields is None:
+                    if issues is not None:
+                        issues.append(ParseIssue(path, lineno, f"【{field}】出现在【类型】之前，已忽略"))
+                    continue
+
+                if field in fields:
+                    if issues is not None:
+                        issues.append(ParseIssue(path, lineno, f"重复字段【{field}】，保留第一次出现的值"))
+                    continue
+                fields[field] = value
+
+        doc = flush()
+        if doc is not None:
+            yield doc
+
+
+def report_issues(issues: List[ParseIssue]) -> None:
+    if issues:
+        print(f"知识库格式告警 {len(issues)} 处：")
+        for issue in issues[:20]:
+            print(f"  {issue}")
+        if len(issues) > 20:
+            print(f"  ……其余 {len(issues) - 20} 处省略")
+
+
+def build_documents_from_txt(paths: Union[str, Sequence[str]]) -> List[Document]:
+    """
+    一次性读出全部条目（构建期辅助索引、测试与压测使用）；向量化阶段走 iter_document_chunks，不经过这里
+    """
+    issues: List[ParseIssue] = []
+    docs = list(iter_documents(paths, issues))
+    report_issues(issues)
     return docs
 
 
+def iter_document_chunks(paths: Union[str, Sequence[str]], chunk_size: int) -> Iterator[List[Document]]:
+    """
+    每次从流式解析器取出 chunk_size 条，向量化阶段同一时刻只持有一块 Document
+    """
+    docs = iter_documents(paths)
+    while True:
+        chunk = list(itertools.islice(docs, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# =========================
+# 2) 增量构建清单（manifest）
+# =========================
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# 向量化阶段每次从解析器取出的条目数
+ENCODE_CHUNK = int(os.getenv("BUILD_ENCODE_CHUNK", "1024"))
+
+
+def entry_hash(doc: Document) -> str:
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def scan_entries(docs: Iterable[Document]) -> List[dict]:
+    """
+    manifest 条目（key / hash / title），按 FAISS 行号顺序；只保留这三个短字段，不保留 Document。
+    条目的稳定 key = 内容哈希 + 同内容出现序号（知识库里存在完全重复的条目），
+    用于增量构建时定位旧向量。
+    """
+    seen: Dict[str, int] = {}
+    entries: List[dict] = []
+    for doc in docs:
+        h = entry_hash(doc)
+        n = seen.get(h[:16], 0)
+        seen[h[:16]] = n + 1
+        entries.append({"key": f"{h[:16]}-{n}", "hash": h, "title": doc.metadata.get("title", "")})
+    return entries
+
+
+def assign_entry_keys(docs: List[Document]) -> List[str]:
+    return [e["key"] for e in scan_entries(docs)]
+
+
+def load_manifest(out_dir: str) -> Optional[dict]:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def manifest_index_config(manifest: Optional[dict]) -> dict:
+    """
+    manifest 中的索引配置；旧 manifest 没有该字段，即 LangChain 默认的 Flat 精确索引
+    """
+    return (manifest or {}).get("index") or {"type": "flat", "params": {}}
+
+
+def save_manifest(out_dir: str, entries: List[dict], index_config: dict, engine: str) -> None:
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "model": MODEL_NAME,
+        "engine": engine,
+        "index": index_config,
+        "entries": entries,
+    }
+    tmp_path = os.path.join(out_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+
+
+def _index_files_exist(out_dir: str) -> bool:
+    """
+    在线加载需要的全部产物都在：FAISS 索引、列式 docstore 与各辅助索引（向量文件缺失时可从索引还原，不算在内）
+    """
+    names = ("index.faiss", META_INDEX_NAME, LEXICAL_INDEX_NAME, ENTITY_GRAPH_NAME, FACT_DB_NAME, TRAVEL_GRAPH_NAME)
+    return CompactDocstore.exists(out_dir) and all(os.path.exists(os.path.join(out_dir, name)) for name in names)
+
+
 # =========================
-# 2) 构建并保存 FAISS
+# 3) 构建并保存 FAISS
 # =========================
+def save_index_artifacts(out_dir: str, docs: List[Document]) -> None:
+    """
+    与 FAISS 行号一一对应的构建期辅助索引（每次构建都重新生成，开销很小）
+    - docstore.*：列式 docstore（连续文本 + 偏移数组 + 整数编码列），替代 index.pkl
+    - meta_index.json：type / city 倒排表，用于检索时的元数据过滤
+    - lexical_index.json：名称 + 内容的字符 bigram 倒排表，用于词法直达与混合检索
+    - entity_graph.json：按名称前缀归并的景点 -> 子条目图，用于检索结果按景点展开 / 折叠
+    - facts.sqlite：门票 / 开放时间 / 交通费用 / 观光车的结构化事实表，用于纯事实问题直答
+    - travel_graph.json：城市间交通图 + 景点游览时长 / 门票 / 人群适配，用于本地规划多日行程
+    """
+    CompactDocstore.save(out_dir, docs)
+    MetadataIndex.from_metadatas(d.metadata for d in docs).save(out_dir)
+    LexicalIndex.from_documents(docs).save(out_dir)
+    graph = EntityGraph.from_metadatas(d.metadata for d in docs)
+    graph.save(out_dir)
+    facts = FactTable.from_documents(docs, graph)
+    facts.save(out_dir)
+    TravelGraph.from_documents(docs, graph, facts).save(out_dir)
+
+    # 旧版本留下的 pickle docstore 已被列式 docstore 取代
+    legacy_pkl = os.path.join(out_dir, "index.pkl")
+    if os.path.exists(legacy_pkl):
+        os.remove(legacy_pkl)
+
+
+def save_index(index, out_dir: str) -> None:
+    """
+    只保存 FAISS 索引本身（文档内容由列式 docstore 保存，不再 pickle）。
+    先写临时文件再 os.replace：正在以 mmap 方式映射旧 index.faiss 的服务进程
+    继续读旧文件，不会因为原地截断而崩溃，下次检查到新版本时再重新加载
+    """
+    import faiss
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "index.faiss")
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def save_vectors(out_dir: str, vectors: np.ndarray, index_type: str) -> None:
+    """
+    Flat / HNSW 可以从索引还原原始向量；IVF / PQ 不行，另存一份 vectors.npy 供增量构建与切换索引类型复用
+    """
+    path = os.path.join(out_dir, ann_index.VECTORS_NAME)
+    if index_type in ("flat", "hnsw"):
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    ann_index.save_vectors(out_dir, vectors)
+
+
+def load_old_vectors(out_dir: str, count: int) -> Optional[np.ndarray]:
+    """
+    读取上次构建的全部向量（行号与 manifest 条目顺序一致）；无法还原时返回 None
+    """
+    vectors = ann_index.load_vectors(out_dir)
+    if vectors is not None and len(vectors) == count:
+        return vectors
+
+    import faiss
+
+    index = faiss.read_index(os.path.join(out_dir, "index.faiss"))
+    if index.ntotal != count:
+        return None
+    try:
+        return index.reconstruct_n(0, count)
+    except RuntimeError:
+        return None
+
+
+def encode_entries(
+    txt_path: Union[str, Sequence[str]],
+    entries: List[dict],
+    embeddings: LocalEmbeddings,
+    chunk_size: int = ENCODE_CHUNK,
+    old_vectors: Optional[np.ndarray] = None,
+    position_of: Optional[Dict[str, int]] = None,
+) -> np.ndarray:
+    """
+    按块消费流式解析器：每块里能在 position_of 中找到的条目复用 old_vectors 的行，其余交给 embeddings
+    （按长度分桶批量编码），结果直接写入预先分配的 float32 矩阵，不在内存里堆积 Python 浮点列表。
+    throughput 统计按块累加后写回 embeddings.last_stats。
+    """
+    vectors: Optional[np.ndarray] = None
+    if old_vectors is not None:
+        vectors = np.zeros((len(entries), old_vectors.shape[1]), dtype=np.float32)
+    stats: List[dict] = []
+    row = 0
+    for chunk in iter_document_chunks(txt_path, chunk_size):
+        missing: List[int] = []
+        for offset in range(len(chunk)):
+            pos = position_of.get(entries[row + offset]["key"]) if position_of else None
+            if pos is None:
+                missing.append(offset)
+            else:
+                vectors[row + offset] = old_vectors[pos]
+        if missing:
+            embeddings.last_stats = None
+            new_vectors = np.asarray(
+                embeddings.embed_documents([chunk[i].page_content for i in missing]), dtype=np.float32
+            )
+            if embeddings.last_stats:
+                stats.append(embeddings.last_stats)
+            if vectors is None:
+                vectors = np.zeros((len(entries), new_vectors.shape[1]), dtype=np.float32)
+            vectors[[row + i for i in missing]] = new_vectors
+        row += len(chunk)
+    if row != len(entries):
+        raise ValueError("知识库在构建过程中被修改，请重新运行")
+    embeddings.last_stats = merge_throughput(stats)
+    return vectors
+
+
+def _build_full(
+    txt_path: Union[str, Sequence[str]], entries: List[dict], embeddings: LocalEmbeddings, chunk_size: int
+) -> np.ndarray:
+    print("开始全量构建 FAISS（首次会慢一些）...")
+    return encode_entries(txt_path, entries, embeddings, chunk_size)
+
+
+def _build_incremental(
+    txt_path: Union[str, Sequence[str]],
+    entries: List[dict],
+    embeddings: LocalEmbeddings,
+    out_dir: str,
+    manifest: dict,
+    index_changed: bool,
+    chunk_size: int,
+) -> Optional[np.ndarray]:
+    """
+    复用旧索引中未变化条目的向量，只对新增/修改条目重新向量化。
+    按新条目顺序重建索引，已删除条目的向量自然被剔除，结果与全量构建一致。
+    只改了索引类型 / 参数时全部复用，不重新向量化。
+    无任何变化时返回 None；旧向量无法还原时抛出 ValueError，由调用方改为全量构建。
+    """
+    keys = [e["key"] for e in entries]
+    old_entries = manifest.get("entries", [])
+    old_keys = [e["key"] for e in old_entries]
+    if old_keys == keys and not index_changed:
+        print("知识库无变化，跳过构建。")
+        return None
+
+    # manifest 中条目顺序即 FAISS 行号
+    old_vectors = load_old_vectors(out_dir, len(old_keys))
+    if old_vectors is None:
+        raise ValueError("无法从旧索引还原向量")
+    position_of = {key: pos for pos, key in enumerate(old_keys)}
+
+    key_set = set(keys)
+    old_key_set = set(old_keys)
+    old_titles = {e["title"] for e in old_entries if e["key"] not in key_set}
+
+    missing = [e for e in entries if e["key"] not in position_of]
+    changed = sum(1 for e in missing if e["title"] in old_titles)
+    removed = len(old_key_set - key_set) - changed
+    print(
+        f"增量构建：复用 {len(keys) - len(missing)} 条，"
+        f"新增 {len(missing) - changed} 条，修改 {changed} 条，删除 {removed} 条"
+    )
+
+    return encode_entries(txt_path, entries, embeddings, chunk_size, old_vectors, position_of)
+
+
+# =========================
+# 4) ANN 索引召回率报告
+# =========================
+REPORT_NAME = "ann_report.json"
+
+
+def report_queries(docs: List[Document], sample: int = 200, seed: int = 0) -> List[str]:
+    """
+    评测用查询：抽样条目的“城市 + 名称 + 类型”短句，接近用户提问的长度与措辞，
+    而不是直接用条目向量查自己（那样 ANN 几乎总能命中，高估召回率）
+    """
+    picked = random.Random(seed).sample(docs, min(sample, len(docs)))
+    return [
+        f"{d.metadata.get('city', '')}{d.metadata.get('name', '')}{d.metadata.get('type', '')}怎么样"
+        for d in picked
+    ]
+
+
+def write_ann_report(
+    out_dir: str,
+    docs: List[Document],
+    vectors: np.ndarray,
+    embeddings: LocalEmbeddings,
+    kinds: Sequence[str],
+    overrides: Dict[str, dict],
+    k: int = 5,
+) -> dict:
+    queries = np.asarray(embeddings.embed_documents(report_queries(docs)), dtype=np.float32)
+    report = ann_index.ann_report(vectors, queries, kinds, k=k, overrides=overrides)
+    tmp_path = os.path.join(out_dir, REPORT_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(out_dir, REPORT_NAME))
+    print(ann_index.format_ann_report(report))
+    return report
+
+
 def build_faiss(
-    txt_path: str = "hebei_knowledge.txt",
+    txt_path: Union[str, Sequence[str]] = "hebei_knowledge.txt",
     out_dir: str = "faiss_hebei",
+    full: bool = False,
+    batch_size: int = 32,
+    workers: int = 1,
+    index_type: Optional[str] = None,
+    index_params: Optional[dict] = None,
+    report: Union[bool, Sequence[str]] = False,
+    engine: str = EMBED_ENGINE,
+    chunk_size: int = ENCODE_CHUNK,
 ) -> None:
-    docs = build_documents_from_txt(txt_path)
-    if not docs:
+    """
+    - txt_path 可以是单个文件、多个文件或目录
+    - 默认增量构建：根据 manifest 中的条目哈希，只重新向量化新增/修改的条目
+    - full=True 时强制全量重建
+    - batch_size / workers：按长度分桶的批大小、编码进程数
+    - index_type：flat（精确）/ hnsw / ivf_flat / ivf_pq，默认沿用 manifest 中的类型与参数（--full 全量重建也沿用，首次构建为 flat）；
+      index_params 覆盖默认参数，最终参数写入 manifest，检索时据此设置 ef_search / nprobe
+    - report：True 时对本次的索引类型做召回率 / 延迟报告，也可传多个类型一起对比
+    - engine：条目向量化使用的推理引擎（torch / onnx-int8），与 manifest 记录的不一致时全量重建
+    - chunk_size：向量化阶段每次从解析器取出的条目数；向量化时不持有全部 Document，
+      构建期辅助索引在向量矩阵释放之后再重新流式读取一遍知识库
+    """
+    issues: List[ParseIssue] = []
+    entries = scan_entries(iter_documents(txt_path, issues))
+    report_issues(issues)
+    if not entries:
         raise ValueError("知识库 txt 为空或解析失败，无法构建向量库。")
 
-    embeddings = LocalEmbeddings()
+    embeddings = LocalEmbeddings(engine=engine, batch_size=batch_size, workers=workers)
+
+    print(f"读取条目数：{len(entries)}")
+    print(f"使用本地 Embedding：{MODEL_NAME}（{engine}）")
 
-    print(f"读取条目数：{len(docs)}")
-    print("使用本地 SentenceTransformer Embedding")
-    print("开始构建 FAISS（首次会慢一些）...")
+    previous = load_manifest(out_dir)
+    # 索引类型与参数取自上次的 manifest：--full、模型 / 引擎变化导致的全量重建也沿用，命令行显式给出的优先
+    old_config = manifest_index_config(previous)
+    index_type = index_type or old_config["type"]
+    if old_config["type"] == index_type:
+        index_params = {**old_config["params"], **{k: v for k, v in (index_params or {}).items() if v is not None}}
+
+    manifest = None if full else previous
+    if manifest is not None and (
+        manifest.get("model") != MODEL_NAME
+        or manifest.get("engine", "torch") != engine
+        or not _index_files_exist(out_dir)
+    ):
+        print("向量库与 manifest 不匹配，改为全量构建。")
+        manifest = None
+
+    vectors = None
+    # workers > 1 时整个编码阶段共用一个进程池，各块不再重复拉起进程、加载模型
+    with embeddings.worker_pool():
+        if manifest is not None:
+            # 只比较类型与参数（未显式指定的参数已沿用 manifest，不会算作变化）
+            index_changed = old_config["type"] != index_type or any(
+                old_config["params"].get(k) != v
+                for k, v in (index_params or {}).items()
+                if v is not None and k in ann_index.PARAM_KEYS[index_type]
+            )
+            try:
+                vectors = _build_incremental(txt_path, entries, embeddings, out_dir, manifest, index_changed, chunk_size)
+            except ValueError as e:
+                print(f"{e}，改为全量构建。")
+                manifest = None
+            else:
+                if vectors is None:
+                    # 知识库与索引都没有变化：已有产物原样保留，不重写
+                    if report:
+                        docs = list(iter_documents(txt_path))
+                        kinds = [old_config["type"]] if report is True else list(report)
+                        write_ann_report(out_dir, docs, load_old_vectors(out_dir, len(docs)), embeddings, kinds,
+                                         {old_config["type"]: old_config["params"]})
+                    return
+        if manifest is None:
+            vectors = _build_full(txt_path, entries, embeddings, chunk_size)
+
+    params = ann_index.resolve_params(index_type, len(vectors), vectors.shape[1], index_params)
+    print(f"索引类型：{index_type}  参数：{json.dumps(params, ensure_ascii=False)}")
+    index = ann_index.build_ann_index(vectors, index_type, params)
 
-    vs = FAISS.from_documents(docs, embeddings)
     os.makedirs(out_dir, exist_ok=True)
-    vs.save_local(out_dir)
+    save_index(index, out_dir)
+    save_vectors(out_dir, vectors, index_type)
+    # 向量已写盘：先释放再读入全部条目生成辅助索引，两者不同时占用内存
+    del index
+    if not report:
+        del vectors
+    docs = list(iter_documents(txt_path))
+    save_index_artifacts(out_dir, docs)
+    save_manifest(out_dir, entries, {"type": index_type, "params": params}, engine)
 
+    embeddings.cache.save()
+    stats = embeddings.cache.stats()
+    print(f"Embedding 缓存：命中 {stats['hits']} 条，未命中 {stats['misses']} 条")
+    print(format_throughput(embeddings.last_stats))
     print(f"构建完成：已保存到 {out_dir}/")
 
+    if report:
+        kinds = [index_type] if report is True else list(report)
+        write_ann_report(out_dir, docs, vectors, embeddings, kinds, {index_type: params})
+
 
 if __name__ == "__main__":
-    build_faiss()
+    parser = argparse.ArgumentParser(description="构建河北旅游知识库 FAISS 向量库")
+    parser.add_argument(
+        "--txt", nargs="+", default=["hebei_knowledge.txt"],
+        help="知识库 txt 路径，可传多个文件或目录",
+    )
+    parser.add_argument("--out", default="faiss_hebei", help="向量库输出目录")
+    parser.add_argument("--full", action="store_true", help="忽略 manifest，强制全量重建")
+    parser.add_argument("--batch-size", type=int, default=32, help="向量化批大小（按文本长度分桶）")
+    parser.add_argument("--workers", type=int, default=1, help="向量化进程数，多核构建机可调大")
+    parser.add_argument("--chunk-size", type=int, default=ENCODE_CHUNK, help="向量化阶段每次读取的条目数")
+    parser.add_argument(
+        "--engine", choices=ENGINES, default=EMBED_ENGINE,
+        help="条目向量化引擎：torch（fp32）/ onnx-int8（需先运行 embedding_backend.py export）",
+    )
+    parser.add_argument(
+        "--index", choices=ann_index.INDEX_TYPES, default=None,
+        help="索引类型：flat 精确检索；hnsw / ivf_flat / ivf_pq 为近似检索，适合大规模知识库（默认沿用上次构建）",
+    )
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW 每个节点的邻居数 M")
+    parser.add_argument("--ef-construction", type=int, default=None, help="HNSW 构建期候选队列长度")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW 检索期候选队列长度（默认检索参数）")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 聚类中心数")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF 检索时访问的聚类数（默认检索参数）")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ 子量化器个数（需整除向量维度）")
+    parser.add_argument("--pq-nbits", type=int, default=None, help="PQ 每个子量化器的编码位数")
+    parser.add_argument("--report", action="store_true", help="构建后输出 recall@k / 延迟 / 大小报告")
+    parser.add_argument("--report-all", action="store_true", help="报告中同时对比全部索引类型")
+    args = parser.parse_args()
+
+    index_params = {
+        "M": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "m": args.pq_m,
+        "nbits": args.pq_nbits,
+    }
+
+    build_faiss(
+        txt_path=args.txt,
+        out_dir=args.out,
+        full=args.full,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        index_type=args.index,
+        index_params=index_params,
+        report=list(ann_index.INDEX_TYPES) if args.report_all else args.report,
+        engine=args.engine,
+        chunk_size=args.chunk_size,
+    )
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import json
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# =========================
+# 0) 文件布局
+# =========================
+DOCSTORE_HEADER = "docstore.json"        # 列字典（type / city / name 的取值表）与条目数
+DOCSTORE_TEXT = "docstore.text"          # 全部 page_content 首尾相接的 UTF-8 字节
+DOCSTORE_OFFSETS = "docstore_offsets.npy"  # int64[n + 1]，第 i 条文本为 text[offsets[i]:offsets[i + 1]]
+DOCSTORE_COLUMNS = "docstore_columns.npy"  # int32[n, 4]：type 编码、city 编码、name 编码、原始 id
+DOCSTORE_FILES = (DOCSTORE_HEADER, DOCSTORE_TEXT, DOCSTORE_OFFSETS, DOCSTORE_COLUMNS)
+
+CODED_FIELDS = ("type", "city", "name")
+FORMAT_VERSION = 1
+
+
+def _intern(values: Iterable[str]) -> "tuple[List[str], List[int]]":
+    vocab: Dict[str, int] = {}
+    codes = [vocab.setdefault(v, len(vocab)) for v in values]
+    return list(vocab), codes
+
+
+class PositionIds(Mapping):
+    """
+    FAISS 行号 -> docstore id 的恒等映射；不为每一行生成 Python 对象
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, pos: int) -> int:
+        if not 0 <= pos < self.size:
+            raise KeyError(pos)
+        return int(pos)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+# =========================
+# 1) 列式 docstore
+# =========================
+class CompactDocstore:
+    """
+    替代 pickle 的 LangChain docstore：
+    - 文本存放在一段连续的 UTF-8 缓冲区里，按偏移数组切片
+    - type / city / name 编码为整数列，取值表只存一份
+    - mmap=True 时文本与数组都以只读 mmap 打开，多进程共享页缓存
+    - 只有命中的 Top-K 条目才会解码为 Document
+    search(pos) 与 LangChain Docstore 接口一致，可直接交给 FAISS 向量库使用。
+    """
+
+    def __init__(self, out_dir: str, mmap_files: bool = True):
+        self.out_dir = out_dir
+        with open(os.path.join(out_dir, DOCSTORE_HEADER), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的 docstore 版本：{header.get('version')}，请重新构建向量库")
+        self.vocab: Dict[str, List[str]] = header["vocab"]
+        self.count = int(header["count"])
+
+        mode = "r" if mmap_files else None
+        self.offsets = np.load(os.path.join(out_dir, DOCSTORE_OFFSETS), mmap_mode=mode)
+        self.columns = np.load(os.path.join(out_dir, DOCSTORE_COLUMNS), mmap_mode=mode)
+
+        text_path = os.path.join(out_dir, DOCSTORE_TEXT)
+        with open(text_path, "rb") as f:
+            if mmap_files and os.path.getsize(text_path) > 0:
+                self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.text = f.read()
+
+    @staticmethod
+    def exists(out_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(out_dir, name)) for name in DOCSTORE_FILES)
+
+    @classmethod
+    def load(cls, out_dir: str, mmap_files: bool = True) -> Optional["CompactDocstore"]:
+        if not cls.exists(out_dir):
+            return None
+        return cls(out_dir, mmap_files)
+
+    @staticmethod
+    def save(out_dir: str, docs: Sequence) -> None:
+        """
+        按 FAISS 行号顺序写出；先写 .tmp 再原子替换，不影响正在映射旧文件的服务进程
+        """
+        vocab: Dict[str, List[str]] = {}
+        columns = np.zeros((len(docs), len(CODED_FIELDS) + 1), dtype=np.int32)
+        for j, field in enumerate(CODED_FIELDS):
+            vocab[field], codes = _intern(d.metadata.get(field, "") for d in docs)
+            columns[:, j] = codes
+        columns[:, -1] = [d.metadata.get("id", i) for i, d in enumerate(docs)]
+
+        encoded = [d.page_content.encode("utf-8") for d in docs]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+        def target(name: str) -> str:
+            return os.path.join(out_dir, name)
+
+        with open(target(DOCSTORE_TEXT) + ".tmp", "wb") as f:
+            for b in encoded:
+                f.write(b)
+        with open(target(DOCSTORE_OFFSETS) + ".tmp", "wb") as f:
+            np.save(f, offsets)
+        with open(target(DOCSTORE_COLUMNS) + ".tmp", "wb") as f:
+            np.save(f, columns)
+        with open(target(DOCSTORE_HEADER) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": len(docs), "vocab": vocab}, f, ensure_ascii=False)
+
+        # 头文件最后替换：读到新头文件时，数据文件一定已经是新的
+        for name in (DOCSTORE_TEXT, DOCSTORE_OFFSETS, DOCSTORE_COLUMNS, DOCSTORE_HEADER):
+            os.replace(target(name) + ".tmp", target(name))
+
+    # ---------- 读取 ----------
+    def __len__(self) -> int:
+        return self.count
+
+    def page_content(self, pos: int) -> str:
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def metadata(self, pos: int) -> dict:
+        codes = self.columns[pos]
+        meta = {field: self.vocab[field][int(codes[j])] for j, field in enumerate(CODED_FIELDS)}
+        meta["title"] = f"{meta['type']}-{meta['name']}".strip("-")
+        meta["id"] = int(codes[-1])
+        return meta
+
+    def document(self, pos: int):
+        from langchain_core.documents import Document
+
+        return Document(page_content=self.page_content(pos), metadata=self.metadata(pos))
+
+    def search(self, pos: int):
+        if not 0 <= int(pos) < self.count:
+            return f"ID {pos} not found."
+        return self.document(int(pos))
+
+    def documents(self, positions: Iterable[int]) -> List:
+        return [self.document(p) for p in positions]
+
+    def metadatas(self) -> Iterator[dict]:
+        for pos in range(self.count):
+            yield self.metadata(pos)
+
+    def index_to_docstore_id(self) -> PositionIds:
+        return PositionIds(self.count)
+
+    def nbytes(self) -> int:
+        return len(self.text) + self.offsets.nbytes + self.columns.nbytes
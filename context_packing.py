@@ -0,0 +1,245 @@
+from __future__ import annotations
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from entity_graph import entity_name
+
+# =========================
+# 0) 配置
+# =========================
+# 生成 prompt 中【知识库内容】部分的 token 预算（估算值）；0 表示不裁剪
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+# 关闭后退回原样拼接全部条目（便于对比）
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1").lower() in ("1", "true", "yes")
+# 剩余预算不足该值时不再截断塞入半条内容
+MIN_PARTIAL_TOKENS = 40
+
+ENTRY_FIELD = re.compile(r"^【(类型|城市|名称|内容)】(.*)$")
+SENTENCE_END = re.compile(r"(?<=[。；！？!?;])")
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+# =========================
+# 1) token 估算
+# =========================
+def count_tokens(text: str) -> int:
+    """
+    按 DeepSeek 官方给出的换算估算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token。
+    本地不加载分词器；真实用量以接口返回的 usage.prompt_tokens 为准（见 tracing 的 deepseek span）
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+# =========================
+# 2) 解析检索结果
+# =========================
+@dataclass
+class Entry:
+    rank: int
+    type: str
+    city: str
+    name: str
+    content: str
+
+    @property
+    def attraction(self) -> str:
+        # 名称形如“清东陵-门票”“避暑山庄-预约与交通”，“-”前为所属景点
+        return entity_name(self.name) or self.name
+
+    @property
+    def topic(self) -> str:
+        sub = self.name.partition("-")[2].strip()
+        if not sub or sub == self.type:
+            return self.type
+        # “观光车-观光车价格”这类子标题已包含类型，不再重复
+        return sub if self.type in sub else f"{self.type}·{sub}"
+
+
+def parse_entries(relevant_knowledge: str) -> List[Entry]:
+    """
+    retrieve_relevant_knowledge 拼接的知识内容 -> 条目列表（保持检索排名顺序）
+    """
+    entries: List[Entry] = []
+    for rank, block in enumerate(b for b in relevant_knowledge.split("\n\n") if b.strip()):
+        fields: Dict[str, str] = {}
+        for line in block.splitlines():
+            m = ENTRY_FIELD.match(line.strip())
+            if m is not None:
+                fields[m.group(1)] = m.group(2).strip()
+            elif "内容" in fields:
+                # 内容跨行时接在后面
+                fields["内容"] += line.strip()
+        if not fields:
+            fields["内容"] = block.strip()
+        entries.append(Entry(
+            rank=rank,
+            type=fields.get("类型", ""),
+            city=fields.get("城市", ""),
+            name=fields.get("名称", ""),
+            content=fields.get("内容", ""),
+        ))
+    return entries
+
+
+def _normalize(sentence: str) -> str:
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", sentence)).rstrip("。；;！!？?，,")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    """
+    不超过 limit 个 token 的最长前缀（count_tokens 随前缀长度单调不减，二分查找）
+    """
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= limit:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+# =========================
+# 3) 打包
+# =========================
+@dataclass
+class PackResult:
+    text: str
+    raw_tokens: int
+    packed_tokens: int
+    entries_in: int
+    entries_out: int
+    duplicates: int = 0
+    trimmed: int = 0
+    budget: int = 0
+    groups: List[str] = field(default_factory=list)
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.packed_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "raw_tokens": self.raw_tokens,
+            "packed_tokens": self.packed_tokens,
+            "saved_tokens": self.saved_tokens,
+            "entries_in": self.entries_in,
+            "entries_out": self.entries_out,
+            "duplicates": self.duplicates,
+            "trimmed": self.trimmed,
+            "budget": self.budget,
+        }
+
+
+def _dedupe(entries: List[Entry]) -> Tuple[List[Tuple[Entry, List[str]]], int]:
+    """
+    句子级去重：排名靠前的条目优先保留，后面条目中已出现过的句子删去，
+    全部句子都重复（完全相同或被其他条目包含）的条目整条丢弃
+    """
+    seen: set = set()
+    kept: List[Tuple[Entry, List[str]]] = []
+    duplicates = 0
+    for entry in entries:
+        sentences = []
+        for s in split_sentences(entry.content):
+            key = _normalize(s)
+            if key and key not in seen:
+                seen.add(key)
+                sentences.append(s)
+        if sentences:
+            kept.append((entry, sentences))
+        else:
+            duplicates += 1
+    return kept, duplicates
+
+
+def _render(groups: Dict[str, List[Tuple[Entry, List[str]]]], cities: Dict[str, str]) -> str:
+    blocks = []
+    for attraction, items in groups.items():
+        header = f"■ {attraction}（{cities[attraction]}）" if cities.get(attraction) else f"■ {attraction}"
+        lines = [header] + [f"- [{entry.topic}] {''.join(sentences)}" for entry, sentences in items]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def pack_context(relevant_knowledge: str, budget: Optional[int] = None) -> PackResult:
+    """
+    生成 prompt 用的知识内容：
+    - 去掉每条重复的【类型】【城市】【名称】表头，按所属景点分组（组顺序 = 组内最高排名）
+    - 句子级去重
+    - 按检索排名依次放入，超出 token 预算时在句子边界截断，其余条目丢弃；
+      预算连排名第一的条目的第一句都放不下时，按字符硬截断该条目
+    CONTEXT_PACKING=0 或没有任何条目时原样返回，只统计 token
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    raw_tokens = count_tokens(relevant_knowledge)
+    entries = parse_entries(relevant_knowledge)
+    if not CONTEXT_PACKING or not entries:
+        return PackResult(relevant_knowledge, raw_tokens, raw_tokens, len(entries), len(entries))
+    kept, duplicates = _dedupe(entries)
+
+    selected: List[Tuple[Entry, List[str]]] = []
+    used = 0
+    trimmed = 0
+    for i, (entry, sentences) in enumerate(kept):
+        # 表头与条目前缀也计入预算
+        overhead = count_tokens(f"■ {entry.attraction}（{entry.city}）\n- [{entry.topic}] ")
+        cost = overhead + count_tokens("".join(sentences))
+        if budget <= 0 or used + cost <= budget:
+            selected.append((entry, sentences))
+            used += cost
+            continue
+
+        remaining = budget - used - overhead
+        if remaining >= MIN_PARTIAL_TOKENS or not selected:
+            partial: List[str] = []
+            for s in sentences:
+                if count_tokens("".join(partial + [s])) > remaining:
+                    break
+                partial.append(s)
+            if not partial and not selected:
+                # 预算连表头都放不下时截出来是空串：不放这一条，也不计入 entries_out
+                cut = truncate_to_tokens("".join(sentences), max(0, remaining))
+                partial = [cut] if cut else []
+            if partial:
+                selected.append((entry, partial))
+                used += overhead + count_tokens("".join(partial))
+        # 被截断的这一条及其后全部条目
+        trimmed = len(kept) - i
+        break
+
+    groups: Dict[str, List[Tuple[Entry, List[str]]]] = {}
+    cities: Dict[str, str] = {}
+    for entry, sentences in selected:
+        groups.setdefault(entry.attraction, []).append((entry, sentences))
+        cities.setdefault(entry.attraction, entry.city)
+
+    if not groups and trimmed:
+        # 预算连第一条的表头都放不下：不退回未打包的原文
+        return PackResult("", raw_tokens, 0, len(entries), 0, duplicates, trimmed, budget)
+    if not groups:
+        # 全部条目都没有内容（只有表头或全部重复）时原样使用
+        return PackResult(relevant_knowledge, raw_tokens, raw_tokens, len(entries), len(entries), budget=budget)
+    text = _render(groups, cities)
+    return PackResult(
+        text=text,
+        raw_tokens=raw_tokens,
+        packed_tokens=count_tokens(text),
+        entries_in=len(entries),
+        entries_out=len(selected),
+        duplicates=duplicates,
+        trimmed=trimmed,
+        budget=budget,
+        groups=list(groups),
+    )
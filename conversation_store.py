@@ -0,0 +1,355 @@
+from __future__ import annotations
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# =========================
+# 0) 配置
+# =========================
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.sqlite3")
+# 每个会话保留的最近轮数
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "3"))
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+# 会话空闲超过该秒数即过期，0 表示不过期
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "7200"))
+CONVERSATION_MAX_MB = float(os.getenv("CONVERSATION_MAX_MB", "64"))
+
+Turn = Tuple[str, str]
+
+
+def turn_bytes(query: str, answer: str) -> int:
+    return sys.getsizeof(query) + sys.getsizeof(answer)
+
+
+# =========================
+# 1) 接口
+# =========================
+class ConversationStore(ABC):
+    """
+    按 session（user_id）保存最近几轮问答
+    - 每个会话最多 max_turns 轮
+    - 空闲超过 ttl 秒的会话过期
+    - 会话数超过 max_sessions、或总占用超过 max_mb 时按 LRU 淘汰最久未访问的会话
+    """
+
+    def __init__(
+        self,
+        max_turns: int = CONVERSATION_MAX_TURNS,
+        max_sessions: int = CONVERSATION_MAX_SESSIONS,
+        ttl: float = CONVERSATION_TTL,
+        max_mb: float = CONVERSATION_MAX_MB,
+    ):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    @abstractmethod
+    def append(self, session_id: str, query: str, answer: str) -> None:
+        ...
+
+    @abstractmethod
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Turn]:
+        ...
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    def _expired(self, touched: float, now: float) -> bool:
+        return self.ttl > 0 and now - touched > self.ttl
+
+
+# =========================
+# 2) 进程内实现
+# =========================
+class InMemoryConversationStore(ConversationStore):
+    """
+    单进程使用：OrderedDict 维护 LRU 顺序，所有操作加锁
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        # session_id -> {"turns": [...], "touched": 时间戳, "bytes": 占用}
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+
+    def _drop(self, session_id: str, reason: Optional[str] = None) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        self._bytes -= session["bytes"]
+        if reason:
+            self.evictions[reason] += 1
+
+    def _purge_locked(self, now: float) -> int:
+        if self.ttl <= 0:
+            return 0
+        expired = [sid for sid, s in self._sessions.items() if self._expired(s["touched"], now)]
+        for sid in expired:
+            self._drop(sid, "ttl")
+        return len(expired)
+
+    def append(self, session_id: str, query: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or self._expired(session["touched"], now):
+                if session is not None:
+                    self._drop(session_id, "ttl")
+                session = {"turns": [], "touched": now, "bytes": 0}
+                self._sessions[session_id] = session
+
+            session["turns"].append((query, answer))
+            added = turn_bytes(query, answer)
+            session["bytes"] += added
+            self._bytes += added
+            while len(session["turns"]) > self.max_turns:
+                q, a = session["turns"].pop(0)
+                removed = turn_bytes(q, a)
+                session["bytes"] -= removed
+                self._bytes -= removed
+            session["touched"] = now
+            self._sessions.move_to_end(session_id)
+
+            # 最久未访问的会话在最前面，过期会话也总是先于未过期会话出现
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if oldest_id == session_id:
+                    break
+                if self._expired(oldest["touched"], now):
+                    self._drop(oldest_id, "ttl")
+                elif len(self._sessions) > self.max_sessions:
+                    self._drop(oldest_id, "lru")
+                elif self._bytes > self.max_bytes:
+                    self._drop(oldest_id, "memory")
+                else:
+                    break
+
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Turn]:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            if self._expired(session["touched"], now):
+                self._drop(session_id, "ttl")
+                return []
+            session["touched"] = now
+            self._sessions.move_to_end(session_id)
+            turns = list(session["turns"])
+        return turns[-last_n:] if last_n else turns
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_locked(time.time())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "turns": sum(len(s["turns"]) for s in self._sessions.values()),
+                "bytes": self._bytes,
+                "evictions": dict(self.evictions),
+            }
+
+
+# =========================
+# 3) SQLite 实现
+# =========================
+class SQLiteConversationStore(ConversationStore):
+    """
+    多个 worker 进程共享会话、重启不丢失：
+    - WAL 模式 + busy_timeout，支持多进程并发读写
+    - 每个线程各自持有连接
+    - 过期 / 超额会话的清理按 sweep_interval 节流，不在每次写入时全表扫描
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        touched REAL NOT NULL,
+        bytes INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_touched ON sessions(touched);
+    CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        query TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        created REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session_id, id);
+    """
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH, sweep_interval: float = 30.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _delete_sessions(self, conn: sqlite3.Connection, session_ids: List[str]) -> None:
+        for sid in session_ids:
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (sid,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (sid,))
+
+    def _sweep(self, conn: sqlite3.Connection, now: float, keep: str) -> None:
+        if self.ttl > 0:
+            expired = [r[0] for r in conn.execute(
+                "SELECT session_id FROM sessions WHERE touched < ? AND session_id != ?",
+                (now - self.ttl, keep),
+            )]
+            self._delete_sessions(conn, expired)
+            self.evictions["ttl"] += len(expired)
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        victims: List[str] = []
+        for sid, size in conn.execute(
+            "SELECT session_id, bytes FROM sessions WHERE session_id != ? ORDER BY touched", (keep,)
+        ):
+            if count <= self.max_sessions and total <= self.max_bytes:
+                break
+            self.evictions["lru" if count > self.max_sessions else "memory"] += 1
+            victims.append(sid)
+            count -= 1
+            total -= size
+        self._delete_sessions(conn, victims)
+
+    def append(self, session_id: str, query: str, answer: str) -> None:
+        now = time.time()
+        size = turn_bytes(query, answer)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT touched FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None and self._expired(row[0], now):
+                self._delete_sessions(conn, [session_id])
+                self.evictions["ttl"] += 1
+            conn.execute(
+                "INSERT INTO turns (session_id, query, answer, bytes, created) VALUES (?, ?, ?, ?, ?)",
+                (session_id, query, answer, size, now),
+            )
+            conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+            conn.execute(
+                "INSERT INTO sessions (session_id, touched, bytes) "
+                "VALUES (?, ?, (SELECT COALESCE(SUM(bytes), 0) FROM turns WHERE session_id = ?)) "
+                "ON CONFLICT(session_id) DO UPDATE SET touched = excluded.touched, bytes = excluded.bytes",
+                (session_id, now, session_id),
+            )
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                self._sweep(conn, now, keep=session_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Turn]:
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT touched FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return []
+        if self._expired(row[0], now):
+            self.clear(session_id)
+            self.evictions["ttl"] += 1
+            return []
+        conn.execute("UPDATE sessions SET touched = ? WHERE session_id = ?", (now, session_id))
+        rows = conn.execute(
+            "SELECT query, answer FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, last_n or self.max_turns),
+        ).fetchall()
+        return [(q, a) for q, a in reversed(rows)]
+
+    def clear(self, session_id: str) -> None:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete_sessions(conn, [session_id])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge_expired(self) -> int:
+        if self.ttl <= 0:
+            return 0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [r[0] for r in conn.execute(
+                "SELECT session_id FROM sessions WHERE touched < ?", (time.time() - self.ttl,)
+            )]
+            self._delete_sessions(conn, expired)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.evictions["ttl"] += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        sessions, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        turns = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": sessions,
+            "turns": turns,
+            "bytes": total,
+            "evictions": dict(self.evictions),
+        }
+
+
+# =========================
+# 4) 工厂
+# =========================
+def create_conversation_store(backend: str = CONVERSATION_BACKEND, **kwargs) -> ConversationStore:
+    """
+    backend："memory"（默认，单进程）或 "sqlite"（多进程共享，重启不丢失）
+    """
+    if backend == "memory":
+        return InMemoryConversationStore(**kwargs)
+    if backend == "sqlite":
+        return SQLiteConversationStore(**kwargs)
+    raise ValueError(f"未知的会话存储类型：{backend}（可选 memory / sqlite）")
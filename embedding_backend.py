@@ -0,0 +1,420 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import create_worker_pool, encode_corpus
+
+# =========================
+# 0) 配置
+# =========================
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# torch = SentenceTransformer fp32（默认）；onnx-int8 = 导出的 ONNX 模型 + int8 动态量化，需先运行 export
+ENGINES = ("torch", "onnx-int8")
+EMBED_ENGINE = os.getenv("EMBED_ENGINE", "torch")
+# 单次前向使用的线程数；0 表示由 torch / onnxruntime 自行决定
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+
+ONNX_FP32_NAME = "model.onnx"
+ONNX_INT8_NAME = "model_int8.onnx"
+ONNX_META_NAME = "export.json"
+
+
+def cache_namespace(engine: str) -> str:
+    """
+    量化后的向量与 fp32 有细微差异，两种引擎的 embedding 缓存分开存放
+    """
+    return MODEL_NAME if engine == "torch" else f"{MODEL_NAME}@{engine}"
+
+
+# =========================
+# 1) 推理引擎
+# =========================
+class TorchEncoder:
+    """
+    SentenceTransformer fp32 前向（首次 encode 时加载模型）
+    """
+
+    engine = "torch"
+
+    def __init__(self, model_name: str = MODEL_NAME, threads: int = EMBED_THREADS):
+        self.model_name = model_name
+        self.threads = threads
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            if self.threads > 0:
+                try:
+                    import torch
+                    torch.set_num_threads(self.threads)
+                except ImportError:
+                    pass
+            self._model = SentenceTransformer(self.model_name, local_files_only=True)
+        return self._model
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=batch_size, show_progress_bar=show_progress_bar)
+
+
+class OnnxInt8Encoder:
+    """
+    onnxruntime 执行 int8 动态量化后的 ONNX 模型：
+    - 分词使用 tokenizers（Rust 实现），不导入 transformers / torch
+    - 池化方式与 SentenceTransformer 的 Pooling 层一致（按 attention mask 求均值）
+    - intra_op 线程数由 threads 控制，inter_op 固定为 1（单条查询没有可并行的子图）
+    """
+
+    engine = "onnx-int8"
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, threads: int = EMBED_THREADS):
+        meta_path = os.path.join(model_dir, ONNX_META_NAME)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(
+                f"未找到 ONNX 模型 {model_dir}/，请先运行：python embedding_backend.py export --out {model_dir}"
+            )
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("model") != MODEL_NAME:
+            raise ValueError(f"ONNX 模型导出自 {self.meta.get('model')}，与当前 embedding 模型 {MODEL_NAME} 不一致")
+
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(self.meta["max_length"]))
+        self.tokenizer.enable_padding(pad_id=int(self.meta["pad_id"]), pad_token=self.meta["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_INT8_NAME), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _forward(self, texts: Sequence[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, int(self.meta["dim"])), dtype=np.float32)
+        parts = [self._forward(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        return np.concatenate(parts).astype(np.float32)
+
+
+def create_encoder(
+    engine: str = EMBED_ENGINE,
+    threads: int = EMBED_THREADS,
+    model_name: str = MODEL_NAME,
+    model_dir: str = ONNX_MODEL_DIR,
+):
+    if engine == "torch":
+        return TorchEncoder(model_name, threads=threads)
+    if engine == "onnx-int8":
+        return OnnxInt8Encoder(model_dir, threads=threads)
+    raise ValueError(f"未知的 embedding 引擎：{engine}（可选 {' / '.join(ENGINES)}）")
+
+
+# =========================
+# 2) LangChain Embeddings（构建与在线服务共用）
+# =========================
+class LocalEmbeddings(Embeddings):
+    """
+    - engine：torch（fp32）或 onnx-int8；推理引擎在第一次需要向量化时才加载，
+      增量构建一条都不用重新向量化时不加载模型
+    - batch_size / workers：构建期按长度分桶的批大小、编码进程数
+    - threads：单进程前向的线程数
+    - 经过与引擎对应的磁盘 embedding 缓存
+    - 分块构建时用 with embeddings.worker_pool() 包住编码阶段，各块共用同一个进程池
+    """
+
+    def __init__(
+        self,
+        engine: str = EMBED_ENGINE,
+        batch_size: int = 32,
+        workers: int = 1,
+        threads: int = EMBED_THREADS,
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"未知的 embedding 引擎：{engine}（可选 {' / '.join(ENGINES)}）")
+        self.engine = engine
+        self.batch_size = batch_size
+        self.workers = workers
+        self.threads = threads
+        self.cache = EmbeddingCache(cache_namespace(engine))
+        self.last_stats: Optional[dict] = None
+        self._encoder = None
+        self._pool = None
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = create_encoder(self.engine, self.threads)
+        return self._encoder
+
+    @property
+    def loaded(self) -> bool:
+        # TorchEncoder 在第一次 encode 时才加载模型；ONNX 会话在构造时创建
+        return self._encoder is not None and getattr(self._encoder, "_model", True) is not None
+
+    def load(self) -> "LocalEmbeddings":
+        """
+        在线服务预热用：加载推理引擎并跑一次前向（不经过缓存），把模型加载耗时放到启动阶段
+        """
+        self.encoder.encode(["河北"], batch_size=1)
+        return self
+
+    @contextmanager
+    def worker_pool(self):
+        """
+        workers > 1 时在 with 块内只创建一次进程池，块内所有 embed_documents 调用共用，
+        worker 里的模型只加载一次；退出时关闭。workers <= 1 或已在池内时不做任何事。
+        """
+        if self.workers <= 1 or self._pool is not None:
+            yield self
+            return
+        self._pool = create_worker_pool(MODEL_NAME, self.engine, self.workers)
+        try:
+            yield self
+        finally:
+            pool, self._pool = self._pool, None
+            pool.shutdown()
+
+    def _encode(self, texts):
+        # 多进程模式下由各 worker 自行加载模型，主进程不加载
+        multi = self.workers > 1 and len(texts) > self.batch_size
+        vectors, self.last_stats = encode_corpus(
+            texts,
+            MODEL_NAME,
+            batch_size=self.batch_size,
+            workers=self.workers,
+            model=None if multi else self.encoder,
+            engine=self.engine,
+            pool=self._pool,
+        )
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.cache.encode(texts, self._encode)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# =========================
+# 3) 导出 ONNX + int8 动态量化
+# =========================
+def export_onnx(out_dir: str = ONNX_MODEL_DIR, max_length: int = 128, opset: int = 14) -> str:
+    """
+    一次性步骤（需要 torch / transformers / onnxruntime）：
+    导出 fp32 ONNX，再对权重做 int8 动态量化；在线服务只需要 onnxruntime + tokenizers
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoModel, AutoTokenizer
+
+    st_model = SentenceTransformer(MODEL_NAME, local_files_only=True, device="cpu")
+    pooling = st_model[1].get_pooling_mode_str()
+    if pooling != "mean" or len(st_model) > 2:
+        raise ValueError(f"{MODEL_NAME} 的池化方式为 {pooling}，OnnxInt8Encoder 只实现了 mean pooling")
+    max_length = min(max_length, st_model.max_seq_length)
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, local_files_only=True)
+    model = AutoModel.from_pretrained(MODEL_NAME, local_files_only=True)
+    model.eval()
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, ONNX_FP32_NAME)
+    sample = tokenizer(["河北旅游问答示例"], return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+            opset_version=opset,
+        )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, ONNX_INT8_NAME), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(out_dir)
+
+    with open(os.path.join(out_dir, ONNX_META_NAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": MODEL_NAME,
+            "max_length": max_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_id": tokenizer.pad_token_id,
+            "dim": st_model.get_sentence_embedding_dimension(),
+            "opset": opset,
+        }, f, ensure_ascii=False, indent=1)
+
+    fp32_mb = os.path.getsize(fp32_path) / 1024 / 1024
+    int8_mb = os.path.getsize(os.path.join(out_dir, ONNX_INT8_NAME)) / 1024 / 1024
+    print(f"已导出 {out_dir}/：fp32 {fp32_mb:.1f}MB -> int8 {int8_mb:.1f}MB")
+    return out_dir
+
+
+# =========================
+# 4) 与 fp32 的一致性校验
+# =========================
+def _latency_ms(encoder, texts: Sequence[str]) -> Dict[str, float]:
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        encoder.encode([text], batch_size=1)
+        samples.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return (a * b).sum(axis=1)
+
+
+def _topk_overlap(index, reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    _, ref_ids = index.search(np.ascontiguousarray(reference, dtype=np.float32), k)
+    _, cand_ids = index.search(np.ascontiguousarray(candidate, dtype=np.float32), k)
+    return float(np.mean([len(set(r) & set(c) - {-1}) / k for r, c in zip(ref_ids, cand_ids)]))
+
+
+def verify_agreement(
+    faiss_dir: str = "faiss_hebei",
+    engine: str = "onnx-int8",
+    k: int = 5,
+    sample: int = 200,
+    threads: int = EMBED_THREADS,
+) -> dict:
+    """
+    用知识库本身检验 engine 相对 fp32 的偏差：
+    - 条目文本与评测查询的向量余弦相似度（均值 / 最小值 / p5）
+    - 在已构建的索引上，用两种引擎的查询向量检索 Top-K 的重合率（在线只换查询编码器的情形）
+    - 用两种引擎分别编码全部条目、各自建精确索引时 Top-K 的重合率（构建也换引擎的情形）
+    - 单条查询编码延迟
+    不经过 embedding 缓存，测的是模型本身。
+    """
+    import faiss
+    from build_faiss_hebei import report_queries
+    from compact_docstore import CompactDocstore
+
+    docstore = CompactDocstore.load(faiss_dir)
+    if docstore is None:
+        raise FileNotFoundError(f"{faiss_dir} 中没有列式 docstore，请先运行 build_faiss_hebei.py")
+    docs = list(docstore.documents(range(len(docstore))))
+    texts = [d.page_content for d in docs]
+    queries = report_queries(docs, sample=sample)
+
+    reference = create_encoder("torch", threads)
+    candidate = create_encoder(engine, threads)
+    ref_docs, cand_docs = reference.encode(texts), candidate.encode(texts)
+    ref_queries, cand_queries = reference.encode(queries), candidate.encode(queries)
+
+    doc_cos = _cosine(ref_docs, cand_docs)
+    query_cos = _cosine(ref_queries, cand_queries)
+    k = min(k, len(docs))
+
+    built = faiss.read_index(os.path.join(faiss_dir, "index.faiss"))
+    ref_exact = faiss.IndexFlatL2(ref_docs.shape[1])
+    ref_exact.add(np.ascontiguousarray(ref_docs, dtype=np.float32))
+    cand_exact = faiss.IndexFlatL2(cand_docs.shape[1])
+    cand_exact.add(np.ascontiguousarray(cand_docs, dtype=np.float32))
+    _, ref_ids = ref_exact.search(np.ascontiguousarray(ref_queries, dtype=np.float32), k)
+    _, cand_ids = cand_exact.search(np.ascontiguousarray(cand_queries, dtype=np.float32), k)
+    rebuilt_overlap = float(np.mean([len(set(r) & set(c)) / k for r, c in zip(ref_ids, cand_ids)]))
+
+    return {
+        "engine": engine,
+        "entries": len(docs),
+        "queries": len(queries),
+        "k": k,
+        "doc_cosine": {
+            "mean": round(float(doc_cos.mean()), 5),
+            "min": round(float(doc_cos.min()), 5),
+            "p5": round(float(np.percentile(doc_cos, 5)), 5),
+        },
+        "query_cosine": {
+            "mean": round(float(query_cos.mean()), 5),
+            "min": round(float(query_cos.min()), 5),
+            "p5": round(float(np.percentile(query_cos, 5)), 5),
+        },
+        "topk_overlap_query_only": round(_topk_overlap(built, ref_queries, cand_queries, k), 4),
+        "topk_overlap_rebuilt": round(rebuilt_overlap, 4),
+        "latency": {
+            "torch": _latency_ms(reference, queries[:50]),
+            engine: _latency_ms(candidate, queries[:50]),
+        },
+    }
+
+
+def format_agreement(report: dict) -> str:
+    engine = report["engine"]
+    lines = [
+        f"【{engine} vs torch fp32】{report['entries']} 条，{report['queries']} 个查询",
+        f"  条目余弦：均值 {report['doc_cosine']['mean']}，最小 {report['doc_cosine']['min']}，p5 {report['doc_cosine']['p5']}",
+        f"  查询余弦：均值 {report['query_cosine']['mean']}，最小 {report['query_cosine']['min']}，p5 {report['query_cosine']['p5']}",
+        f"  Top-{report['k']} 重合率：仅换查询编码 {report['topk_overlap_query_only']:.1%}，"
+        f"构建也换引擎 {report['topk_overlap_rebuilt']:.1%}",
+    ]
+    for name, stats in report["latency"].items():
+        lines.append(f"  单条查询编码 {name}：avg {stats['avg_ms']}ms，p50 {stats['p50_ms']}ms，p95 {stats['p95_ms']}ms")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="embedding 推理引擎：导出 ONNX int8 模型 / 校验与 fp32 的一致性")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="导出 ONNX 并做 int8 动态量化")
+    p_export.add_argument("--out", default=ONNX_MODEL_DIR, help="输出目录")
+    p_export.add_argument("--max-length", type=int, default=128, help="分词截断长度")
+
+    p_verify = sub.add_parser("verify", help="在知识库上对比 fp32 与量化模型的向量和 Top-K")
+    p_verify.add_argument("--faiss-dir", default="faiss_hebei", help="已构建的向量库目录")
+    p_verify.add_argument("--engine", choices=[e for e in ENGINES if e != "torch"], default="onnx-int8")
+    p_verify.add_argument("--top-k", type=int, default=5)
+    p_verify.add_argument("--sample", type=int, default=200, help="评测查询条数")
+    p_verify.add_argument("--threads", type=int, default=EMBED_THREADS, help="前向线程数")
+    p_verify.add_argument("--out", default=None, help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.out, max_length=args.max_length)
+    else:
+        result = verify_agreement(args.faiss_dir, args.engine, k=args.top_k, sample=args.sample, threads=args.threads)
+        print(format_agreement(result))
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,429 @@
+from __future__ import annotations
+import atexit
+import contextlib
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from tracing import annotate
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock：只支持单进程使用同一缓存目录
+    fcntl = None
+
+# =========================
+# 0) 配置
+# =========================
+DEFAULT_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".embed_cache")
+DEFAULT_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "256"))
+# 日志超过这么多条、或读命中的 LRU 序号超过这么多秒未落盘时，合并重写 index.json
+JOURNAL_MAX_RECORDS = int(os.getenv("EMBED_CACHE_JOURNAL_MAX", "2048"))
+FLUSH_INTERVAL = float(os.getenv("EMBED_CACHE_FLUSH_INTERVAL", "30"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    raw = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+# =========================
+# 1) 磁盘向量缓存
+# =========================
+class EmbeddingCache:
+    """
+    构建与在线服务共用的本地向量缓存
+    - key = (模型名, 归一化文本哈希)
+    - vectors.f32：float32 矩阵，np.memmap 读写，每个槽位一条向量
+    - index.json：key -> [槽位, 最近使用序号]
+    - index.journal：index.json 之后的槽位分配 / 淘汰 / 扩容记录，每行一条 JSON，只追加；
+      超过 journal_max 条或 flush_interval 到期时合并进 index.json 并清空
+    - 超出 max_mb 预算时按 LRU 淘汰；读命中更新的 LRU 序号同样算作未落盘的修改，按 flush_interval 定期写回
+    - 多进程共用同一目录（多个服务 worker、构建与在线服务同时运行）：读取持共享 flock，
+      分配槽位 + 写向量 + 追加日志持独占 flock；index.json 被其他进程改写过时先重新加载，
+      日志变长时只回放新增部分，其他进程不会拿到本进程尚未落盘的槽位
+    """
+
+    VECTORS_NAME = "vectors.f32"
+    INDEX_NAME = "index.json"
+    JOURNAL_NAME = "index.journal"
+    LOCK_NAME = ".lock"
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_mb: float = DEFAULT_MAX_MB,
+        journal_max: int = JOURNAL_MAX_RECORDS,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.model_name = model_name
+        slug = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, slug)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.journal_max = journal_max
+        self.flush_interval = flush_interval
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._slots: Dict[str, List[int]] = {}
+        self._free: List[int] = []
+        self._next_slot = 0
+        self._tick = 0
+        self._mm: Optional[np.memmap] = None
+        # 内存里有尚未写入 index.json / 日志的修改（读命中更新的 LRU 序号）
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        # 最近一次加载 / 保存时 index.json 的 (inode, mtime, size)，用来发现其他进程的改写
+        self._index_stamp: Optional[tuple] = None
+        # 已回放到的日志字节偏移与条数
+        self._journal_offset = 0
+        self._journal_records = 0
+        # 本次写入产生、尚未追加到日志的记录
+        self._pending: List[dict] = []
+        self._lock_fd: Optional[int] = None
+
+        if self.max_bytes > 0:
+            with self._lock, self._file_lock(exclusive=False):
+                self._load()
+        atexit.register(self.save)
+
+    # ---------- 持久化 ----------
+    def _vectors_path(self) -> str:
+        return os.path.join(self.dir, self.VECTORS_NAME)
+
+    def _index_path(self) -> str:
+        return os.path.join(self.dir, self.INDEX_NAME)
+
+    def _journal_path(self) -> str:
+        return os.path.join(self.dir, self.JOURNAL_NAME)
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        跨进程锁（调用方已持有 self._lock，同进程内的线程由它互斥）
+        """
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self._lock_fd = os.open(os.path.join(self.dir, self.LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _stat_index(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self._index_path())
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refresh(self) -> None:
+        """
+        持 flock 时调用：index.json 自上次加载 / 保存后被其他进程改写过，则重新加载；
+        否则只回放日志里其他进程新追加的记录
+        """
+        stamp = self._stat_index()
+        if stamp is None:
+            return
+        if stamp != self._index_stamp:
+            self._load()
+            return
+        try:
+            size = os.path.getsize(self._journal_path())
+        except OSError:
+            size = 0
+        if size < self._journal_offset:
+            # 合并中途退出留下的截断日志：以 index.json 为准重新加载
+            self._load()
+        elif size > self._journal_offset:
+            self._replay_journal({})
+
+    def _load(self) -> None:
+        stamp = self._stat_index()
+        if stamp is None or not os.path.exists(self._vectors_path()):
+            return
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if meta.get("model") != self.model_name:
+            return
+
+        # 本进程读命中更新的 LRU 序号只在内存里，同一槽位上保留较新的那个
+        previous = self._slots
+        slots = {k: list(v) for k, v in meta["slots"].items()}
+        for key, entry in slots.items():
+            old = previous.get(key)
+            if old is not None and old[0] == entry[0]:
+                entry[1] = max(entry[1], old[1])
+
+        self._dim = int(meta["dim"])
+        self._capacity = int(meta["capacity"])
+        self._slots = slots
+        self._free = list(meta.get("free", []))
+        self._next_slot = int(meta.get("next_slot", len(self._slots)))
+        self._tick = max(self._tick, int(meta.get("tick", 0)))
+        self._mm = None
+        self._index_stamp = stamp
+        self._journal_offset = 0
+        self._journal_records = 0
+        # 回放结束时按最终容量映射向量文件
+        self._replay_journal(previous)
+
+    def _replay_journal(self, previous: Dict[str, List[int]]) -> None:
+        """
+        从 _journal_offset 起回放日志；previous 为重新加载前的内存索引，同一槽位上保留较新的 LRU 序号
+        """
+        try:
+            with open(self._journal_path(), "rb") as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except OSError:
+            return
+        # 只回放完整的行：另一进程写到一半的记录留到下次
+        end = data.rfind(b"\n") + 1
+        capacity = self._capacity
+        for line in data[:end].splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            self._journal_records += 1
+            if "capacity" in rec:
+                capacity = max(capacity, int(rec["capacity"]))
+            for key in rec.get("evict", []):
+                entry = self._slots.pop(key, None)
+                if entry is not None:
+                    self._free.append(entry[0])
+            if "key" in rec:
+                slot, tick = int(rec["slot"]), int(rec["tick"])
+                old = previous.get(rec["key"]) or self._slots.get(rec["key"])
+                if old is not None and old[0] == slot:
+                    tick = max(tick, old[1])
+                if slot in self._free:
+                    self._free.remove(slot)
+                self._slots[rec["key"]] = [slot, tick]
+                self._next_slot = max(self._next_slot, slot + 1)
+                self._tick = max(self._tick, tick)
+        self._journal_offset += end
+        if capacity != self._capacity:
+            self._capacity = capacity
+            self._mm = None
+        if self._mm is None and self._dim and os.path.exists(self._vectors_path()):
+            self._mm = np.memmap(
+                self._vectors_path(), dtype=np.float32, mode="r+",
+                shape=(self._capacity, self._dim),
+            )
+
+    def _append_journal_locked(self) -> None:
+        """
+        持独占 flock 时调用：把本次写入的记录追加到日志；还没有 index.json 时直接整体保存
+        """
+        if not self._pending:
+            return
+        # 先落盘向量，再写日志，保证日志不会指向未写入的槽位
+        self._mm.flush()
+        if self._index_stamp is None:
+            self._save_locked()
+            return
+        payload = "".join(json.dumps(rec) + "\n" for rec in self._pending).encode("utf-8")
+        with open(self._journal_path(), "ab") as f:
+            # _refresh 已回放全部完整记录，多出的只可能是写到一半退出留下的残行
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(payload)
+        self._journal_offset += len(payload)
+        self._journal_records += len(self._pending)
+        self._pending = []
+
+    def _flush_due(self) -> bool:
+        if self._journal_records >= self.journal_max:
+            return True
+        return self._dirty and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def save(self) -> None:
+        """
+        把日志与读命中的 LRU 序号合并写入 index.json（定期触发，进程退出时再调用一次）
+        """
+        with self._lock:
+            if not self._dirty and not self._journal_records:
+                return
+            with self._file_lock(exclusive=True):
+                self._refresh()
+                self._save_locked()
+
+    def _save_locked(self) -> None:
+        if self._mm is None:
+            return
+        # 先落盘向量，再写索引，保证索引不会指向未写入的槽位
+        self._mm.flush()
+        meta = {
+            "model": self.model_name,
+            "dim": self._dim,
+            "capacity": self._capacity,
+            "next_slot": self._next_slot,
+            "tick": self._tick,
+            "free": self._free,
+            "slots": self._slots,
+        }
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # 先清空日志再替换索引：中途退出最多丢掉最近的缓存条目，不会回放到过期的索引上
+        with open(self._journal_path(), "w", encoding="utf-8"):
+            pass
+        os.replace(tmp_path, self._index_path())
+        self._dirty = False
+        self._pending = []
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._last_flush = time.monotonic()
+        self._index_stamp = self._stat_index()
+
+    # ---------- 槽位管理 ----------
+    @property
+    def max_entries(self) -> int:
+        if not self._dim:
+            return 0
+        return max(1, self.max_bytes // (self._dim * 4))
+
+    def _ensure_storage(self, dim: int) -> None:
+        if self._mm is not None:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        self._dim = dim
+        self._resize(min(1024, self.max_entries))
+
+    def _resize(self, capacity: int) -> None:
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm = None
+        with open(self._vectors_path(), "ab") as f:
+            f.truncate(capacity * self._dim * 4)
+        self._capacity = capacity
+        self._pending.append({"capacity": capacity})
+        self._mm = np.memmap(
+            self._vectors_path(), dtype=np.float32, mode="r+",
+            shape=(self._capacity, self._dim),
+        )
+
+    def _evict(self, n: int) -> None:
+        oldest = heapq.nsmallest(n, self._slots.items(), key=lambda kv: kv[1][1])
+        for key, (slot, _) in oldest:
+            del self._slots[key]
+            self._free.append(slot)
+        self._pending.append({"evict": [key for key, _ in oldest]})
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._next_slot >= self.max_entries:
+            self._evict(max(1, self.max_entries // 20))
+            return self._free.pop()
+        if self._next_slot >= self._capacity:
+            self._resize(min(self._capacity * 2, self.max_entries))
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    # ---------- 对外接口 ----------
+    def encode(
+        self,
+        texts: Sequence[str],
+        encode_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+    ) -> List[List[float]]:
+        """
+        命中的文本直接读缓存，只把未命中的文本交给 encode_fn（模型）计算。
+        """
+        if self.max_bytes <= 0:
+            self.misses += len(texts)
+            annotate(embed_cache_misses=len(texts))
+            return [list(map(float, v)) for v in encode_fn(list(texts))]
+
+        keys = [cache_key(self.model_name, t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            miss_idx: List[int] = []
+            for i, key in enumerate(keys):
+                entry = self._slots.get(key)
+                if entry is None or self._mm is None:
+                    miss_idx.append(i)
+                    continue
+                self._tick += 1
+                entry[1] = self._tick
+                self._dirty = True
+                results[i] = self._mm[entry[0]].tolist()
+            self.hits += len(texts) - len(miss_idx)
+            self.misses += len(miss_idx)
+            flush = self._flush_due()
+        annotate(embed_cache_hits=len(texts) - len(miss_idx), embed_cache_misses=len(miss_idx))
+
+        if not miss_idx:
+            if flush:
+                self.save()
+            return results
+
+        # 同一批里的重复文本只算一次
+        unique: Dict[str, int] = {}
+        for i in miss_idx:
+            unique.setdefault(keys[i], i)
+        vectors = np.asarray(
+            encode_fn([texts[i] for i in unique.values()]), dtype=np.float32
+        )
+        by_key = dict(zip(unique.keys(), vectors))
+
+        with self._lock, self._file_lock(exclusive=True):
+            # 分配前先同步其他进程已占用的槽位
+            self._refresh()
+            self._ensure_storage(vectors.shape[1])
+            for key, vec in by_key.items():
+                if key in self._slots:
+                    continue
+                slot = self._allocate()
+                self._mm[slot] = vec
+                self._tick += 1
+                self._slots[key] = [slot, self._tick]
+                self._pending.append({"key": key, "slot": slot, "tick": self._tick})
+            self._append_journal_locked()
+            if self._flush_due():
+                self._save_locked()
+
+        for i in miss_idx:
+            results[i] = by_key[keys[i]].tolist()
+        return results
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._slots),
+            "bytes": len(self._slots) * (self._dim or 0) * 4,
+        }
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# =========================
+# 0) 进程池 worker
+# =========================
+_worker_model = None
+
+
+def _init_worker(model_name: str, engine: str, threads: int) -> None:
+    global _worker_model
+    from embedding_backend import create_encoder
+    _worker_model = create_encoder(engine, threads, model_name=model_name)
+
+
+def _encode_in_worker(batch: List[str]) -> np.ndarray:
+    return _worker_model.encode(batch, batch_size=len(batch), show_progress_bar=False)
+
+
+# =========================
+# 1) 构建期批量向量化
+# =========================
+def make_length_buckets(texts: Sequence[str], batch_size: int) -> List[List[int]]:
+    """
+    按文本长度排序后切批：同一批内长度接近，减少 padding 浪费。
+    返回每批对应的原始下标。
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def padding_ratio(texts: Sequence[str], batches: List[List[int]]) -> float:
+    padded = sum(max(len(texts[i]) for i in b) * len(b) for b in batches)
+    if not padded:
+        return 0.0
+    return 1 - sum(len(t) for t in texts) / padded
+
+
+def create_worker_pool(model_name: str, engine: str, workers: int) -> ProcessPoolExecutor:
+    """
+    编码进程池：每个 worker 启动时各自加载一份 engine 对应的模型，线程数按 CPU 核数均分。
+    worker 在第一次提交任务时才启动，创建本身不加载模型。
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_name, engine, threads),
+    )
+
+
+def encode_corpus(
+    texts: Sequence[str],
+    model_name: str,
+    batch_size: int = 32,
+    workers: int = 1,
+    model=None,
+    engine: str = "torch",
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Tuple[np.ndarray, dict]:
+    """
+    - 按长度分桶批量调用 model.encode，结果按原始顺序返回
+    - model 为 embedding_backend 中的推理引擎（或 SentenceTransformer），未给出时按 engine 创建
+    - workers > 1 时使用进程池：给出 pool 则复用（分块构建时整个构建共用一个），
+      否则本次调用临时创建、结束即关闭
+    - 返回 (向量矩阵, 吞吐统计)
+    """
+    start = time.perf_counter()
+    batches = make_length_buckets(texts, batch_size)
+
+    if workers > 1 and len(batches) > 1:
+        payload = [[texts[i] for i in b] for b in batches]
+        if pool is not None:
+            encoded = list(pool.map(_encode_in_worker, payload))
+        else:
+            with create_worker_pool(model_name, engine, workers) as own:
+                encoded = list(own.map(_encode_in_worker, payload))
+    else:
+        if model is None:
+            from embedding_backend import create_encoder
+            model = create_encoder(engine, model_name=model_name)
+        encoded = [
+            model.encode([texts[i] for i in b], batch_size=len(b), show_progress_bar=False)
+            for b in batches
+        ]
+
+    dim = encoded[0].shape[1] if encoded else 0
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for b, vecs in zip(batches, encoded):
+        vectors[b] = vecs
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "entries": len(texts),
+        "batches": len(batches),
+        "batch_size": batch_size,
+        "workers": workers,
+        "padding_ratio": round(padding_ratio(texts, batches), 4),
+        "seconds": round(seconds, 3),
+        "entries_per_sec": round(len(texts) / seconds, 1) if seconds > 0 else 0.0,
+    }
+    return vectors, stats
+
+
+def merge_throughput(stats_list: List[dict]) -> Optional[dict]:
+    """
+    合并分块构建时多次 encode_corpus 的统计；padding 占比按条目数加权
+    """
+    stats_list = [s for s in stats_list if s and s.get("entries")]
+    if not stats_list:
+        return None
+    entries = sum(s["entries"] for s in stats_list)
+    seconds = sum(s["seconds"] for s in stats_list)
+    return {
+        "entries": entries,
+        "batches": sum(s["batches"] for s in stats_list),
+        "batch_size": stats_list[0]["batch_size"],
+        "workers": stats_list[0]["workers"],
+        "padding_ratio": round(sum(s["padding_ratio"] * s["entries"] for s in stats_list) / entries, 4),
+        "seconds": round(seconds, 3),
+        "entries_per_sec": round(entries / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def format_throughput(stats: Optional[dict]) -> str:
+    if not stats or not stats.get("entries"):
+        return "本次无需向量化"
+    return (
+        f"向量化 {stats['entries']} 条，{stats['batches']} 批"
+        f"（batch_size={stats['batch_size']}，workers={stats['workers']}），"
+        f"耗时 {stats['seconds']}s，吞吐 {stats['entries_per_sec']} 条/秒，"
+        f"padding 占比 {stats['padding_ratio']:.1%}"
+    )
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import json
+import os
+import re
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence
+
+# =========================
+# 0) 配置
+# =========================
+ENTITY_GRAPH_NAME = "entity_graph.json"
+
+# 关闭后检索结果不做按景点的展开 / 折叠
+ENTITY_EXPANSION = os.getenv("ENTITY_EXPANSION", "1").lower() in ("1", "true", "yes")
+# 同一景点最多占用的检索名额（问题点名的景点不受限制）
+ENTITY_MAX_PER = int(os.getenv("ENTITY_MAX_PER", "2"))
+# 每次最多补入的同景点子条目数
+ENTITY_EXPAND = int(os.getenv("ENTITY_EXPAND", "2"))
+
+_BRACKETS = re.compile(r"（.*?）|\(.*?\)")
+_SUFFIXES = ("景区",)
+
+# 问题关键词 -> 子条目主题（按名称后缀 / 类型匹配）
+TOPIC_KEYWORDS = {
+    "门票": ("门票", "票价", "多少钱", "免票", "半价", "优惠"),
+    "交通": ("交通", "怎么去", "怎么到", "高铁", "自驾", "公交", "大巴", "打车"),
+    "开放时间": ("开放", "几点", "营业", "关门"),
+    "观光车": ("观光车", "电瓶车", "游船", "索道"),
+    "避坑": ("避坑", "坑", "注意"),
+    "游览建议": ("怎么玩", "游览", "路线", "攻略", "半日", "一天"),
+}
+
+
+def entity_name(name: str) -> str:
+    """
+    条目所属景点：名称中第一个“-”之前的部分，去掉括号注释
+    （清东陵-交通 -> 清东陵，外八庙（普宁寺等） -> 外八庙）
+    """
+    return _BRACKETS.sub("", name.split("-", 1)[0]).strip()
+
+
+def _canonical(name: str) -> str:
+    base = entity_name(name)
+    for suffix in _SUFFIXES:
+        if base.endswith(suffix) and len(base) - len(suffix) >= 2:
+            base = base[:-len(suffix)]
+    return base
+
+
+def query_topics(query: str) -> List[str]:
+    return [topic for topic, words in TOPIC_KEYWORDS.items() if any(w in query for w in words)]
+
+
+# =========================
+# 1) 景点 -> 子条目图
+# =========================
+class EntityGraph:
+    """
+    构建期按“名称”前缀约定生成的父子图，行号与 FAISS 一一对应：
+    - “清东陵”是父条目，“清东陵-交通”“清东陵-门票”等是子条目；
+      “北戴河景区-门票”“避暑山庄游览避坑”这类没有“-”或带“景区”后缀的名称也归到已知景点下
+    - entity_of[pos]：条目所属景点编号；members[eid]：该景点全部条目（父条目在前）
+    - 检索时查兄弟条目只是两次列表下标访问，与知识库规模无关
+    """
+
+    def __init__(self, entities: List[str], entity_of: List[int], members: List[List[int]], topics: List[str]):
+        self.entities = entities
+        self.entity_of = entity_of
+        self.members = members
+        self.topics = topics
+        self._by_name = {name: eid for eid, name in enumerate(entities)}
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[dict]) -> "EntityGraph":
+        metas = list(metadatas)
+        names = [m.get("name", "") for m in metas]
+
+        # 出现过“景点-子主题”写法的前缀，确定是景点
+        known = {_canonical(n) for n in names if "-" in n}
+        known = sorted((k for k in known if len(k) >= 2), key=len, reverse=True)
+
+        keys: List[str] = []
+        for name in names:
+            key = _canonical(name)
+            if "-" not in name and key not in known:
+                # “北戴河交通费用”“避暑山庄游览避坑”：最长的已知景点前缀
+                key = next((k for k in known if name.startswith(k)), key)
+            keys.append(key or name)
+
+        entities: List[str] = []
+        index: Dict[str, int] = {}
+        entity_of: List[int] = []
+        members: List[List[int]] = []
+        for pos, key in enumerate(keys):
+            if key not in index:
+                index[key] = len(entities)
+                entities.append(key)
+                members.append([])
+            entity_of.append(index[key])
+            members[index[key]].append(pos)
+
+        # 父条目（名称即景点本身，如“清东陵”“外八庙（普宁寺等）”）排在最前
+        def is_parent(pos: int) -> bool:
+            return "-" not in names[pos] and _canonical(names[pos]) == keys[pos]
+
+        for group in members:
+            group.sort(key=lambda p: (not is_parent(p), p))
+
+        # 子条目主题：“类型|名称去掉景点前缀”，如“门票|-门票”“交通费用|交通费用”
+        topics = [
+            f"{m.get('type', '')}|{names[pos][len(keys[pos]):] if names[pos].startswith(keys[pos]) else names[pos]}"
+            for pos, m in enumerate(metas)
+        ]
+        return cls(entities, entity_of, members, topics)
+
+    @classmethod
+    def load(cls, out_dir: str) -> Optional["EntityGraph"]:
+        path = os.path.join(out_dir, ENTITY_GRAPH_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["entities"], data["entity_of"], data["members"], data["topics"])
+
+    def save(self, out_dir: str) -> None:
+        data = {
+            "entities": self.entities,
+            "entity_of": self.entity_of,
+            "members": self.members,
+            "topics": self.topics,
+        }
+        tmp_path = os.path.join(out_dir, ENTITY_GRAPH_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(out_dir, ENTITY_GRAPH_NAME))
+
+    # ---------- 查询 ----------
+    def entity(self, pos: int) -> str:
+        return self.entities[self.entity_of[pos]]
+
+    def siblings(self, pos: int) -> List[int]:
+        return [p for p in self.members[self.entity_of[pos]] if p != pos]
+
+    def _matches_topic(self, pos: int, topics: Sequence[str]) -> bool:
+        entry_type, _, suffix = self.topics[pos].partition("|")
+        return any(t in suffix or entry_type.startswith(t) for t in topics)
+
+    def arrange(
+        self,
+        ranking: Sequence[int],
+        k: int,
+        query: str = "",
+        focus: Optional[str] = None,
+        allowed: Optional[AbstractSet[int]] = None,
+        max_per: int = ENTITY_MAX_PER,
+        expand: int = ENTITY_EXPAND,
+    ) -> List[int]:
+        """
+        按景点整理检索结果，返回 k 个行号：
+        - 折叠：同一景点最多占 max_per 个名额，空出的名额留给其他景点（focus，即问题点名的景点不受限）
+        - 展开：排名第一的景点（或 focus）下与问题主题相符的子条目（门票 / 交通 / 开放时间……）
+          若不在结果里，紧跟在该景点的命中之后补入，最多 expand 条
+        ranking 为融合后的完整候选顺序（可长于 k）。
+        """
+        if not ranking or k <= 0:
+            return list(ranking)[:k]
+
+        focus_eid = self._by_name.get(_canonical(focus)) if focus else None
+        anchor = focus_eid if focus_eid is not None else self.entity_of[ranking[0]]
+
+        # --- 展开 ---
+        extra: List[int] = []
+        topics = query_topics(query)
+        if topics and expand > 0:
+            present = set(ranking[:k])
+            for pos in self.members[anchor]:
+                if len(extra) >= expand:
+                    break
+                if pos in present or (allowed is not None and pos not in allowed):
+                    continue
+                if self._matches_topic(pos, topics):
+                    extra.append(pos)
+
+        # --- 折叠 ---
+        result: List[int] = []
+        counts: Dict[int, int] = {}
+        placed_extra = False
+        for pos in ranking:
+            if len(result) >= k:
+                break
+            eid = self.entity_of[pos]
+            if eid != focus_eid and counts.get(eid, 0) >= max_per:
+                continue
+            if pos in result:
+                continue
+            result.append(pos)
+            counts[eid] = counts.get(eid, 0) + 1
+            if eid == anchor and not placed_extra:
+                # 子条目紧跟在该景点的第一条命中之后
+                for p in extra:
+                    if len(result) < k and p not in result:
+                        result.append(p)
+                        counts[eid] += 1
+                placed_extra = True
+
+        if extra and not placed_extra:
+            # 点名的景点一条都没有命中时，把补入的子条目放在最前
+            result = (extra + [p for p in result if p not in extra])[:k]
+
+        # 折叠后不足 k 条时，用被折叠掉的候选补齐
+        if len(result) < k:
+            for pos in ranking:
+                if len(result) >= k:
+                    break
+                if pos not in result:
+                    result.append(pos)
+        return result
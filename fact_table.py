@@ -0,0 +1,391 @@
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from entity_graph import EntityGraph, entity_name
+
+# =========================
+# 0) 配置
+# =========================
+FACT_DB_NAME = "facts.sqlite"
+
+# 关闭后所有问题都走检索 + LLM
+FACT_ROUTER = os.getenv("FACT_ROUTER", "1").lower() in ("1", "true", "yes")
+
+# 结构化抽取的条目类型
+FACT_TYPES = ("门票", "开放时间", "交通费用", "观光车")
+
+# 问题关键词 -> 条目类型
+TYPE_KEYWORDS = {
+    "门票": ("门票", "票价", "免票", "半价", "优惠", "联票", "学生票", "老人票", "儿童票"),
+    "观光车": ("观光车", "电瓶车", "游船", "坐船", "木船", "电动船", "摆渡车"),
+    "开放时间": ("开放时间", "几点", "开门", "关门", "营业", "闭馆", "停止入园", "开放"),
+    "交通费用": ("交通费", "路费", "车费", "油费", "公交", "出租车", "打车", "车程", "最省钱", "多久能到"),
+}
+# 只问价格、没说是什么费用时按门票回答
+GENERIC_PRICE_WORDS = ("多少钱", "收费", "要钱", "免费", "贵不贵", "费用")
+# 问路线但没问费用时，交通费用表回答不全，交给检索 + LLM
+ROUTE_WORDS = ("怎么去", "怎么走", "怎么到", "路线", "交通")
+# 需要规划 / 比较 / 解释的问题
+PLANNING_WORDS = (
+    "行程", "安排", "规划", "计划", "几天", "日游", "推荐", "攻略", "适合", "值得",
+    "怎么玩", "比较", "还是", "哪个", "为什么", "预算", "顺路", "先去",
+)
+AUDIENCE_ALIASES = {
+    "成人": ("成人", "大人"),
+    "学生": ("学生",),
+    "老人": ("老人", "老年人", "长辈"),
+    "儿童": ("儿童", "小孩", "孩子"),
+}
+# 纯查询里除景点名、主题词、人群 / 月份之外只允许出现的问法；剩下任何其他字（预约、退票、在哪买、停车……）
+# 都说明还有别的诉求，交给检索 + LLM
+QUESTION_WORDS = (
+    "要多少钱", "是多少钱", "几块钱", "要多少", "是多少", "多少", "是几点", "几点钟",
+    "什么时候", "什么时间", "价格", "价钱", "怎么收费", "请问", "一下", "大概",
+)
+# 标点、语气词与连接词
+FILLER = re.compile(r"[\s，。！？,.!?、：:；;“”\"'（）()的吗呢呀啊吧了和与及]")
+# 景点名前的“去 / 到”（“12月去避暑山庄门票多少”）；问交通费用时还允许带出发地（“承德站到避暑山庄打车多少钱”）
+_ENTITY_LEAD = "(?:去|到)"
+_ORIGIN_LEAD = "从?[\u4e00-\u9fff]{2,6}到"
+
+_DASH = "[–—-]"
+_SEASON = re.compile(rf"(旺季|淡季)(?:（(\d{{1,2}}){_DASH}(\d{{1,2}})月）)?")
+_MONTH_RANGE = re.compile(rf"(\d{{1,2}})(?:月\d{{1,2}}日)?{_DASH}(\d{{1,2}})月")
+_PRICE = re.compile(rf"约?(\d+(?:\.\d+)?)(?:{_DASH}(\d+(?:\.\d+)?))?元(?:/(人|船|车|天))?")
+_HOURS = re.compile(rf"(\d{{1,2}}:\d{{2}}){_DASH}(\d{{1,2}}:\d{{2}})")
+_LAST_ENTRY = re.compile(r"(\d{1,2}:\d{2})停止入")
+_DURATION = re.compile(r"(?:车程|时长)约?(\d+(?:\.\d+)?)(分钟|小时)")
+_ROUTE_NAME = re.compile(rf"^(.+?){_DASH}到(.+?)(?:{_DASH}|$)")
+_QUERY_MONTH = re.compile(r"(\d{1,2})月")
+MODES = ("高铁", "火车", "旅游专线", "大巴", "公交", "地铁", "出租车", "包车", "自驾", "步行")
+
+SCHEMA = """
+CREATE TABLE facts (
+    id INTEGER PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    entity TEXT NOT NULL,
+    type TEXT NOT NULL,
+    city TEXT,
+    name TEXT,
+    title TEXT,
+    doc_id,
+    label TEXT,
+    audience TEXT,
+    season TEXT,
+    month_from INTEGER,
+    month_to INTEGER,
+    price_min REAL,
+    price_max REAL,
+    unit TEXT,
+    open_at TEXT,
+    close_at TEXT,
+    last_entry TEXT,
+    mode TEXT,
+    minutes REAL,
+    clause TEXT NOT NULL
+);
+CREATE INDEX idx_facts_entity_type ON facts(entity, type);
+CREATE INDEX idx_facts_type_price ON facts(type, price_min);
+"""
+COLUMNS = (
+    "pos", "entity", "type", "city", "name", "title", "doc_id", "label", "audience",
+    "season", "month_from", "month_to", "price_min", "price_max", "unit",
+    "open_at", "close_at", "last_entry", "mode", "minutes", "clause",
+)
+
+
+# =========================
+# 1) 条目内容 -> 事实行
+# =========================
+def split_clauses(content: str) -> List[str]:
+    return [c.strip().rstrip("。") for c in re.split(r"[；;]", content) if c.strip().rstrip("。")]
+
+
+def parse_clause(clause: str) -> dict:
+    """
+    单个分句 -> 结构化字段（抽不出的字段为 None，原句保留在 clause）：
+    - 价格：“成人108元/人”“出租车约15–30元”“免费”
+    - 季节：“旺季（4–10月）”“4月1日–10月31日”
+    - 时间：“8:30–17:00（16:00停止入园）”
+    - 交通：方式（公交 / 自驾 ...）与“车程约20分钟”
+    """
+    row: dict = {"clause": clause}
+
+    season = _SEASON.search(clause)
+    if season is not None:
+        row["season"] = season.group(1)
+        if season.group(2):
+            row["month_from"], row["month_to"] = int(season.group(2)), int(season.group(3))
+        rest = clause[:season.start()] + clause[season.end():]
+    else:
+        months = _MONTH_RANGE.search(clause)
+        if months is not None:
+            row["month_from"], row["month_to"] = int(months.group(1)), int(months.group(2))
+        rest = clause
+
+    price = _PRICE.search(rest)
+    if price is not None:
+        row["price_min"] = float(price.group(1))
+        row["price_max"] = float(price.group(2) or price.group(1))
+        row["unit"] = price.group(3) or ""
+        label = rest[:price.start()]
+    elif "免费" in rest or "免门票" in rest:
+        row["price_min"] = row["price_max"] = 0.0
+        label = rest.replace("免门票", "").replace("免费", "")
+    else:
+        label = rest
+
+    hours = _HOURS.search(rest)
+    if hours is not None:
+        row["open_at"], row["close_at"] = hours.group(1), hours.group(2)
+        if price is None:
+            label = rest[:hours.start()]
+    last_entry = _LAST_ENTRY.search(rest)
+    if last_entry is not None:
+        row["last_entry"] = last_entry.group(1)
+
+    duration = _DURATION.search(rest)
+    if duration is not None:
+        value = float(duration.group(1))
+        row["minutes"] = value * 60 if duration.group(2) == "小时" else value
+    mode = next((m for m in MODES if m in rest), None)
+    if mode is not None:
+        row["mode"] = mode
+
+    audiences = [a for a, words in AUDIENCE_ALIASES.items() if any(w in clause for w in words)]
+    if audiences:
+        row["audience"] = ",".join(audiences)
+    row["label"] = label.strip(" ，,：:") or None
+    return row
+
+
+def fact_rows(docs: Sequence, graph: EntityGraph) -> Iterable[dict]:
+    """
+    docs 与 FAISS 行号一一对应；只抽取 FACT_TYPES 的条目。
+    “承德站-到避暑山庄-最省钱走法”这类路线条目归到目的地景点下
+    """
+    for pos, doc in enumerate(docs):
+        meta = doc.metadata
+        if meta.get("type") not in FACT_TYPES:
+            continue
+        name = meta.get("name", "")
+        entity = graph.entity(pos)
+        origin = None
+        route = _ROUTE_NAME.match(name)
+        if route is not None:
+            origin, entity = entity_name(route.group(1)), entity_name(route.group(2))
+
+        content = doc.page_content.split("【内容】", 1)[-1]
+        for clause in split_clauses(content):
+            row = parse_clause(clause)
+            if origin is not None:
+                row["label"] = f"{origin}出发" + (f"：{row['label']}" if row.get("label") else "")
+            row.update({
+                "pos": pos,
+                "entity": entity,
+                "type": meta.get("type", ""),
+                "city": meta.get("city", ""),
+                "name": name,
+                "title": meta.get("title", name),
+                "doc_id": meta.get("id"),
+            })
+            yield row
+
+
+# =========================
+# 2) 事实表
+# =========================
+@dataclass
+class FactAnswer:
+    text: str
+    entities: List[str]
+    types: List[str]
+    rows: List[dict] = field(default_factory=list)
+
+    @property
+    def evidence(self) -> List[dict]:
+        """
+        与检索证据同格式，按条目去重
+        """
+        seen = set()
+        evidence = []
+        for row in self.rows:
+            if row["pos"] in seen:
+                continue
+            seen.add(row["pos"])
+            evidence.append({
+                "title": row["title"],
+                "type": row["type"],
+                "city": row["city"],
+                "name": row["name"],
+                "id": row["doc_id"],
+            })
+        return evidence
+
+
+def _in_window(month: int, start: Optional[int], end: Optional[int]) -> bool:
+    if start is None or end is None:
+        return True
+    if start <= end:
+        return start <= month <= end
+    # 跨年窗口，如淡季 11–3 月
+    return month >= start or month <= end
+
+
+class FactTable:
+    """
+    构建期从门票 / 开放时间 / 交通费用 / 观光车条目抽取的 SQLite 事实表（facts.sqlite）：
+    - 每个分句一行：景点、人群、季节窗口（起止月份）、价格区间、开放 / 停止入园时间、交通方式与时长
+    - 按 (entity, type) 建索引；在线只读打开，多进程共享同一个文件
+    - answer()：纯事实查询（“清东陵门票多少钱”“避暑山庄几点关门”）直接拼出回答，
+      需要规划 / 比较的问题返回 None，交给检索 + LLM
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # 长名称优先匹配（“山海关”与“老龙头”各自独立，“北戴河”不会吃掉“北戴河站”）
+        self.entities = sorted(
+            (r[0] for r in conn.execute("SELECT DISTINCT entity FROM facts")), key=len, reverse=True
+        )
+
+    @classmethod
+    def from_documents(cls, docs: Sequence, graph: Optional[EntityGraph] = None) -> "FactTable":
+        docs = list(docs)
+        graph = graph or EntityGraph.from_metadatas(d.metadata for d in docs)
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            f"INSERT INTO facts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            ([row.get(c) for c in COLUMNS] for row in fact_rows(docs, graph)),
+        )
+        conn.commit()
+        return cls(conn)
+
+    @classmethod
+    def load(cls, out_dir: str) -> Optional["FactTable"]:
+        path = os.path.join(out_dir, FACT_DB_NAME)
+        if not os.path.exists(path):
+            return None
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        return cls(sqlite3.connect(uri, uri=True, check_same_thread=False))
+
+    def save(self, out_dir: str) -> None:
+        tmp_path = os.path.join(out_dir, FACT_DB_NAME + ".tmp")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        dest = sqlite3.connect(tmp_path)
+        with self._lock:
+            self.conn.backup(dest)
+        dest.close()
+        os.replace(tmp_path, os.path.join(out_dir, FACT_DB_NAME))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    # ---------- 查询 ----------
+    def lookup(
+        self,
+        entity: str,
+        types: Sequence[str] = FACT_TYPES,
+        audience: Optional[str] = None,
+        month: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        某景点的事实行（按条目、分句顺序）：
+        - audience：只保留提到该人群的行；没有任何一行提到时保留全部
+        - month：去掉季节窗口不含该月的行；没有季节信息的行保留
+        """
+        marks = ", ".join("?" * len(types))
+        with self._lock:
+            rows = [dict(r) for r in self.conn.execute(
+                f"SELECT * FROM facts WHERE entity = ? AND type IN ({marks}) ORDER BY pos, id",
+                (entity, *types),
+            )]
+        if month is not None:
+            rows = [r for r in rows if _in_window(month, r["month_from"], r["month_to"])]
+        if audience is not None:
+            matched = [r for r in rows if audience in (r["audience"] or "")]
+            rows = matched or rows
+        return rows
+
+    def match_entities(self, query: str) -> List[str]:
+        found: List[str] = []
+        rest = query
+        for ent in self.entities:
+            if ent in rest:
+                found.append(ent)
+                rest = rest.replace(ent, " ")
+        # 按在问题中出现的先后
+        return sorted(found, key=query.find)
+
+    def route(self, query: str) -> Optional[Tuple[List[str], List[str], Optional[str], Optional[int]]]:
+        """
+        判断是否为纯事实查询，是则返回 (景点, 条目类型, 人群, 月份)
+        """
+        if any(w in query for w in PLANNING_WORDS):
+            return None
+        entities = self.match_entities(query)
+        if not entities:
+            return None
+
+        # 关键词只在景点名以外的部分匹配，避免“山海关门票”里的“关门”被当成问开放时间
+        text = query
+        for ent in entities:
+            text = text.replace(ent, "|")
+        types = [t for t, words in TYPE_KEYWORDS.items() if any(w in text for w in words)]
+        if not types and any(w in text for w in GENERIC_PRICE_WORDS):
+            types = ["门票"]
+        if not types:
+            return None
+        if any(w in text for w in ROUTE_WORDS) and "交通费用" not in types:
+            return None
+
+        audience = next((a for a, words in AUDIENCE_ALIASES.items() if any(w in text for w in words)), None)
+        month_match = _QUERY_MONTH.search(query)
+        month = int(month_match.group(1)) if month_match and 1 <= int(month_match.group(1)) <= 12 else None
+
+        # 去掉景点名、主题词、人群、月份与允许的问法后必须什么都不剩，否则问题里还有别的诉求
+        rest = query
+        lead = _ORIGIN_LEAD if "交通费用" in types else _ENTITY_LEAD
+        for ent in entities:
+            rest = re.sub(f"{lead}(?={re.escape(ent)})", "", rest)
+        words = [*entities, *ROUTE_WORDS, *GENERIC_PRICE_WORDS, *QUESTION_WORDS]
+        words += [w for t in TYPE_KEYWORDS.values() for w in t]
+        words += [w for ws in AUDIENCE_ALIASES.values() for w in ws]
+        for w in sorted(words, key=len, reverse=True):
+            rest = rest.replace(w, "")
+        rest = FILLER.sub("", _QUERY_MONTH.sub("", rest))
+        if rest:
+            return None
+        return entities, types, audience, month
+
+    def answer(self, query: str) -> Optional[FactAnswer]:
+        routed = self.route(query)
+        if routed is None:
+            return None
+        entities, types, audience, month = routed
+
+        blocks: List[str] = []
+        rows: List[dict] = []
+        for ent in entities:
+            for t in types:
+                found = self.lookup(ent, (t,), audience=audience, month=month)
+                if not found:
+                    # 有一项查不到就不算纯查询，避免只答一半
+                    return None
+                city = found[0]["city"]
+                header = f"📌 {ent} · {t}" + (f"（{city}）" if city else "")
+                blocks.append("\n".join([header] + [f"- {r['clause']}" for r in found]))
+                rows.extend(found)
+
+        text = "\n\n".join(blocks) + "\n\n（以上来自知识库原文，价格与时间以景区当日公告为准）"
+        return FactAnswer(text=text, entities=entities, types=types, rows=rows)
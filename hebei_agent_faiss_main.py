@@ -1,24 +1,51 @@
 from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import os
-from typing import Dict, List, Tuple, Union
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union,
+)
 from dotenv import load_dotenv
-from openai import OpenAI
 from langchain_core.embeddings import Embeddings
-from langchain_community.vectorstores import FAISS
-from sentence_transformers import SentenceTransformer
+import ann_index
+from answer_cache import AnswerCache, normalize_query
+from compact_docstore import CompactDocstore
+from context_packing import PackResult, count_tokens, pack_context
+from conversation_store import ConversationStore, create_conversation_store
+from embedding_backend import LocalEmbeddings
+from entity_graph import ENTITY_EXPANSION, EntityGraph
+from fact_table import FACT_ROUTER, FactTable
+from itinerary_planner import DAY_SPLIT_PATTERN, ITINERARY_PLANNER, PLAN_CONTEXT_BUDGET, Plan, TravelGraph
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from memory_report import mapped_files, process_memory
+from metadata_index import DEFAULT_FILTERS, MetadataIndex
+import tracing
+from tracing import annotate, carry_context, log, span
 
 # =========================
 # 0) 配置DeepSeek Chat
 # =========================
+# 模块导入时只读取配置；模型、向量库与 LLM 客户端均由 HebeiEngine 懒加载
 load_dotenv()
 
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url=os.getenv("DEEPSEEK_BASE_URL"),
-)
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 CHAT_MODEL = os.getenv("DEEPSEEK_CHAT_MODEL", "deepseek-chat")
 
 FAISS_DIR = os.getenv("FAISS_DIR", "faiss_hebei")
+# 每隔多少秒检查一次向量库是否被重建（重建后自动重新加载，并清空回答缓存）
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "30"))
+# 服务模式：只读 mmap 打开 index.faiss，同一台机器上的多个 worker 共享页缓存
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0").lower() in ("1", "true", "yes")
 
 # =========================
 # 0.1) UniAPI
@@ -27,54 +54,570 @@ UNIAPI_KEY = os.getenv("UNIAPI_KEY")
 UNIAPI_BASE = os.getenv("UNIAPI_BASE")
 UNIAPI_ENABLED = bool(UNIAPI_KEY and UNIAPI_BASE)
 
-uniapi_client = None
-if UNIAPI_ENABLED:
-    uniapi_client = OpenAI(api_key=UNIAPI_KEY, base_url=UNIAPI_BASE)
-
 UNIAPI_CHAT_MODEL = os.getenv("UNIAPI_CHAT_MODEL", "gpt-4o-mini")
 
 # =========================
-# 1) Embedding
+# 0.2) 并发与超时
 # =========================
-class LocalEmbeddings(Embeddings):
-    def __init__(self):
-        self.model = SentenceTransformer(
-            "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-            local_files_only=True
-        )
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+DEEPSEEK_TIMEOUT = float(os.getenv("DEEPSEEK_TIMEOUT", "60"))
+UNIAPI_TIMEOUT = float(os.getenv("UNIAPI_TIMEOUT", "30"))
+# embedding + FAISS 检索（CPU 密集）使用的线程数
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+# UniAPI 润色方式：pipelined = 按 Day 分段、边生成边润色；whole = 整段生成完再润色
+UNIAPI_ENHANCE_MODE = os.getenv("UNIAPI_ENHANCE_MODE", "pipelined")
 
-    def embed_documents(self, texts):
-        return self.model.encode(texts, show_progress_bar=False).tolist()
+T = TypeVar("T")
 
-    def embed_query(self, text):
-        return self.model.encode([text], show_progress_bar=False)[0].tolist()
+# =========================
+# 1) Embedding
+# =========================
+# LocalEmbeddings 与 build_faiss_hebei.py 共用（embedding_backend.py）：
+# EMBED_ENGINE=torch（fp32，默认）/ onnx-int8（量化 ONNX，CPU 上查询编码更快），EMBED_THREADS 控制前向线程数
 
 # =========================
 # 2) 加载 FAISS 向量库
 # =========================
-def load_faiss():
-    embeddings = LocalEmbeddings()
-    if not os.path.isdir(FAISS_DIR):
+def mmap_io_flags() -> int:
+    """
+    只读 mmap 的 faiss 读取标志；IO_FLAG_MMAP_IFC 让 Flat 索引直接引用文件中的向量，
+    不再复制到进程私有内存（旧版 faiss 没有该标志时退回 IO_FLAG_MMAP）
+    """
+    import faiss
+
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return flag | faiss.IO_FLAG_READ_ONLY
+
+
+def load_faiss(
+    faiss_dir: str = FAISS_DIR,
+    embeddings: Optional[Embeddings] = None,
+    mmap: bool = False,
+):
+    """
+    - 文档内容来自列式 docstore（无 pickle），命中时才解码为 Document
+    - mmap=False：索引读入进程私有内存
+    - mmap=True：索引与 docstore 以只读 mmap 打开，页面来自系统页缓存，多进程共享同一份
+    - HNSW / IVF 索引按 manifest 中的参数设置默认 ef_search / nprobe（这两个参数不随索引文件保存）
+    - 旧版本构建的向量库（只有 index.pkl）仍可加载，建议重新运行 build_faiss_hebei.py
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    if embeddings is None:
+        embeddings = LocalEmbeddings()
+    if not os.path.isdir(faiss_dir):
         raise FileNotFoundError(
-            f"未找到向量库目录 {FAISS_DIR}，请先运行 build_faiss_hebei.py"
+            f"未找到向量库目录 {faiss_dir}，请先运行 build_faiss_hebei.py"
         )
+    docstore = CompactDocstore.load(faiss_dir, mmap_files=mmap)
+    if docstore is not None:
+        index_path = os.path.join(faiss_dir, "index.faiss")
+        try:
+            index = faiss.read_index(index_path, mmap_io_flags() if mmap else 0)
+        except RuntimeError as e:
+            # 个别索引类型 / faiss 版本不支持 mmap 读取时退回普通读取
+            log(f"[提示] 无法以 mmap 方式读取索引（{e}），改为普通读取")
+            index = faiss.read_index(index_path)
+        ann_index.apply_search_defaults(index, read_index_config(faiss_dir)["params"])
+        return FAISS(embeddings, index, docstore, docstore.index_to_docstore_id())
+
+    log(f"[提示] {faiss_dir} 为旧版 pickle docstore，重新构建后可加速加载并节省内存")
     return FAISS.load_local(
-        FAISS_DIR,
+        faiss_dir,
         embeddings,
         allow_dangerous_deserialization=True
     )
 
 
-vectorstore = load_faiss()
+def read_index_config(faiss_dir: str = FAISS_DIR) -> dict:
+    """
+    构建时写入 manifest 的索引类型与参数；旧 manifest 或无 manifest 时为 Flat
+    """
+    manifest_path = os.path.join(faiss_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            config = json.load(f).get("index")
+        if config:
+            return config
+    return {"type": "flat", "params": {}}
+
+
+def read_index_version(faiss_dir: str = FAISS_DIR) -> Optional[str]:
+    """
+    向量库版本：manifest 内容哈希（无 manifest 时退化为 index.faiss 的修改时间）。
+    用于判断向量库是否被重建过。
+    """
+    manifest_path = os.path.join(faiss_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:16]
+    index_path = os.path.join(faiss_dir, "index.faiss")
+    if os.path.exists(index_path):
+        return f"mtime-{os.path.getmtime(index_path):.0f}"
+    return None
+
+# =========================
+# 2.1) 引擎：懒加载 + 预热
+# =========================
+class HebeiEngine:
+    """
+    持有模型、向量库与 LLM 客户端，全部在第一次使用时创建（线程安全，只创建一次）。
+    - warmup()：在指定时机提前加载，可放到后台线程
+    - startup_report()：各组件加载耗时
+    - answer_cache：回答缓存，加载向量库时绑定其版本
+    - LLM 客户端为带连接池的异步客户端，统一运行在引擎自己的事件循环线程上；
+      embedding 与 FAISS 检索放到线程池执行
+    """
+
+    COMPONENTS = (
+        "embeddings", "vectorstore", "meta_index", "lexical_index", "entity_graph", "fact_table",
+        "travel_graph", "async_client", "async_uniapi_client",
+    )
+    # 随向量库一起重建 / 重新加载的组件
+    INDEX_COMPONENTS = (
+        "vectorstore", "meta_index", "lexical_index", "entity_graph", "fact_table", "travel_graph",
+    )
+
+    def __init__(
+        self,
+        faiss_dir: str = FAISS_DIR,
+        deepseek_api_key: Optional[str] = DEEPSEEK_API_KEY,
+        deepseek_base_url: Optional[str] = DEEPSEEK_BASE_URL,
+        chat_model: str = CHAT_MODEL,
+        uniapi_key: Optional[str] = UNIAPI_KEY,
+        uniapi_base: Optional[str] = UNIAPI_BASE,
+        uniapi_chat_model: str = UNIAPI_CHAT_MODEL,
+        mmap: bool = FAISS_MMAP,
+    ):
+        self.faiss_dir = faiss_dir
+        self.mmap = mmap
+        self.deepseek_api_key = deepseek_api_key
+        self.deepseek_base_url = deepseek_base_url
+        self.chat_model = chat_model
+        self.uniapi_key = uniapi_key
+        self.uniapi_base = uniapi_base
+        self.uniapi_chat_model = uniapi_chat_model
+        self.uniapi_enabled = bool(uniapi_key and uniapi_base)
+
+        self._components: Dict[str, object] = {}
+        self._locks = {name: threading.Lock() for name in self.COMPONENTS}
+        self._timings: Dict[str, float] = {}
+        self._warmup_thread: Optional[threading.Thread] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.answer_cache = AnswerCache()
+        self._last_index_check = time.time()
+
+        # 检索路径统计：fast = 词法直达（不经过 embedding），hybrid = 向量 + 词法 RRF 融合
+        self._retrieval_stats = {path: {"count": 0, "total_ms": 0.0} for path in ("fast", "hybrid")}
+        self._stats_lock = threading.Lock()
+        # 流式回答的首 token 时间（从收到问题算起）
+        self._ttft = {"count": 0, "total_ms": 0.0, "last_ms": None}
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        if name in self._components:
+            return self._components[name]
+        with self._locks[name]:
+            if name not in self._components:
+                start = time.perf_counter()
+                self._components[name] = factory()
+                self._timings[name] = time.perf_counter() - start
+        return self._components[name]
+
+    @property
+    def embeddings(self) -> LocalEmbeddings:
+        # 构造 LocalEmbeddings 不会加载模型，这里强制加载，耗时计入 startup_report
+        return self._get("embeddings", lambda: LocalEmbeddings().load())
+
+    @property
+    def vectorstore(self):
+        def create():
+            vs = load_faiss(self.faiss_dir, self.embeddings, mmap=self.mmap)
+            self.answer_cache.bind_index(read_index_version(self.faiss_dir))
+            return vs
+        return self._get("vectorstore", create)
+
+    def _all_documents(self) -> Iterator:
+        vs = self.vectorstore
+        for i in range(len(vs.index_to_docstore_id)):
+            yield vs.docstore.search(vs.index_to_docstore_id[i])
+
+    @property
+    def meta_index(self) -> MetadataIndex:
+        def create():
+            index = MetadataIndex.load(self.faiss_dir)
+            if index is None:
+                # 旧版本构建的向量库没有 meta_index.json，从 docstore 现场生成
+                index = MetadataIndex.from_metadatas(d.metadata for d in self._all_documents())
+            return index
+        return self._get("meta_index", create)
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        def create():
+            index = LexicalIndex.load(self.faiss_dir)
+            if index is None:
+                index = LexicalIndex.from_documents(self._all_documents())
+            return index
+        return self._get("lexical_index", create)
+
+    @property
+    def entity_graph(self) -> EntityGraph:
+        def create():
+            graph = EntityGraph.load(self.faiss_dir)
+            if graph is None:
+                graph = EntityGraph.from_metadatas(d.metadata for d in self._all_documents())
+            return graph
+        return self._get("entity_graph", create)
+
+    @property
+    def fact_table(self) -> FactTable:
+        def create():
+            table = FactTable.load(self.faiss_dir)
+            if table is None:
+                # 旧版本构建的向量库没有 facts.sqlite，在内存中现场抽取
+                table = FactTable.from_documents(self._all_documents(), self.entity_graph)
+            return table
+        return self._get("fact_table", create)
+
+    @property
+    def travel_graph(self) -> TravelGraph:
+        def create():
+            graph = TravelGraph.load(self.faiss_dir)
+            if graph is None:
+                graph = TravelGraph.from_documents(self._all_documents(), self.entity_graph, self.fact_table)
+            return graph
+        return self._get("travel_graph", create)
+
+    def record_retrieval(self, path: str, seconds: float) -> None:
+        with self._stats_lock:
+            stats = self._retrieval_stats[path]
+            stats["count"] += 1
+            stats["total_ms"] += seconds * 1000
+
+    def retrieval_stats(self) -> dict:
+        """
+        各检索路径的调用次数、占比与平均耗时（毫秒）
+        """
+        with self._stats_lock:
+            total = sum(s["count"] for s in self._retrieval_stats.values())
+            return {
+                path: {
+                    "count": s["count"],
+                    "share": round(s["count"] / total, 4) if total else 0.0,
+                    "avg_ms": round(s["total_ms"] / s["count"], 3) if s["count"] else 0.0,
+                }
+                for path, s in self._retrieval_stats.items()
+            }
+
+    def record_ttft(self, seconds: float) -> None:
+        with self._stats_lock:
+            self._ttft["count"] += 1
+            self._ttft["total_ms"] += seconds * 1000
+            self._ttft["last_ms"] = round(seconds * 1000, 1)
+
+    def ttft_stats(self) -> dict:
+        with self._stats_lock:
+            count = self._ttft["count"]
+            return {
+                "count": count,
+                "avg_ms": round(self._ttft["total_ms"] / count, 1) if count else 0.0,
+                "last_ms": self._ttft["last_ms"],
+            }
+
+    def reload_index(self) -> None:
+        """
+        向量库重建后调用：下次访问时重新加载，并使回答缓存失效
+        """
+        for name in self.INDEX_COMPONENTS:
+            with self._locks[name]:
+                self._components.pop(name, None)
+                self._timings.pop(name, None)
+
+    def maybe_reload_index(self) -> bool:
+        """
+        按 INDEX_CHECK_INTERVAL 节流检查磁盘上的向量库版本，变化时重新加载
+        """
+        if not self.is_loaded("vectorstore"):
+            return False
+        now = time.time()
+        if now - self._last_index_check < INDEX_CHECK_INTERVAL:
+            return False
+        self._last_index_check = now
+        if read_index_version(self.faiss_dir) == self.answer_cache.index_version:
+            return False
+        self.reload_index()
+        return True
+
+    @staticmethod
+    def _create_async_client(api_key: Optional[str], base_url: Optional[str]):
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                ),
+            ),
+        )
+
+    @property
+    def async_client(self):
+        return self._get(
+            "async_client",
+            lambda: self._create_async_client(self.deepseek_api_key, self.deepseek_base_url),
+        )
+
+    @property
+    def async_uniapi_client(self):
+        def create():
+            if not self.uniapi_enabled:
+                return None
+            return self._create_async_client(self.uniapi_key, self.uniapi_base)
+        return self._get("async_uniapi_client", create)
+
+    # ---------- 事件循环与线程池 ----------
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        引擎专用事件循环（后台守护线程）：异步 LLM 客户端的连接池绑定在这个循环上
+        """
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(
+                        target=loop.run_forever, name="hebei-engine-loop", daemon=True
+                    ).start()
+                    self._loop = loop
+        return self._loop
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._loop_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=RETRIEVAL_WORKERS, thread_name_prefix="hebei-retrieval"
+                    )
+        return self._executor
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        在同步代码中执行协程（提交到引擎事件循环并阻塞等待结果）
+        """
+        return asyncio.run_coroutine_threadsafe(
+            carry_context(coro, contextvars.copy_context()), self.loop
+        ).result()
+
+    async def on_loop(self, coro: Awaitable[T]) -> T:
+        """
+        从任意事件循环中调用：保证协程在引擎事件循环上执行（LLM 连接池只属于这个循环）
+        """
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            carry_context(coro, contextvars.copy_context()), self.loop
+        ))
+
+    async def aiter_on_loop(self, agen: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        on_loop 的异步迭代器版本：在引擎事件循环上迭代（如 LLM 流式输出），结果转发给当前循环
+        """
+        if asyncio.get_running_loop() is self.loop:
+            async for item in agen:
+                yield item
+            return
+
+        consumer_loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    consumer_loop.call_soon_threadsafe(items.put_nowait, ("item", item))
+            except BaseException as e:
+                consumer_loop.call_soon_threadsafe(items.put_nowait, ("error", e))
+            else:
+                consumer_loop.call_soon_threadsafe(items.put_nowait, ("end", None))
+
+        future = asyncio.run_coroutine_threadsafe(
+            carry_context(pump(), contextvars.copy_context()), self.loop
+        )
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """
+        在同步代码中消费异步迭代器（在引擎事件循环上迭代，逐条转交给调用线程）
+        """
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(("item", item))
+            except BaseException as e:
+                items.put(("error", e))
+            else:
+                items.put(("end", None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    async def in_executor(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        CPU 密集的同步函数（embedding / FAISS 检索）放到线程池执行，不阻塞事件循环；
+        当前 trace 随上下文一起带入线程池
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._components
+
+    def is_ready(self) -> bool:
+        """
+        全部组件均已加载，且 embedding 模型已真正载入（向量库热更新后会重新变为未就绪，直到再次加载）
+        """
+        embeddings = self._components.get("embeddings")
+        return all(self.is_loaded(name) for name in self.COMPONENTS) and bool(embeddings and embeddings.loaded)
+
+    def warmup(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        提前加载全部组件；background=True 时在后台线程加载并立即返回。
+        重复调用不会重复加载。
+        """
+        if not background:
+            for name in self.COMPONENTS:
+                getattr(self, name)
+            return None
+
+        def run():
+            # 后台预热失败不影响页面；首次请求时会再次尝试加载并抛出真实错误
+            for name in self.COMPONENTS:
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    log(f"[预热失败] {name}：{e}")
+
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            if not self.is_ready():
+                self._warmup_thread = threading.Thread(
+                    target=run, name="hebei-engine-warmup", daemon=True
+                )
+                self._warmup_thread.start()
+        return self._warmup_thread
+
+    def startup_report(self) -> Dict[str, Optional[float]]:
+        """
+        各组件加载耗时（秒），尚未加载的组件为 None
+        """
+        return {
+            name: round(self._timings[name], 3) if name in self._timings else None
+            for name in self.COMPONENTS
+        }
+
+    def memory_report(self) -> Optional[dict]:
+        """
+        本进程的 RSS / PSS / 独占（unique）/ 共享（shared）内存，以及 mmap 映射的索引文件占用；
+        非 Linux 平台返回 None
+        """
+        mem = process_memory()
+        if mem is None:
+            return None
+        mem["mmap"] = self.mmap
+        mem["index_files"] = mapped_files()
+        return mem
+
+    def format_startup_report(self) -> str:
+        lines = ["【启动耗时】"]
+        for name, seconds in self.startup_report().items():
+            lines.append(f"  {name}: {'未加载' if seconds is None else f'{seconds:.3f}s'}")
+        return "\n".join(lines)
+
+
+engine = HebeiEngine()
+
+
+def get_engine() -> HebeiEngine:
+    return engine
+
+
+def configure_engine(**kwargs) -> HebeiEngine:
+    """
+    用新的配置替换默认引擎（如切换向量库目录、指向本地 LLM 桩服务）
+    """
+    global engine
+    engine = HebeiEngine(**kwargs)
+    return engine
+
+
+def get_embedding_cache_stats() -> dict:
+    """
+    Embedding 缓存命中统计（hits / misses / hit_rate / entries / bytes）
+    """
+    return get_engine().embeddings.cache.stats()
 
 # =========================
 # 3) 全局状态：对话记忆
 # =========================
-conversation_memory: Dict[str, List[Tuple[str, str]]] = {}
+# 有界会话存储：每个会话最近几轮 + 空闲过期 + LRU 淘汰；
+# CONVERSATION_BACKEND=sqlite 时多进程共享、重启不丢失
+conversation_store: ConversationStore = create_conversation_store()
+
+
+def get_conversation_store() -> ConversationStore:
+    return conversation_store
+
+
+def configure_conversation_store(backend: str, **kwargs) -> ConversationStore:
+    """
+    替换默认会话存储（如切换为 SQLite、调整轮数 / 过期时间）
+    """
+    global conversation_store
+    conversation_store = create_conversation_store(backend, **kwargs)
+    return conversation_store
+
+
+def _remember(user_id: str, user_query: str, answer: str) -> None:
+    conversation_store.append(user_id, user_query, answer)
+
+
+def clear_history(user_id: str) -> None:
+    conversation_store.clear(user_id)
 
 
 def get_history_text(user_id: str, last_n: int = 3) -> str:
-    history = conversation_memory.get(user_id, [])[-last_n:]
+    history = conversation_store.history(user_id, last_n)
     if not history:
         return "无"
     return "\n".join([f"用户：{q}\n智能体：{a}" for q, a in history])
@@ -82,36 +625,61 @@ def get_history_text(user_id: str, last_n: int = 3) -> str:
 # =========================
 # 4) FAISS 语义检索
 # =========================
-def retrieve_relevant_knowledge(
-    query: str,
-    user_id: str,
-    top_k: int = 5,
-    return_evidence: bool = False
-) -> Union[str, Tuple[str, List[dict]]]:
+def filtered_search_batch(
+    query_vectors: List[List[float]],
+    k: int,
+    filters: Optional[dict] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> List[List[int]]:
     """
-    使用 FAISS + 本地 embedding 进行语义检索
-    - 默认返回拼接后的知识内容（字符串）
-    - return_evidence=True 时，同时返回 Top-K 命中证据（title等）
+    带元数据过滤的向量检索：过滤条件编译为 IDSelector 在 FAISS 内部生效，
+    只做一次大小为 k 的检索，不再 k*3 过量召回后在 Python 里过滤。
+    多个问题向量在一次 FAISS 调用中完成检索，返回每个问题命中的 FAISS 行号。
+    ef_search（HNSW）/ nprobe（IVF）只作用于本次检索，未给出时用 manifest 中的默认值。
     """
-    history_text = get_history_text(user_id)
-    enhanced_query = f"{query}\n（历史对话：{history_text}）"
+    import numpy as np
 
-    raw_results = vectorstore.similarity_search(enhanced_query, k=top_k * 3)
-    if not raw_results:
-        if return_evidence:
-            return "无相关信息", []
-        return "无相关信息"
+    eng = get_engine()
+    with span("filter") as s:
+        selector, candidates = eng.meta_index.selector(filters)
+        s.attrs["candidates"] = candidates
+    if candidates == 0 or not query_vectors:
+        return [[] for _ in query_vectors]
+
+    x = np.asarray(query_vectors, dtype=np.float32)
+    k = min(k, candidates)
+    index = eng.vectorstore.index
+    params = ann_index.search_parameters(index, selector, ef_search=ef_search, nprobe=nprobe)
+    with span("faiss_search", queries=len(query_vectors), k=k):
+        if params is None:
+            _, indices = index.search(x, k)
+        else:
+            _, indices = index.search(x, k, params=params)
+    return [[int(i) for i in row if i != -1] for row in indices]
+
+
+def filtered_search(
+    query_vector: List[float],
+    k: int,
+    filters: Optional[dict] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> List[int]:
+    return filtered_search_batch([query_vector], k, filters, ef_search=ef_search, nprobe=nprobe)[0]
+
+
+def docs_at(positions: List[int]) -> List:
+    vs = get_engine().vectorstore
+    return [vs.docstore.search(vs.index_to_docstore_id[i]) for i in positions]
 
-    filtered = []
-    for doc in raw_results:
-        title = doc.metadata.get("title", "")
-        if title.startswith("城市"):
-            continue
-        filtered.append(doc)
-        if len(filtered) >= top_k:
-            break
 
-    final_results = filtered if filtered else raw_results[:top_k]
+def format_results(final_results: List) -> Tuple[str, List[dict]]:
+    """
+    命中文档 -> (拼接后的知识内容, 证据列表)
+    """
+    if not final_results:
+        return "无相关信息", []
 
     evidence = []
     for doc in final_results:
@@ -123,29 +691,176 @@ def retrieve_relevant_knowledge(
             "id": doc.metadata.get("id", None),
         })
 
-    print("\n【向量检索命中 Top-K 条目（过滤后）】")
-    for i, e in enumerate(evidence, 1):
-        print(f"[命中{i}] {e.get('title')}")
-    print("================================\n")
-
     merged_text = "\n\n".join([doc.page_content for doc in final_results])
+    return merged_text, evidence
+
+
+def _with_history(query: str, history_text: str) -> str:
+    return f"{query}\n（历史对话：{history_text}）"
+
+
+def arrange_by_entity(ranking: List[int], query: str, top_k: int, allowed=None) -> List[int]:
+    """
+    融合后的候选按景点整理（见 entity_graph.EntityGraph.arrange）：
+    同景点最多占 ENTITY_MAX_PER 个名额，问题涉及门票 / 交通等主题时补入该景点的对应子条目。
+    兄弟条目在构建期已预先算好，这里只做列表下标访问，不需要额外的过量召回。
+    """
+    if not ENTITY_EXPANSION:
+        return list(ranking)[:top_k]
+    eng = get_engine()
+    with span("entity") as s:
+        positions = eng.entity_graph.arrange(
+            ranking, top_k, query, focus=eng.lexical_index.match_entity(query), allowed=allowed
+        )
+        head = list(ranking)[:top_k]
+        s.attrs["expanded"] = sum(1 for p in positions if p not in head)
+        s.attrs["changed"] = positions != head
+    return positions
+
+
+def retrieve_relevant_knowledge(
+    query: str,
+    user_id: str,
+    top_k: int = 5,
+    return_evidence: bool = False,
+    filters: Optional[dict] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> Union[str, Tuple[str, List[dict]]]:
+    """
+    使用 FAISS + 本地 embedding 进行语义检索
+    - 默认返回拼接后的知识内容（字符串）
+    - return_evidence=True 时，同时返回 Top-K 命中证据（title等）
+    - filters：元数据过滤条件，如 {"type": ["门票", "交通"], "city": ["承德"]}；
+      默认过滤泛“城市-*”条目
+    - 问题直接点名景点时走词法直达，不经过 embedding；其余问题向量 + 词法 RRF 融合
+    - ef_search / nprobe：近似索引（HNSW / IVF）的检索期参数，越大召回越高、越慢；
+      Flat 索引忽略，未给出时用构建时写入 manifest 的默认值
+    """
+    positions, path = _retrieve_positions(query, user_id, top_k, filters, ef_search, nprobe)
+    merged_text, evidence = format_results(docs_at(positions))
+    if not evidence:
+        if return_evidence:
+            return "无相关信息", []
+        return "无相关信息"
+
+    if tracing.VERBOSE:
+        log(f"\n【检索命中 Top-K 条目（{'词法直达' if path == 'fast' else '向量+词法融合'}）】")
+        for i, e in enumerate(evidence, 1):
+            log(f"[命中{i}] {e.get('title')}")
+        log("================================\n")
 
     if return_evidence:
         return merged_text, evidence
     return merged_text
 
-# =========================
-# 4.1) UniAPI 语言增强
-# =========================
-def enhance_with_uniapi(answer: str, user_query: str) -> str:
+
+def _retrieve_positions(
+    query: str,
+    user_id: str,
+    top_k: int,
+    filters: Optional[dict],
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> Tuple[List[int], str]:
     """
-    注意：只做表达增强，不引入新信息、不新增事实。
-    UniAPI 失败时自动回退为原始回答。
+    返回 (命中文档下标, 检索路径 fast / hybrid)；fast 路径不调用 embedding 模型
+    """
+    eng = get_engine()
+    filters = DEFAULT_FILTERS if filters is None else filters
+    allowed = eng.meta_index.allowed(filters)
+
+    start = time.perf_counter()
+    with span("lexical_fast_path") as s:
+        positions = eng.lexical_index.fast_path(query, top_k, allowed)
+        s.attrs["hit"] = positions is not None
+    if positions is not None:
+        path = "fast"
+    else:
+        path = "hybrid"
+        with span("history"):
+            enhanced_query = _with_history(query, get_history_text(user_id))
+
+        with span("encode"):
+            query_vector = eng.embeddings.embed_query(enhanced_query)
+        dense = filtered_search(query_vector, top_k, filters, ef_search=ef_search, nprobe=nprobe)
+        with span("lexical"):
+            lexical = eng.lexical_index.search(query, top_k, allowed)
+            positions = reciprocal_rank_fusion([dense, lexical])
+    positions = arrange_by_entity(positions, query, top_k, allowed)
+    eng.record_retrieval(path, time.perf_counter() - start)
+    return positions, path
+
+
+def retrieve_batch(
+    queries: List[str],
+    top_k: int = 5,
+    filters: Optional[List[Optional[dict]]] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    return_paths: bool = False,
+) -> List[tuple]:
+    """
+    批量检索（无对话历史，结果与新会话调用 retrieve_relevant_knowledge 一致）：
+    词法直达之外的问题一次性批量 embedding，相同过滤条件的问题合并为一次多查询 FAISS 检索。
+    filters 为与 queries 等长的过滤条件列表，None 表示全部使用默认过滤。
+    返回每个问题的 (知识内容, 证据)；return_paths=True 时为 (知识内容, 证据, 检索路径)。
     """
-    if not UNIAPI_ENABLED or not uniapi_client:
-        return answer
+    eng = get_engine()
+    if filters is None:
+        filters = [None] * len(queries)
+    filters = [DEFAULT_FILTERS if f is None else f for f in filters]
+
+    start = time.perf_counter()
+    positions: List[Optional[List[int]]] = []
+    dense_needed: List[int] = []
+    for i, (query, flt) in enumerate(zip(queries, filters)):
+        allowed = eng.meta_index.allowed(flt)
+        fast = eng.lexical_index.fast_path(query, top_k, allowed)
+        positions.append(None if fast is None else arrange_by_entity(fast, query, top_k, allowed))
+        if fast is None:
+            dense_needed.append(i)
+    fast_count = len(queries) - len(dense_needed)
+    fast_seconds = time.perf_counter() - start
+
+    if dense_needed:
+        with span("encode", queries=len(dense_needed)):
+            vectors = eng.embeddings.embed_documents(
+                [_with_history(queries[i], "无") for i in dense_needed]
+            )
+        groups: Dict[str, List[int]] = {}
+        for j, i in enumerate(dense_needed):
+            groups.setdefault(json.dumps(filters[i], ensure_ascii=False, sort_keys=True), []).append(j)
+        for members in groups.values():
+            flt = filters[dense_needed[members[0]]]
+            allowed = eng.meta_index.allowed(flt)
+            dense_rows = filtered_search_batch(
+                [vectors[j] for j in members], top_k, flt, ef_search=ef_search, nprobe=nprobe
+            )
+            for j, dense in zip(members, dense_rows):
+                i = dense_needed[j]
+                lexical = eng.lexical_index.search(queries[i], top_k, allowed)
+                positions[i] = arrange_by_entity(
+                    reciprocal_rank_fusion([dense, lexical]), queries[i], top_k, allowed
+                )
 
-    prompt = f"""
+    # 批量检索无法拆出单条耗时，按路径均摊计入统计
+    hybrid_seconds = time.perf_counter() - start - fast_seconds
+    for _ in range(fast_count):
+        eng.record_retrieval("fast", fast_seconds / max(len(queries), 1))
+    for _ in dense_needed:
+        eng.record_retrieval("hybrid", hybrid_seconds / len(dense_needed))
+    results = [format_results(docs_at(p or [])) for p in positions]
+    if return_paths:
+        dense = set(dense_needed)
+        return [(*r, "hybrid" if i in dense else "fast") for i, r in enumerate(results)]
+    return results
+
+# =========================
+# 4.1) UniAPI 语言增强
+# =========================
+def build_enhance_prompt(answer: str, user_query: str) -> str:
+    return f"""
 你是旅游产品的“文案润色助手”。请对下面【原始回答】进行优化，使其更像商业产品的输出：
 - 保留原始事实
 - 结构更清晰：用小标题 + 分点
@@ -161,68 +876,151 @@ def enhance_with_uniapi(answer: str, user_query: str) -> str:
 只输出润色后的最终回答正文，不要解释。
 """.strip()
 
-    try:
-        resp = uniapi_client.chat.completions.create(
-            model=UNIAPI_CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=900
+
+def build_section_enhance_prompt(section: str, user_query: str) -> str:
+    return f"""
+你是旅游产品的“文案润色助手”。下面是一份多日行程中的【其中一段】，请只润色这一段：
+- 保留原始事实，保留开头的“Day N：”标题原样不动
+- 结构更清晰：用小标题 + 分点
+- 更“保姆级”：给出操作步骤、注意事项、节奏建议
+- 语言更自然更吸引人，但不夸张
+- 不要补写其他天的内容，不要加开场白或总结
+
+用户问题：
+{user_query}
+
+原始片段（事实来源于知识库）：
+{section}
+
+只输出润色后的该段正文，不要解释。
+""".strip()
+
+
+def _annotate_usage(usage) -> None:
+    if usage is not None:
+        annotate(
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
         )
-        return resp.choices[0].message.content.strip()
 
-    except Exception as e:
-        print("[UniAPI 增强失败，已回退为本地回答]")
-        print("原因：", e)
-        return answer
+
+async def _polish_with_uniapi(prompt: str, fallback: str) -> str:
+    eng = get_engine()
+    uniapi_client = eng.async_uniapi_client
+    if not uniapi_client:
+        return fallback
+
+    with span("uniapi", model=eng.uniapi_chat_model) as s:
+        try:
+            resp = await eng.on_loop(uniapi_client.chat.completions.create(
+                model=eng.uniapi_chat_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=900,
+                timeout=UNIAPI_TIMEOUT,
+            ))
+            _annotate_usage(getattr(resp, "usage", None))
+            return resp.choices[0].message.content.strip()
+
+        except Exception as e:
+            s.attrs.update(fallback=True, error=f"{type(e).__name__}: {e}")
+            log("[UniAPI 增强失败，已回退为本地回答]")
+            log("原因：", e)
+            return fallback
+
+
+async def enhance_with_uniapi_async(answer: str, user_query: str) -> str:
+    """
+    注意：只做表达增强，不引入新信息、不新增事实。
+    UniAPI 失败（含超时）时自动回退为原始回答。
+    """
+    return await _polish_with_uniapi(build_enhance_prompt(answer, user_query), answer)
+
+
+def enhance_with_uniapi(answer: str, user_query: str) -> str:
+    """
+    enhance_with_uniapi_async 的同步封装
+    """
+    return get_engine().run(enhance_with_uniapi_async(answer, user_query))
+
+
+# =========================
+# 4.2) 按 Day 分段的流水线润色
+# =========================
+def section_starts(text: str) -> List[int]:
+    """
+    各段起始位置：Day 标题所在位置；第一个标题前若有非空内容，作为独立的开头段
+    """
+    starts = [m.start() for m in DAY_SPLIT_PATTERN.finditer(text)]
+    if not starts or text[:starts[0]].strip():
+        starts.insert(0, 0)
+    return starts
+
+
+class SectionEnhancer:
+    """
+    边接收 DeepSeek 增量文本边润色：每当出现下一个“Day N：”标题，上一段即已完整，
+    立刻提交给 UniAPI；DeepSeek 继续生成后面几天的同时，前面的段落已在润色。
+    finish() 按原顺序拼回全文，单段失败只回退该段原文。
+    """
+
+    def __init__(self, user_query: str):
+        self.user_query = user_query
+        self.buffer = ""
+        self._tasks: List[asyncio.Task] = []
+
+    def _launch(self, section: str, whole: bool) -> None:
+        if whole:
+            coro = enhance_with_uniapi_async(section.strip(), self.user_query)
+        else:
+            coro = _polish_with_uniapi(
+                build_section_enhance_prompt(section.strip(), self.user_query), section.strip()
+            )
+        self._tasks.append(asyncio.ensure_future(coro))
+
+    def feed(self, delta: str) -> None:
+        self.buffer += delta
+        starts = section_starts(self.buffer)
+        while len(self._tasks) < len(starts) - 1:
+            i = len(self._tasks)
+            self._launch(self.buffer[starts[i]:starts[i + 1]], whole=False)
+
+    async def finish(self) -> str:
+        starts = section_starts(self.buffer)
+        last = self.buffer[starts[len(self._tasks)]:]
+        if last.strip():
+            # 整个回答只有一段（没有 Day 结构）时按整段润色，与 whole 模式一致
+            self._launch(last, whole=not self._tasks)
+        sections = await asyncio.gather(*self._tasks)
+        return "\n\n".join(s for s in sections if s)
 
 # =========================
 # 5) 核心问答函数
 # =========================
-def get_hebei_answer(
-    user_query: str,
-    user_id: str = "default",
-    use_llm_enhance: bool = False,
-    return_evidence: bool = False
-) -> Union[str, Tuple[str, List[dict]]]:
+def precheck_query(user_query: str) -> Optional[str]:
     """
-    - use_llm_enhance: True 时启用 UniAPI 表达增强（仅润色）
-    - return_evidence: True 时返回 (answer, evidence)
+    空问题 / 过于宽泛的问题直接返回引导话术，不进入检索
     """
-    user_query = user_query.strip()
     if not user_query:
-        msg = "😯 你还没输入问题哦！可以问比如“承德避暑山庄门票”“保定驴肉火烧哪家正宗”～"
-        return (msg, []) if return_evidence else msg
+        return "😯 你还没输入问题哦！可以问比如“承德避暑山庄门票”“保定驴肉火烧哪家正宗”～"
 
     too_vague = ["河北旅游", "河北好玩吗", "推荐什么", "怎么玩", "有啥好玩的"]
     if any(word == user_query for word in too_vague):
-        msg = (
+        return (
             "💡 你可以具体问这些哦：\n"
             "1. 景点类：XX景点门票 / 开放时间 / 怎么去\n"
             "2. 美食类：XX城市特色美食 / 推荐店铺\n"
             "3. 行程类：河北X日游（亲子 / 老人 / 情侣）\n"
             "4. 实用类：预约方式 / 避坑指南 / 交通攻略"
         )
-        return (msg, []) if return_evidence else msg
+    return None
 
-    # === FAISS 检索 ===
-    if return_evidence:
-        relevant_knowledge, evidence = retrieve_relevant_knowledge(
-            user_query, user_id=user_id, top_k=5, return_evidence=True
-        )
-    else:
-        relevant_knowledge = retrieve_relevant_knowledge(
-            user_query, user_id=user_id, top_k=5, return_evidence=False
-        )
-        evidence = []
 
-    if relevant_knowledge == "无相关信息":
-        msg = "😅 抱歉，我的知识库里暂时没有相关信息，可以换个问法试试～"
-        return (msg, evidence) if return_evidence else msg
+NO_KNOWLEDGE_MESSAGE = "😅 抱歉，我的知识库里暂时没有相关信息，可以换个问法试试～"
 
-    # === 回答生成 ===
-    history_text = get_history_text(user_id)
 
-    final_prompt = f"""
+def build_generation_prompt(relevant_knowledge: str, user_query: str) -> str:
+    return f"""
 你是一个【旅游产品级行程规划引擎】，不是聊天机器人。
 
 请根据【知识库内容】，为用户生成一份【可直接执行的河北旅游行程方案】，必须满足以下要求：
@@ -273,31 +1071,359 @@ def get_hebei_answer(
   “以上行程已补齐门票与交通信息，可直接作为出行计划使用。”
 
 【知识库内容如下】
-{{relevant_knowledge}}
+{relevant_knowledge}
 
 【用户需求】
-{{user_query}}
+{user_query}
 
 请直接输出最终行程正文。
 
 """.strip()
 
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[{"role": "user", "content": final_prompt}],
+
+def build_plan_prompt(plan_text: str, relevant_knowledge: str, user_query: str) -> str:
+    return f"""
+你是河北旅游行程撰写助手。下面的【行程骨架】已经由本地规划器按交通耗时排好了城市顺序、天数和每天的景点，
+请把它写成可直接执行的行程：
+
+- 严格按骨架输出，不增删景点、不调整顺序和天数
+- 每天以“Day N：”开头，包含：今日概览 / 🎟 门票与消费 / 🚗 交通方式 / ⚠️ 当天提醒，每部分 1–3 行
+- 门票、交通、开放时间只能来自骨架与【知识库内容】，缺少的信息写“以景区官方为准”
+- 骨架中的“机动 / 休整”日给出轻松的自由活动建议即可
+- 结尾只写一句总结，不要提问用户
+
+【行程骨架】
+{plan_text}
+
+【知识库内容】
+{relevant_knowledge}
+
+【用户需求】
+{user_query}
+""".strip()
+
+
+def _retrieve(user_query: str, user_id: str, filters: Optional[dict]) -> Tuple[str, List[dict], str]:
+    get_engine().maybe_reload_index()
+    positions, path = _retrieve_positions(user_query, user_id, 5, filters)
+    return (*format_results(docs_at(positions)), path)
+
+
+@dataclass
+class AnswerContext:
+    """
+    一次问答在调用 LLM 之前准备好的全部信息；
+    early_answer 非空时（引导话术 / 事实直答 / 无知识 / 缓存命中）无需调用 LLM
+    route：fact = 事实表直答，plan = 本地规划行程 + LLM 撰写，rag = 检索 + LLM
+    """
+    user_query: str
+    user_id: str
+    mode: str
+    route: str = "rag"
+    plan: Optional[Plan] = None
+    max_tokens: int = 900
+    evidence: List[dict] = field(default_factory=list)
+    prompt: str = ""
+    packing: Optional[PackResult] = None
+    early_answer: Optional[str] = None
+    cached: bool = False
+    # 词法直达命中时为 None：整条问答不调用 embedding 模型，回答缓存只做精确命中
+    query_vector: Optional[Callable[[], List[float]]] = None
+
+
+async def prepare_answer(
+    user_query: str,
+    user_id: str,
+    use_llm_enhance: bool,
+    filters: Optional[dict],
+    retrieved: Optional[Tuple[str, List[dict], str]] = None,
+) -> AnswerContext:
+    """
+    retrieved：已批量检索好的 (知识内容, 证据, 检索路径) 时跳过检索
+    """
+    user_query = user_query.strip()
+    mode = _mode(use_llm_enhance)
+    ctx = AnswerContext(user_query=user_query, user_id=user_id, mode=mode)
+
+    msg = precheck_query(user_query)
+    if msg is not None:
+        ctx.early_answer = msg
+        return ctx
+
+    eng = get_engine()
+
+    # === 事实直答：门票 / 开放时间 / 交通费用 / 观光车的纯查询不经过检索与 LLM ===
+    if FACT_ROUTER and not filters:
+        with span("fact_router") as s:
+            eng.maybe_reload_index()
+            fact = eng.fact_table.answer(user_query)
+            s.attrs["hit"] = fact is not None
+        if fact is not None:
+            ctx.route = "fact"
+            ctx.early_answer = fact.text
+            ctx.evidence = fact.evidence
+            _remember(user_id, user_query, fact.text)
+            return ctx
+
+    # === 行程规划：X 日游问题先在本地排好城市顺序与分天，LLM 只负责写成文字 ===
+    if ITINERARY_PLANNER and not filters:
+        with span("planner") as s:
+            ctx.plan = eng.travel_graph.plan_for_query(user_query)
+            s.attrs["hit"] = ctx.plan is not None
+            if ctx.plan is not None:
+                s.attrs["stops"] = len(ctx.plan.stops)
+                s.attrs["route"] = "→".join(ctx.plan.route)
+
+    # === FAISS 检索（规划路径直接取骨架中景点的条目） ===
+    path = "hybrid"
+    if ctx.plan is not None:
+        ctx.route = "plan"
+        ctx.max_tokens = ctx.plan.max_tokens
+        relevant_knowledge, ctx.evidence = await eng.in_executor(
+            lambda: format_results(docs_at(ctx.plan.positions()))
+        )
+    elif retrieved is not None:
+        relevant_knowledge, ctx.evidence, path = retrieved
+    else:
+        relevant_knowledge, ctx.evidence, path = await eng.in_executor(_retrieve, user_query, user_id, filters)
+
+    if relevant_knowledge == "无相关信息":
+        ctx.early_answer = NO_KNOWLEDGE_MESSAGE
+        return ctx
+
+    # === 回答缓存：相同问题 + 相同证据 + 相同模式直接复用 ===
+    # 词法直达的问题证据已由景点名唯一确定，只做精确命中，不为语义比较调用 embedding
+    if path != "fast":
+        @functools.lru_cache(maxsize=1)
+        def query_vector():
+            return eng.embeddings.embed_query(normalize_query(user_query))
+
+        ctx.query_vector = query_vector
+    with span("answer_cache") as s:
+        cached = await eng.in_executor(
+            eng.answer_cache.get, user_query, _evidence_ids(ctx), mode, embed_fn=ctx.query_vector
+        )
+        annotate(answer_cache_hit=cached is not None)
+    if cached is not None:
+        ctx.early_answer = cached
+        ctx.cached = True
+        _remember(user_id, user_query, cached)
+        return ctx
+
+    # === 上下文打包：去表头、去重、按景点分组、按 token 预算裁剪 ===
+    with span("context_pack") as s:
+        ctx.packing = pack_context(relevant_knowledge, PLAN_CONTEXT_BUDGET if ctx.plan is not None else None)
+        annotate(
+            context_raw_tokens=ctx.packing.raw_tokens,
+            context_packed_tokens=ctx.packing.packed_tokens,
+            context_saved_tokens=ctx.packing.saved_tokens,
+            entries=f"{ctx.packing.entries_out}/{ctx.packing.entries_in}",
+            duplicates=ctx.packing.duplicates,
+            trimmed=ctx.packing.trimmed,
+        )
+
+    with span("prompt_build") as s:
+        if ctx.plan is not None:
+            ctx.prompt = build_plan_prompt(ctx.plan.to_prompt(), ctx.packing.text, user_query)
+        else:
+            ctx.prompt = build_generation_prompt(ctx.packing.text, user_query)
+        s.attrs["prompt_chars"] = len(ctx.prompt)
+        s.attrs["prompt_tokens_est"] = count_tokens(ctx.prompt)
+    return ctx
+
+
+def _evidence_ids(ctx: AnswerContext) -> List:
+    return [e.get("id") for e in ctx.evidence]
+
+
+async def finish_answer(ctx: AnswerContext, answer: str) -> None:
+    """
+    LLM 生成完成后：写入回答缓存、追加对话记忆
+    """
+    eng = get_engine()
+    if eng.answer_cache.semantic_enabled and ctx.query_vector is not None:
+        vector = await eng.in_executor(ctx.query_vector)
+    else:
+        vector = None
+    eng.answer_cache.put(ctx.user_query, _evidence_ids(ctx), ctx.mode, answer, query_vector=vector)
+    _remember(ctx.user_id, ctx.user_query, answer)
+
+
+def _pipelined_enhance_enabled() -> bool:
+    return UNIAPI_ENHANCE_MODE == "pipelined" and get_engine().async_uniapi_client is not None
+
+
+async def _stream_deepseek(prompt: str, max_tokens: int = 900) -> AsyncIterator[str]:
+    eng = get_engine()
+    stream = await eng.async_client.chat.completions.create(
+        model=eng.chat_model,
+        messages=[{"role": "user", "content": prompt}],
         temperature=0.2,
-        max_tokens=900,
+        max_tokens=max_tokens,
+        timeout=DEEPSEEK_TIMEOUT,
+        stream=True,
+        stream_options={"include_usage": True},
     )
-    answer = response.choices[0].message.content.strip()
+    async for chunk in stream:
+        _annotate_usage(getattr(chunk, "usage", None))
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def get_hebei_answer_async(
+    user_query: str,
+    user_id: str = "default",
+    use_llm_enhance: bool = False,
+    return_evidence: bool = False,
+    filters: Optional[dict] = None,
+) -> Union[str, Tuple[str, List[dict]]]:
+    """
+    异步问答主流程：检索在线程池执行，DeepSeek / UniAPI 走带超时的异步连接池，
+    单进程可同时处理多路对话。参数含义同 get_hebei_answer。
+    """
+    with tracing.trace("answer", key=user_id, query=user_query, mode=_mode(use_llm_enhance)) as t:
+        ctx = await prepare_answer(user_query, user_id, use_llm_enhance, filters)
+        t.attrs["cached"] = ctx.cached
+        t.attrs["route"] = ctx.route
+        if ctx.early_answer is not None:
+            return (ctx.early_answer, ctx.evidence) if return_evidence else ctx.early_answer
 
-    if use_llm_enhance:
-        answer = enhance_with_uniapi(answer=answer, user_query=user_query)
+        answer = await generate_answer(ctx, use_llm_enhance)
+        return (answer, ctx.evidence) if return_evidence else answer
 
-    conversation_memory.setdefault(user_id, [])
-    conversation_memory[user_id].append((user_query, answer))
-    conversation_memory[user_id] = conversation_memory[user_id][-3:]
 
-    return (answer, evidence) if return_evidence else answer
+def _mode(use_llm_enhance: bool) -> str:
+    return "enhanced" if use_llm_enhance else "local"
+
+
+async def generate_answer(ctx: AnswerContext, use_llm_enhance: bool) -> str:
+    """
+    调用 DeepSeek 生成回答（可选 UniAPI 润色），并写入缓存与对话记忆
+    """
+    eng = get_engine()
+    if use_llm_enhance and _pipelined_enhance_enabled():
+        enhancer = SectionEnhancer(ctx.user_query)
+        with span("deepseek", model=eng.chat_model, stream=True):
+            async for delta in eng.aiter_on_loop(_stream_deepseek(ctx.prompt, ctx.max_tokens)):
+                enhancer.feed(delta)
+        with span("uniapi_wait"):
+            answer = await enhancer.finish()
+    else:
+        with span("deepseek", model=eng.chat_model):
+            response = await eng.on_loop(eng.async_client.chat.completions.create(
+                model=eng.chat_model,
+                messages=[{"role": "user", "content": ctx.prompt}],
+                temperature=0.2,
+                max_tokens=ctx.max_tokens,
+                timeout=DEEPSEEK_TIMEOUT,
+            ))
+            _annotate_usage(getattr(response, "usage", None))
+        answer = response.choices[0].message.content.strip()
+
+        if use_llm_enhance:
+            answer = await enhance_with_uniapi_async(answer=answer, user_query=ctx.user_query)
+
+    await finish_answer(ctx, answer)
+    return answer
+
+
+async def stream_hebei_answer_async(
+    user_query: str,
+    user_id: str = "default",
+    use_llm_enhance: bool = False,
+    filters: Optional[dict] = None,
+) -> AsyncIterator[dict]:
+    """
+    流式问答，依次产出事件：
+    - {"type": "evidence", "evidence": [...]}：检索证据，最先给出
+    - {"type": "delta", "text": "..."}：DeepSeek 增量文本
+    - {"type": "replace", "text": "..."}：启用 UniAPI 润色时，用润色后的全文替换
+    - {"type": "done", "answer": "...", "ttft": 秒, "cached": bool}
+    """
+    start = time.perf_counter()
+    eng = get_engine()
+    with tracing.trace("answer", key=user_id, query=user_query, mode=_mode(use_llm_enhance)) as t:
+        ctx = await prepare_answer(user_query, user_id, use_llm_enhance, filters)
+        t.attrs["cached"] = ctx.cached
+        t.attrs["route"] = ctx.route
+        yield {"type": "evidence", "evidence": ctx.evidence}
+
+        if ctx.early_answer is not None:
+            ttft = time.perf_counter() - start
+            eng.record_ttft(ttft)
+            yield {"type": "delta", "text": ctx.early_answer}
+            yield {"type": "done", "answer": ctx.early_answer, "ttft": ttft, "cached": ctx.cached}
+            return
+
+        ttft = None
+        parts: List[str] = []
+        enhancer = SectionEnhancer(ctx.user_query) if use_llm_enhance and _pipelined_enhance_enabled() else None
+        with span("deepseek", model=eng.chat_model, stream=True) as s:
+            async for delta in eng.aiter_on_loop(_stream_deepseek(ctx.prompt, ctx.max_tokens)):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    eng.record_ttft(ttft)
+                    s.attrs["ttft_ms"] = round(ttft * 1000, 3)
+                parts.append(delta)
+                if enhancer is not None:
+                    enhancer.feed(delta)
+                yield {"type": "delta", "text": delta}
+        answer = "".join(parts).strip()
+
+        if use_llm_enhance:
+            if enhancer is not None:
+                with span("uniapi_wait"):
+                    enhanced = await enhancer.finish()
+            else:
+                enhanced = await enhance_with_uniapi_async(answer=answer, user_query=ctx.user_query)
+            if enhanced != answer:
+                answer = enhanced
+                yield {"type": "replace", "text": answer}
+
+        await finish_answer(ctx, answer)
+        yield {"type": "done", "answer": answer, "ttft": ttft, "cached": False}
+
+
+def stream_hebei_answer(
+    user_query: str,
+    user_id: str = "default",
+    use_llm_enhance: bool = False,
+    filters: Optional[dict] = None,
+) -> Iterator[dict]:
+    """
+    stream_hebei_answer_async 的同步生成器版本
+    """
+    return get_engine().iterate(stream_hebei_answer_async(
+        user_query, user_id=user_id, use_llm_enhance=use_llm_enhance, filters=filters
+    ))
+
+
+def get_hebei_answer(
+    user_query: str,
+    user_id: str = "default",
+    use_llm_enhance: bool = False,
+    return_evidence: bool = False,
+    filters: Optional[dict] = None,
+    stream: bool = False,
+) -> Union[str, Tuple[str, List[dict]], Iterator[dict]]:
+    """
+    - use_llm_enhance: True 时启用 UniAPI 表达增强（仅润色）
+    - return_evidence: True 时返回 (answer, evidence)
+    - filters: 透传给检索的元数据过滤条件，如 {"type": ["门票", "交通"], "city": ["承德"]}
+    - stream: True 时返回事件生成器（证据先到，随后是增量文本），见 stream_hebei_answer_async
+    同步封装：实际由 get_hebei_answer_async 在引擎事件循环上执行
+    """
+    if stream:
+        return stream_hebei_answer(
+            user_query, user_id=user_id, use_llm_enhance=use_llm_enhance, filters=filters
+        )
+    return get_engine().run(get_hebei_answer_async(
+        user_query,
+        user_id=user_id,
+        use_llm_enhance=use_llm_enhance,
+        return_evidence=return_evidence,
+        filters=filters,
+    ))
 
 
 # =========================
@@ -309,12 +1435,23 @@ if __name__ == "__main__":
 
     USER_ID = "hebei_travel_user_001"
 
+    answer_fn, clear_fn = get_hebei_answer, clear_history
+    if os.getenv("ANSWER_SERVICE_URL"):
+        # 瘦客户端：问答交给独立的推理服务（answer_service.py），本进程不加载模型与向量库
+        from answer_backend import RemoteAnswerBackend
+
+        service = RemoteAnswerBackend(os.environ["ANSWER_SERVICE_URL"])
+        answer_fn, clear_fn = service.get_hebei_answer, service.clear_history
+    else:
+        # 用户输入第一个问题时，模型与向量库在后台加载
+        get_engine().warmup(background=True)
+
     while True:
         user_input = input("你：").strip()
         if user_input.lower() in ["拜拜", "退出", "结束"]:
             print("智能体：祝你在河北玩得开心！👋")
-            conversation_memory.pop(USER_ID, None)
+            clear_fn(USER_ID)
             break
 
-        ans = get_hebei_answer(user_input, USER_ID, use_llm_enhance=False)
+        ans = answer_fn(user_input, USER_ID, use_llm_enhance=False)
         print(f"智能体：{ans}\n")
@@ -0,0 +1,598 @@
+from __future__ import annotations
+import itertools
+import json
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from entity_graph import EntityGraph, entity_name
+from fact_table import FactTable
+
+# =========================
+# 0) 配置
+# =========================
+TRAVEL_GRAPH_NAME = "travel_graph.json"
+
+# 关闭后多日游问题照常由 LLM 自己排路线
+ITINERARY_PLANNER = os.getenv("ITINERARY_PLANNER", "1").lower() in ("1", "true", "yes")
+# 规划路径下知识内容的 token 预算（骨架已包含门票 / 交通，知识只用于补充提醒）
+PLAN_CONTEXT_BUDGET = int(os.getenv("PLAN_CONTEXT_BUDGET", "300"))
+# 生成长度：基础 + 每天
+PLAN_BASE_TOKENS = 150
+PLAN_TOKENS_PER_DAY = 180
+MAX_PLAN_DAYS = 7
+
+# 每天可用的游览 + 交通小时数（按人群放慢节奏）
+DAY_HOURS = {"": 8.0, "亲子": 7.0, "老人": 6.0, "情侣": 8.0, "学生": 9.0}
+# 知识库里没有写明时的保守估计
+DEFAULT_VISIT_HOURS = 4.0
+DEFAULT_ACCESS_HOURS = 0.5
+# 知识库完全没有数据（经中转也连不上）的路段：至少按这么多小时，且不低于已知最长路段的两倍，
+# 排路线时总排在真实路段之后
+DEFAULT_LEG_HOURS = 3.0
+
+# 北京不是知识库里的城市条目，但省际交通都以它为起点
+ORIGIN_HUBS = ("北京",)
+
+PROFILE_WORDS = {
+    "亲子": ("亲子", "儿童", "孩子", "小孩", "带娃", "家庭"),
+    "老人": ("老人", "老年", "父母", "爸妈", "长辈"),
+    "情侣": ("情侣", "对象", "女朋友", "男朋友", "约会", "蜜月"),
+    "学生": ("学生", "研学", "穷游"),
+}
+ITINERARY_WORDS = ("游", "行程", "安排", "玩", "规划", "路线", "攻略")
+SCENE_TYPES = ("决策", "场景", "行程")
+
+_CN_NUMBERS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_DAYS = re.compile(r"(?<![月\d一二两三四五六七八九十])(\d+|[一二两三四五六七八九十]+)\s*(?:日|天)")
+_DASH = "[–—-]"
+_NUM = r"\d+(?:\.\d+)?"
+_HOURS = re.compile(rf"({_NUM})(?:{_DASH}({_NUM}))?\s*(分钟|小时)")
+_PRICE = re.compile(rf"({_NUM})(?:{_DASH}({_NUM}))?元")
+_VISIT = re.compile(rf"约({_NUM})小时|半天|半日|一日|一天|整天")
+_CLAUSE = re.compile(r"[；;，,。]")
+# 回答里的 Day 标题：UI 按它拆 Day 卡片，分段润色按它切段
+DAY_SPLIT_PATTERN = re.compile(r"(Day\s*\d+\s*[:：])", re.IGNORECASE)
+
+
+# =========================
+# 1) 问题解析
+# =========================
+def _cn_number(text: str) -> Optional[int]:
+    """
+    一百以内的中文数字：“三”“十”“十二”“二十”“二十三”；其他写法（如“一二”）返回 None
+    """
+    if "十" not in text:
+        return _CN_NUMBERS[text] if len(text) == 1 else None
+    tens, _, ones = text.partition("十")
+    if len(tens) > 1 or len(ones) > 1 or ones == "十":
+        return None
+    return (_CN_NUMBERS[tens] if tens else 1) * 10 + (_CN_NUMBERS[ones] if ones else 0)
+
+
+def extract_requested_days(text: str) -> Optional[int]:
+    """
+    从用户输入中提取 X 日游 / X 天（支持“三天两晚”“十二天”“周末”）；
+    超过 MAX_PLAN_DAYS 的天数原样返回，由规划时截断
+    """
+    m = _DAYS.search(text)
+    if m is not None:
+        value = m.group(1)
+        days = int(value) if value.isdigit() else _cn_number(value)
+        return days if days else None
+    if "周末" in text:
+        return 2
+    return None
+
+
+def detect_profile(text: str) -> str:
+    return next((p for p, words in PROFILE_WORDS.items() if any(w in text for w in words)), "")
+
+
+def _midpoint(m: re.Match) -> float:
+    low = float(m.group(1))
+    return (low + float(m.group(2))) / 2 if m.group(2) else low
+
+
+def _hours(m: re.Match) -> float:
+    value = _midpoint(m)
+    return value / 60 if m.group(3) == "分钟" else value
+
+
+# =========================
+# 2) 景点与城市间交通图
+# =========================
+@dataclass
+class Stop:
+    name: str
+    hub: str
+    city: str
+    visit_hours: float
+    access_hours: float
+    access_cost: Optional[float]
+    ticket: Optional[float]
+    popularity: float
+    profiles: Dict[str, float]
+    positions: List[int]
+    tips: Dict[str, List[int]] = field(default_factory=dict)
+
+    def score(self, profile: str) -> float:
+        return self.popularity + self.profiles.get(profile, 0.0)
+
+    @property
+    def cost_hours(self) -> float:
+        return self.visit_hours + self.access_hours
+
+
+@dataclass
+class Leg:
+    src: str
+    dst: str
+    hours: float
+    price: Optional[float]
+    estimated: bool
+
+
+@dataclass
+class DayPlan:
+    day: int
+    hub: str
+    stops: List[Stop]
+    # 当天的城市间交通，按路线顺序；一天可能跨两个城市（到达下一个城市的路段在该城市第一个景点之前）
+    legs: List[Leg] = field(default_factory=list)
+
+    @property
+    def hours(self) -> float:
+        return sum(s.cost_hours for s in self.stops) + sum(leg.hours for leg in self.legs)
+
+
+@dataclass
+class Plan:
+    days: int
+    profile: str
+    route: List[str]
+    day_plans: List[DayPlan]
+
+    @property
+    def stops(self) -> List[Stop]:
+        return [s for d in self.day_plans for s in d.stops]
+
+    @property
+    def max_tokens(self) -> int:
+        return min(900, PLAN_BASE_TOKENS + PLAN_TOKENS_PER_DAY * self.days)
+
+    def positions(self, per_stop: Optional[int] = None) -> List[int]:
+        """
+        写行程要用到的知识条目：每个景点优先取人群建议 / 游览建议，没有时取主条目
+        （门票与交通已写在骨架里）；景点多时每个只取一条，避免后面的景点被预算截掉
+        """
+        per_stop = per_stop or (2 if len(self.stops) <= 3 else 1)
+        result: List[int] = []
+        for stop in self.stops:
+            chosen = stop.tips.get(self.profile, []) + stop.tips.get("", []) + stop.positions[:1]
+            result.extend(p for p in list(dict.fromkeys(chosen))[:per_stop] if p not in result)
+        return result
+
+    def to_prompt(self) -> str:
+        """
+        给 LLM 的紧凑骨架：路线、每天的城市与景点、门票与交通，已经排好，不需要再推理
+        """
+        title = f"{self.days}天" + (f" · {self.profile}" if self.profile else "")
+        lines = [f"路线（{title}）：{' → '.join(self.route)}"]
+        tickets = 0.0
+        fares = 0.0
+        legs = [leg for d in self.day_plans for leg in d.legs]
+        for d in self.day_plans:
+            head = f"Day {d.day}｜{d.hub}"
+            arrivals = {leg.dst: leg for leg in d.legs}
+            fares += sum(leg.price or 0.0 for leg in d.legs)
+            items = []
+            for i, s in enumerate(d.stops):
+                # 当天第一段交通写在标题里，当天中途换城市的交通写在两个景点之间
+                leg = arrivals.pop(s.hub, None) if i == 0 or s.hub != d.stops[i - 1].hub else None
+                if leg is not None:
+                    fare = f"，约{leg.price:.0f}元" if leg.price is not None else ""
+                    mark = "（估算）" if leg.estimated else ""
+                    text = f"{leg.src}→{leg.dst} 约{leg.hours:.1f}小时{fare}{mark}"
+                    if i == 0:
+                        head = f"Day {d.day}｜{text}"
+                    else:
+                        items.append(text)
+                ticket = "门票以景区官方为准" if s.ticket is None else ("免门票" if s.ticket == 0 else f"门票{s.ticket:.0f}元")
+                access = f"，{s.hub}市内/到达约{s.access_hours:.1f}小时"
+                if s.access_cost:
+                    access += f"、{s.access_cost:.0f}元起"
+                items.append(f"{s.name}（游览约{s.visit_hours:g}小时，{ticket}{access}）")
+                tickets += s.ticket or 0.0
+            lines.append(f"{head}：" + (" → ".join(items) if items else "机动 / 休整"))
+        total = f"合计：门票约{tickets:.0f}元/人"
+        if legs and all(leg.price is None for leg in legs):
+            total += "，城市间交通票价知识库未收录"
+        elif legs:
+            total += f"，城市间交通约{fares:.0f}元/人"
+            if any(leg.price is None for leg in legs):
+                total += "起（部分路段票价知识库未收录）"
+        if any(leg.estimated for leg in legs):
+            total += "；标注估算的路段知识库无耗时数据，按已知最长路段的两倍保守估计，出行前请另行查询"
+        lines.append(total)
+        return "\n".join(lines)
+
+
+def _hub_of(city: str, hubs: Sequence[str]) -> str:
+    return next((h for h in sorted(hubs, key=len, reverse=True) if city.startswith(h)), city.replace("市区", ""))
+
+
+class TravelGraph:
+    """
+    构建期从知识库生成的行程规划数据（travel_graph.json）：
+    - hubs / edges：城市间交通图，来自“交通”条目中的“石家庄至保定约30分钟”“北京→承德约90-160元（1.5-2小时）”
+    - stops：景点（有主条目的景点类条目），含所属城市、游览时长、到达耗时与费用、门票、人群适配分
+      （决策 / 场景 / 行程条目中“推荐”记加分，“不推荐”记减分）
+    - 在线 plan()：选景点 -> 城市顺序（最近邻 + 2-opt）-> 按天均衡分组，毫秒级
+    """
+
+    def __init__(self, hubs: List[str], edges: List[dict], stops: List[Stop]):
+        self.hubs = hubs
+        self.edges = edges
+        self.stops = stops
+        self._by_name = {s.name: s for s in stops}
+        self._dist, self._price = self._all_pairs()
+        known = [h for row in self._dist.values() for h in row.values() if 0 < h < math.inf]
+        self._unknown_hours = max(DEFAULT_LEG_HOURS, 2 * max(known, default=0.0))
+        # 与至少一个其他城市连通的城市；孤立城市里的景点只在不得不选时才选
+        self._linked = {a for a, row in self._dist.items() if any(b != a and h < math.inf for b, h in row.items())}
+
+    # ---------- 构建 ----------
+    @classmethod
+    def from_documents(
+        cls,
+        docs: Sequence,
+        graph: Optional[EntityGraph] = None,
+        facts: Optional[FactTable] = None,
+    ) -> "TravelGraph":
+        docs = list(docs)
+        graph = graph or EntityGraph.from_metadatas(d.metadata for d in docs)
+        facts = facts or FactTable.from_documents(docs, graph)
+        metas = [d.metadata for d in docs]
+        contents = [d.page_content.split("【内容】", 1)[-1] for d in docs]
+
+        hubs = list(ORIGIN_HUBS) + sorted({m.get("city", "") for m in metas if m.get("type") == "城市"} - {""})
+        edges = cls._extract_edges(metas, contents, hubs)
+
+        stops: List[Stop] = []
+        for eid, name in enumerate(graph.entities):
+            members = graph.members[eid]
+            parent = members[0]
+            parent_name = metas[parent].get("name", "")
+            if metas[parent].get("type") != "景点" or "-" in parent_name or entity_name(parent_name) != name:
+                continue
+            stops.append(cls._make_stop(name, members, metas, contents, hubs, facts))
+
+        cls._score_profiles(stops, metas, contents, facts)
+        return cls(hubs, edges, stops)
+
+    @staticmethod
+    def _extract_edges(metas: List[dict], contents: List[str], hubs: Sequence[str]) -> List[dict]:
+        names = "|".join(sorted(map(re.escape, hubs), key=len, reverse=True))
+        pair = re.compile(rf"({names})(?:至|→|到)({names})")
+        edges: Dict[Tuple[str, str], dict] = {}
+        for meta, content in zip(metas, contents):
+            if not meta.get("type", "").startswith("交通"):
+                continue
+            for clause in _CLAUSE.split(content):
+                m = pair.search(clause)
+                hours = _HOURS.search(clause[m.end():]) if m else None
+                if m is None or hours is None or m.group(1) == m.group(2):
+                    continue
+                price = _PRICE.search(clause[m.end():])
+                key = tuple(sorted((m.group(1), m.group(2))))
+                edge = edges.setdefault(key, {"a": key[0], "b": key[1], "hours": None, "price": None})
+                edge["hours"] = _hours(hours) if edge["hours"] is None else min(edge["hours"], _hours(hours))
+                if price is not None:
+                    edge["price"] = _midpoint(price)
+        return list(edges.values())
+
+    @staticmethod
+    def _make_stop(
+        name: str,
+        members: List[int],
+        metas: List[dict],
+        contents: List[str],
+        hubs: Sequence[str],
+        facts: FactTable,
+    ) -> Stop:
+        parent = members[0]
+        city = metas[parent].get("city", "")
+
+        # 游览时长：主条目 / 游览建议中的“约3小时”“半日”“1整天”
+        visit = DEFAULT_VISIT_HOURS
+        for pos in members:
+            if pos != parent and "游览建议" not in metas[pos].get("name", ""):
+                continue
+            m = _VISIT.search(contents[pos])
+            if m is not None:
+                visit = float(m.group(1)) if m.group(1) else (4.0 if m.group(0) in ("半天", "半日") else 7.0)
+                break
+
+        # 门票：成人 / 不分人群的第一条价格
+        ticket = None
+        for row in facts.lookup(name, ("门票",)):
+            if row["price_max"] is not None and row["audience"] in (None, "成人"):
+                ticket = row["price_max"]
+                break
+
+        # 到达：事实表里的车程 / 费用，其次是交通条目中的“1.5小时”
+        fares = facts.lookup(name, ("交通费用",))
+        minutes = [r["minutes"] for r in fares if r["minutes"]]
+        access = min(minutes) / 60 if minutes else None
+        if access is None:
+            for pos in members:
+                if metas[pos].get("type", "").startswith("交通") or "交通" in metas[pos].get("name", ""):
+                    m = _HOURS.search(contents[pos])
+                    if m is not None:
+                        access = _hours(m)
+                        break
+        prices = [r["price_min"] for r in fares if r["price_min"]]
+
+        tips: Dict[str, List[int]] = {}
+        for pos in members[1:]:
+            sub = metas[pos].get("name", "")
+            if "游览建议" in sub:
+                tips.setdefault("", []).append(pos)
+            for profile, words in PROFILE_WORDS.items():
+                if any(w in sub for w in words):
+                    tips.setdefault(profile, []).append(pos)
+
+        return Stop(
+            name=name,
+            hub=_hub_of(city, hubs),
+            city=city,
+            visit_hours=visit,
+            access_hours=round(access if access is not None else DEFAULT_ACCESS_HOURS, 2),
+            access_cost=min(prices) if prices else None,
+            ticket=ticket,
+            popularity=round(math.log1p(len(members)), 3),
+            profiles={},
+            positions=list(members),
+            tips=tips,
+        )
+
+    @staticmethod
+    def _score_profiles(stops: List[Stop], metas: List[dict], contents: List[str], facts: FactTable) -> None:
+        # 景点别名：门票条目里的子景点（山海关 -> 老龙头 / 天下第一关，野三坡 -> 百里峡 / 百草畔）
+        aliases: Dict[str, List[str]] = {}
+        for stop in stops:
+            names = [stop.name]
+            for row in facts.lookup(stop.name, ("门票",)):
+                label = row["label"] or ""
+                if 2 <= len(label) <= 6 and re.fullmatch(r"[\u4e00-\u9fff]+", label) and not row["audience"] \
+                        and not any(w in label for w in ("票", "费", "景区", "约")):
+                    names.append(label)
+            aliases[stop.name] = names
+
+        for stop in stops:
+            own: Dict[str, float] = {}
+            for pos in stop.positions:
+                text = metas[pos].get("name", "") + contents[pos]
+                for profile, words in PROFILE_WORDS.items():
+                    if any(w in text for w in words):
+                        own[profile] = min(own.get(profile, 0.0) + 1.0, 2.0)
+            stop.profiles.update(own)
+
+        for meta, content in zip(metas, contents):
+            if meta.get("type") not in SCENE_TYPES:
+                continue
+            name = meta.get("name", "")
+            profiles = [p for p, words in PROFILE_WORDS.items() if any(w in name for w in words)]
+            if not profiles:
+                continue
+            weight = -3.0 if "不推荐" in name else (1.0 if meta.get("type") == "行程" else 2.0)
+            for stop in stops:
+                if any(a in content for a in aliases[stop.name]):
+                    for p in profiles:
+                        stop.profiles[p] = stop.profiles.get(p, 0.0) + weight
+
+    @classmethod
+    def load(cls, out_dir: str) -> Optional["TravelGraph"]:
+        path = os.path.join(out_dir, TRAVEL_GRAPH_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["hubs"], data["edges"], [Stop(**s) for s in data["stops"]])
+
+    def save(self, out_dir: str) -> None:
+        data = {
+            "hubs": self.hubs,
+            "edges": self.edges,
+            "stops": [s.__dict__ for s in self.stops],
+        }
+        tmp_path = os.path.join(out_dir, TRAVEL_GRAPH_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(out_dir, TRAVEL_GRAPH_NAME))
+
+    # ---------- 城市间距离 ----------
+    def _all_pairs(self) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, Optional[float]]]]:
+        """
+        Floyd-Warshall：知识库只给出部分城市对，其余经中转城市推算（如唐山 -> 承德经北京）
+        """
+        nodes = sorted(set(self.hubs) | {s.hub for s in self.stops})
+        dist = {a: {b: (0.0 if a == b else math.inf) for b in nodes} for a in nodes}
+        price: Dict[str, Dict[str, Optional[float]]] = {a: {b: (0.0 if a == b else None) for b in nodes} for a in nodes}
+        for e in self.edges:
+            for a, b in ((e["a"], e["b"]), (e["b"], e["a"])):
+                dist[a][b] = e["hours"]
+                price[a][b] = e["price"]
+        for k in nodes:
+            for a in nodes:
+                for b in nodes:
+                    if dist[a][k] + dist[k][b] < dist[a][b]:
+                        dist[a][b] = dist[a][k] + dist[k][b]
+                        pa, pb = price[a][k], price[k][b]
+                        price[a][b] = None if pa is None or pb is None else pa + pb
+        return dist, price
+
+    def leg(self, src: str, dst: str) -> Leg:
+        hours = self._dist.get(src, {}).get(dst, math.inf)
+        if math.isinf(hours):
+            return Leg(src, dst, round(self._unknown_hours, 2), None, True)
+        return Leg(src, dst, round(hours, 2), self._price[src][dst], False)
+
+    def route_hours(self, route: Sequence[str]) -> float:
+        return sum(self.leg(a, b).hours for a, b in zip(route, route[1:]))
+
+    def estimated_legs(self, route: Sequence[str]) -> int:
+        return sum(self.leg(a, b).estimated for a, b in zip(route, route[1:]))
+
+    def order_hubs(self, hubs: Iterable[str], start: Optional[str] = None) -> List[str]:
+        """
+        城市访问顺序（开放路径）：每个起点跑一次最近邻，再做 2-opt 改进，取总耗时最短
+        """
+        hubs = sorted(set(hubs))
+        if len(hubs) <= 1:
+            return ([start] if start and start not in hubs else []) + hubs
+        starts = [start] if start else hubs
+        best: Optional[List[str]] = None
+        for first in starts:
+            route = [first]
+            rest = [h for h in hubs if h != first]
+            while rest:
+                nxt = min(rest, key=lambda h: (self.leg(route[-1], h).hours, h))
+                route.append(nxt)
+                rest.remove(nxt)
+            improved = True
+            while improved:
+                improved = False
+                for i, j in itertools.combinations(range(1, len(route)), 2):
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    if self.route_hours(candidate) + 1e-9 < self.route_hours(route):
+                        route, improved = candidate, True
+            if best is None or self.route_hours(route) < self.route_hours(best):
+                best = route
+        return best
+
+    # ---------- 规划 ----------
+    def _group(self, route: List[str], stops: List[Stop], days: int, cap: float) -> Optional[List[DayPlan]]:
+        """
+        按路线顺序把景点切成不超过 days 段，使最忙一天的时长尽量小（阈值二分 + 贪心切分）；
+        城市间交通与到达后的第一个景点放在同一天，一天跨两个城市时两段交通都记在当天
+        """
+        items: List[Tuple[Stop, Optional[Leg]]] = []
+        prev = route[0]
+        for hub in route:
+            for i, stop in enumerate(s for s in stops if s.hub == hub):
+                leg = self.leg(prev, hub) if i == 0 and hub != prev else None
+                items.append((stop, leg))
+            if any(s.hub == hub for s in stops):
+                prev = hub
+        if not items:
+            return None
+
+        def split(limit: float) -> List[List[Tuple[Stop, Optional[Leg]]]]:
+            groups: List[List[Tuple[Stop, Optional[Leg]]]] = [[]]
+            load = 0.0
+            for stop, leg in items:
+                cost = stop.cost_hours + (leg.hours if leg else 0.0)
+                if groups[-1] and load + cost > limit:
+                    groups.append([])
+                    load = 0.0
+                groups[-1].append((stop, leg))
+                load += cost
+            return groups
+
+        costs = [s.cost_hours + (leg.hours if leg else 0.0) for s, leg in items]
+        low, high = max(costs), max(cap, max(costs))
+        if len(split(high)) > days:
+            return None
+        for _ in range(20):
+            mid = (low + high) / 2
+            if len(split(mid)) <= days:
+                high = mid
+            else:
+                low = mid
+        groups = split(high)
+
+        plans = []
+        for i, group in enumerate(groups, 1):
+            legs = [leg for _, leg in group if leg is not None]
+            plans.append(DayPlan(day=i, hub=group[0][0].hub, stops=[s for s, _ in group], legs=legs))
+        # 景点不够排满时，剩余天数留在最后一个城市机动 / 休整
+        for i in range(len(groups) + 1, days + 1):
+            plans.append(DayPlan(day=i, hub=groups[-1][-1][0].hub, stops=[]))
+        return plans
+
+    def plan(
+        self,
+        days: int,
+        profile: str = "",
+        must: Sequence[str] = (),
+        hubs: Sequence[str] = (),
+        start: Optional[str] = None,
+    ) -> Optional[Plan]:
+        """
+        - must：问题点名的景点，必选
+        - hubs：问题点名的城市，只在这些城市里选景点
+        - start：出发城市（“从北京出发”），计入第一段城市间交通
+        - 选景点时不引入知识库没有数据的路段；只有这样一个景点都加不进来时才退而使用估算路段
+        """
+        days = max(1, min(days, MAX_PLAN_DAYS))
+        cap = DAY_HOURS.get(profile, DAY_HOURS[""])
+        required = [self._by_name[m] for m in must if m in self._by_name]
+        candidates = [
+            s for s in self.stops
+            if s not in required and (not hubs or s.hub in hubs) and s.score(profile) > 0
+        ]
+        # 孤立城市的景点排在最后：避免先选中它后，其他城市都因为没有路段数据而加不进来
+        candidates.sort(key=lambda s: (s.hub not in self._linked, -s.score(profile), s.name))
+        max_hubs = max(1, min(days, 4))
+
+        selected = list(required)
+        # 必选景点自身带来的估算路段不算新增
+        base = self.estimated_legs(self.order_hubs({s.hub for s in selected}, start))
+        for allow_estimated in (False, True):
+            for stop in candidates:
+                if stop in selected:
+                    continue
+                trial = selected + [stop]
+                trial_hubs = {s.hub for s in trial}
+                if len(trial_hubs) > max_hubs:
+                    continue
+                route = self.order_hubs(trial_hubs, start)
+                if not allow_estimated and self.estimated_legs(route) > base:
+                    continue
+                total = sum(s.cost_hours for s in trial) + self.route_hours(route)
+                if total <= days * cap:
+                    selected = trial
+            if len(selected) > len(required) or not candidates:
+                break
+        if not selected:
+            return None
+
+        # 分组失败（单日装不下 / 天数不够）时从得分最低的非必选景点开始去掉
+        while selected:
+            route = self.order_hubs({s.hub for s in selected}, start)
+            day_plans = self._group(route, selected, days, cap)
+            if day_plans is not None:
+                return Plan(days=days, profile=profile, route=route, day_plans=day_plans)
+            optional = [s for s in selected if s not in required]
+            if not optional:
+                break
+            selected.remove(min(optional, key=lambda s: (s.score(profile), s.name)))
+        return None
+
+    def plan_for_query(self, query: str) -> Optional[Plan]:
+        """
+        “河北3日游”“带老人去承德玩三天”“从北京出发亲子4日游”这类问题返回规划结果，其他问题返回 None
+        """
+        days = extract_requested_days(query)
+        if days is None or not any(w in query for w in ITINERARY_WORDS):
+            return None
+        must = [s.name for s in self.stops if s.name in query]
+        hubs = [h for h in self.hubs if h in query and h not in ORIGIN_HUBS]
+        start = next((h for h in self.hubs if re.search(rf"从{h}|{h}出发", query)), None)
+        if start in hubs and not must:
+            hubs = [h for h in hubs if h != start] or hubs
+        return self.plan(days, detect_profile(query), must=must, hubs=hubs, start=start)
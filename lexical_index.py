@@ -0,0 +1,183 @@
+from __future__ import annotations
+import json
+import math
+import os
+import re
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence
+
+from entity_graph import entity_name
+
+# =========================
+# 0) 配置
+# =========================
+LEXICAL_INDEX_NAME = "lexical_index.json"
+
+# 问题里除了景点名之外最多还有几个字，才算“直接点名”的短问题（如“清东陵门票”）
+FAST_PATH_MAX_EXTRA_CHARS = int(os.getenv("LEXICAL_FAST_PATH_MAX_EXTRA", "6"))
+NAME_WEIGHT = 2.0
+NAME_MATCH_BONUS = 5.0
+RRF_K = 60
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """
+    中文字符 n-gram：按标点切段后在段内取连续 n 字
+    """
+    grams: List[str] = []
+    for seg in _NON_WORD.split(text):
+        if len(seg) < n:
+            if seg:
+                grams.append(seg)
+            continue
+        grams.extend(seg[i:i + n] for i in range(len(seg) - n + 1))
+    return grams
+
+
+def _counts(grams: Iterable[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for g in grams:
+        counts[g] = counts.get(g, 0) + 1
+    return counts
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking):
+            scores[pos] = scores.get(pos, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda pos: -scores[pos])
+
+
+# =========================
+# 1) 倒排索引
+# =========================
+class LexicalIndex:
+    """
+    构建期生成的字符 bigram 倒排索引（名称 + 内容），行号与 FAISS 一一对应。
+    - fast_path()：问题直接点名某个景点时，不经过 embedding 模型直接给出 Top-K
+    - search()：BM25 排序，用于与向量检索做 RRF 融合
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        name_postings: Dict[str, List[List[int]]],
+        content_postings: Dict[str, List[List[int]]],
+        doc_lens: List[int],
+    ):
+        self.names = names
+        self.name_postings = name_postings
+        self.content_postings = content_postings
+        self.doc_lens = doc_lens
+        self.avg_len = (sum(doc_lens) / len(doc_lens)) if doc_lens else 1.0
+
+        self.entities: Dict[str, List[int]] = {}
+        for pos, name in enumerate(names):
+            ent = entity_name(name)
+            if len(ent) >= 2:
+                self.entities.setdefault(ent, []).append(pos)
+        # 长名字优先匹配（“避暑山庄”优先于“山庄”之类的短名）
+        self._entity_order = sorted(self.entities, key=len, reverse=True)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable) -> "LexicalIndex":
+        docs = list(docs)
+        return cls.from_metadatas(
+            (d.metadata for d in docs),
+            (d.page_content.split("【内容】", 1)[-1] for d in docs),
+        )
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[dict], contents: Iterable[str]) -> "LexicalIndex":
+        names: List[str] = []
+        name_postings: Dict[str, List[List[int]]] = {}
+        content_postings: Dict[str, List[List[int]]] = {}
+        doc_lens: List[int] = []
+        for pos, (meta, content) in enumerate(zip(metadatas, contents)):
+            name = meta.get("name", "")
+            names.append(name)
+            for g, tf in _counts(char_ngrams(name)).items():
+                name_postings.setdefault(g, []).append([pos, tf])
+            grams = char_ngrams(content)
+            doc_lens.append(len(grams))
+            for g, tf in _counts(grams).items():
+                content_postings.setdefault(g, []).append([pos, tf])
+        return cls(names, name_postings, content_postings, doc_lens)
+
+    @classmethod
+    def load(cls, out_dir: str) -> Optional["LexicalIndex"]:
+        path = os.path.join(out_dir, LEXICAL_INDEX_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["names"], data["name_postings"], data["content_postings"], data["doc_lens"])
+
+    def save(self, out_dir: str) -> None:
+        data = {
+            "names": self.names,
+            "name_postings": self.name_postings,
+            "content_postings": self.content_postings,
+            "doc_lens": self.doc_lens,
+        }
+        tmp_path = os.path.join(out_dir, LEXICAL_INDEX_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(out_dir, LEXICAL_INDEX_NAME))
+
+    # ---------- 打分 ----------
+    def _idf(self, df: int) -> float:
+        n = len(self.names)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _scores(self, query: str, allowed: Optional[AbstractSet[int]]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for g in set(char_ngrams(query)):
+            postings = self.content_postings.get(g)
+            if postings:
+                idf = self._idf(len(postings))
+                for pos, tf in postings:
+                    if allowed is not None and pos not in allowed:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[pos] / self.avg_len)
+                    scores[pos] = scores.get(pos, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            postings = self.name_postings.get(g)
+            if postings:
+                idf = self._idf(len(postings))
+                for pos, _ in postings:
+                    if allowed is not None and pos not in allowed:
+                        continue
+                    scores[pos] = scores.get(pos, 0.0) + NAME_WEIGHT * idf
+        return scores
+
+    def search(self, query: str, k: int, allowed: Optional[AbstractSet[int]] = None) -> List[int]:
+        scores = self._scores(query, allowed)
+        return sorted(scores, key=lambda pos: -scores[pos])[:k]
+
+    def match_entity(self, query: str) -> Optional[str]:
+        for ent in self._entity_order:
+            if ent in query:
+                return ent
+        return None
+
+    def fast_path(self, query: str, k: int, allowed: Optional[AbstractSet[int]] = None) -> Optional[List[int]]:
+        """
+        问题直接点名景点（名称之外只多几个字）时返回 Top-K 行号，否则返回 None。
+        该景点自身的条目额外加分，同景点内再按 BM25 区分门票 / 交通 / 避坑等子条目。
+        """
+        ent = self.match_entity(query)
+        if ent is None or len(query) - len(ent) > FAST_PATH_MAX_EXTRA_CHARS:
+            return None
+        own = [p for p in self.entities[ent] if allowed is None or p in allowed]
+        if not own:
+            return None
+
+        scores = self._scores(query, allowed)
+        for pos in own:
+            scores[pos] = scores.get(pos, 0.0) + NAME_MATCH_BONUS
+        return sorted(scores, key=lambda pos: -scores[pos])[:k]
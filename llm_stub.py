@@ -0,0 +1,187 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+# =========================
+# 0) 固定回答
+# =========================
+STUB_ANSWER = (
+    "Day 1：\n"
+    "- 上午：清东陵，门票 108 元，建议游览 3 小时\n"
+    "- 下午：遵化市区午餐后前往景忠山\n"
+    "Day 2：\n"
+    "- 上午：承德避暑山庄，旺季门票 130 元\n"
+    "- 下午：外八庙（普宁寺），门票 80 元\n"
+    "小贴士：节假日建议提前预约，注意错峰出行。"
+)
+
+
+def _count_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 1 token
+    return max(1, len(text))
+
+
+# =========================
+# 1) OpenAI 兼容的本地桩服务
+# =========================
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    只实现 POST .../chat/completions（含 stream=True 的 SSE 输出），
+    DeepSeek 与 UniAPI 都指向它即可离线跑通完整问答链路。
+    """
+
+    server: "LLMStubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        self.server.record_request()
+        model = req.get("model", "stub")
+        prompt = "".join(m.get("content", "") for m in req.get("messages", []))
+        text = self.server.answer
+        time.sleep(self.server.latency)
+
+        if req.get("stream"):
+            self._stream(model, text)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": _count_tokens(prompt),
+                "completion_tokens": _count_tokens(text),
+                "total_tokens": _count_tokens(prompt) + _count_tokens(text),
+            },
+        })
+
+    def _stream(self, model: str, text: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        step = self.server.chunk_chars
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.server.token_latency)
+            self._send_event({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        self._send_event({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload: dict) -> None:
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class LLMStubServer(ThreadingHTTPServer):
+    """
+    - latency：每次请求返回前的固定延迟（秒），模拟首字耗时
+    - token_latency：流式输出时相邻两段之间的延迟（秒）
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        latency: float = 0.2,
+        token_latency: float = 0.01,
+        chunk_chars: int = 4,
+        answer: str = STUB_ANSWER,
+    ):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_chars = chunk_chars
+        self.answer = answer
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def start(self) -> "LLMStubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def handle_error(self, request, client_address) -> None:
+        # 客户端取消请求 / 放弃流式输出时连接被提前关闭，属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 LLM 桩服务（压测 / 离线调试用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.2, help="每次请求的首字延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="流式输出每段间隔（秒）")
+    args = parser.parse_args()
+
+    server = LLMStubServer((args.host, args.port), args.latency, args.token_latency)
+    print(f"🧪 LLM 桩服务已启动：{server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
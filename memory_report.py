@@ -0,0 +1,134 @@
+from __future__ import annotations
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence, Union
+
+# =========================
+# 0) /proc 读取
+# =========================
+Pid = Union[int, str]
+
+ROLLUP_FIELDS = (
+    "Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Anonymous", "Swap",
+)
+
+
+def _parse_kb(lines: Sequence[str]) -> Dict[str, int]:
+    values: Dict[str, int] = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 3 and parts[0].endswith(":") and parts[2] == "kB":
+            values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def _summarize(kb: Dict[str, int]) -> Dict[str, float]:
+    """
+    kB -> MB，并给出 unique（仅本进程独占，即再启动一个 worker 的边际成本）与 shared
+    """
+    mb = lambda k: round(kb.get(k, 0) / 1024, 1)
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "unique_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+        "shared_mb": round((kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) / 1024, 1),
+        "anonymous_mb": mb("Anonymous"),
+        "swap_mb": mb("Swap"),
+    }
+
+
+def process_memory(pid: Pid = "self") -> Optional[Dict[str, float]]:
+    """
+    读取 /proc/<pid>/smaps_rollup；不支持的平台（如 macOS）返回 None
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            return _summarize(_parse_kb(f.readlines()))
+    except OSError:
+        return None
+
+
+def mapped_files(pid: Pid = "self", suffixes: Sequence[str] = (".faiss",)) -> Dict[str, Dict[str, float]]:
+    """
+    按文件统计映射内存（如 mmap 打开的 index.faiss）：多个进程映射同一文件时，
+    这部分页面落在 shared，而不是各自的 unique
+    """
+    result: Dict[str, Dict[str, int]] = {}
+    try:
+        with open(f"/proc/{pid}/smaps", "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return {}
+
+    current: Optional[str] = None
+    block: List[str] = []
+
+    def flush():
+        if current is not None and block:
+            kb = _parse_kb(block)
+            acc = result.setdefault(current, {})
+            for k, v in kb.items():
+                acc[k] = acc.get(k, 0) + v
+
+    for line in lines:
+        head = line.split()
+        # 映射头形如 "7f..-7f.. r--s 00000000 08:01 1234  /path/index.faiss"
+        if head and "-" in head[0] and not head[0].endswith(":"):
+            flush()
+            path = head[5] if len(head) >= 6 else ""
+            current = path if path.endswith(tuple(suffixes)) else None
+            block = []
+        elif current is not None:
+            block.append(line)
+    flush()
+    return {path: _summarize(kb) for path, kb in result.items()}
+
+
+def format_memory_report(reports: Dict[Pid, Optional[Dict[str, float]]]) -> str:
+    lines = [f"{'pid':>8} {'RSS':>8} {'PSS':>8} {'unique':>8} {'shared':>8}  (MB)"]
+    total_pss = 0.0
+    for pid, mem in reports.items():
+        if mem is None:
+            lines.append(f"{pid:>8}  无法读取")
+            continue
+        total_pss += mem["pss_mb"]
+        lines.append(
+            f"{pid:>8} {mem['rss_mb']:>8} {mem['pss_mb']:>8} {mem['unique_mb']:>8} {mem['shared_mb']:>8}"
+        )
+    lines.append(f"合计 PSS：{total_pss:.1f}MB（各进程按共享比例分摊后的真实占用）")
+    return "\n".join(lines)
+
+
+def find_pids(pattern: str) -> List[int]:
+    """
+    命令行中包含 pattern 的进程（如 streamlit / hebei_agent_faiss_main）
+    """
+    pids: List[int] = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit() or int(name) in (os.getpid(), os.getppid()):
+            continue
+        try:
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode("utf-8", "replace")
+        except OSError:
+            continue
+        if pattern in cmdline:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程部署时各 worker 的独占 / 共享内存")
+    parser.add_argument("pids", nargs="*", type=int, help="进程号")
+    parser.add_argument("--match", default=None, help="按命令行匹配进程，如 streamlit")
+    parser.add_argument("--files", action="store_true", help="同时列出 .faiss 文件映射的内存")
+    args = parser.parse_args()
+
+    pids: List[Pid] = list(args.pids) + (find_pids(args.match) if args.match else [])
+    if not pids:
+        pids = ["self"]
+    print(format_memory_report({pid: process_memory(pid) for pid in pids}))
+    if args.files:
+        for pid in pids:
+            for path, mem in mapped_files(pid).items():
+                print(f"  [{pid}] {path}：RSS {mem['rss_mb']}MB，shared {mem['shared_mb']}MB，unique {mem['unique_mb']}MB")
@@ -0,0 +1,175 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# =========================
+# 0) 过滤条件
+# =========================
+META_INDEX_NAME = "meta_index.json"
+INDEXED_FIELDS = ("type", "city")
+FILTER_KEYS = INDEXED_FIELDS + tuple(f"exclude_{f}" for f in INDEXED_FIELDS)
+# 编译好的过滤结果（集合 / IDSelector）按条件做 LRU，各自最多保留这么多种条件
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "256"))
+
+# 与原先“过滤掉 城市-* 泛条目”的业务规则一致
+DEFAULT_FILTERS = {"exclude_type": ["城市"]}
+
+
+def _matches(field: str, value: str, wanted: str) -> bool:
+    # 类型按前缀匹配（“交通”同时命中“交通费用”），城市按包含匹配（“承德”命中“承德双桥区”）
+    if field == "type":
+        return value.startswith(wanted)
+    return wanted in value
+
+
+def canonical_filters(filters: Optional[dict]) -> Optional[dict]:
+    """
+    过滤条件的规范形式：只保留 FILTER_KEYS，取值统一为去重升序的字符串列表，去掉空条件；
+    什么都不剩时返回 None。“门票”与 ["门票"]、字段顺序不同的条件得到同一形式
+    """
+    if not filters:
+        return None
+    result = {}
+    for key in FILTER_KEYS:
+        wanted = filters.get(key)
+        values = [wanted] if isinstance(wanted, str) else (wanted or [])
+        values = sorted({v for v in values if isinstance(v, str) and v})
+        if values:
+            result[key] = values
+    return result or None
+
+
+# =========================
+# 1) 元数据倒排索引
+# =========================
+class MetadataIndex:
+    """
+    构建期生成的 type / city -> FAISS 行号 倒排表。
+    filters 示例：{"type": ["门票", "交通"], "city": ["承德"], "exclude_type": ["城市"]}
+    - 同一字段内多个取值为“或”，不同字段之间为“且”
+    - exclude_type / exclude_city 从结果中剔除
+    """
+
+    def __init__(self, postings: Dict[str, Dict[str, List[int]]], total: int, cache_size: int = FILTER_CACHE_SIZE):
+        self.postings = postings
+        self.total = total
+        self.cache_size = cache_size
+        self._selectors: "OrderedDict[str, object]" = OrderedDict()
+        self._allowed: "OrderedDict[str, Optional[frozenset]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[dict]) -> "MetadataIndex":
+        postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in INDEXED_FIELDS}
+        total = 0
+        for pos, meta in enumerate(metadatas):
+            for field in INDEXED_FIELDS:
+                postings[field].setdefault(meta.get(field, ""), []).append(pos)
+            total += 1
+        return cls(postings, total)
+
+    @classmethod
+    def load(cls, out_dir: str) -> Optional["MetadataIndex"]:
+        path = os.path.join(out_dir, META_INDEX_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["total"])
+
+    def save(self, out_dir: str) -> None:
+        tmp_path = os.path.join(out_dir, META_INDEX_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"total": self.total, "postings": self.postings}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(out_dir, META_INDEX_NAME))
+
+    def values(self, field: str) -> List[str]:
+        return sorted(self.postings.get(field, {}))
+
+    def _positions(self, field: str, wanted: Sequence[str]) -> set:
+        result: set = set()
+        for value, positions in self.postings.get(field, {}).items():
+            if any(_matches(field, value, w) for w in wanted):
+                result.update(positions)
+        return result
+
+    def select(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        返回满足过滤条件的 FAISS 行号（int64，升序）；无任何条件时返回 None
+        """
+        if not filters or not any(filters.values()):
+            return None
+
+        allowed: Optional[set] = None
+        for field in INDEXED_FIELDS:
+            wanted = filters.get(field)
+            if wanted:
+                positions = self._positions(field, [wanted] if isinstance(wanted, str) else wanted)
+                allowed = positions if allowed is None else allowed & positions
+        if allowed is None:
+            allowed = set(range(self.total))
+
+        for field in INDEXED_FIELDS:
+            excluded = filters.get(f"exclude_{field}")
+            if excluded:
+                allowed -= self._positions(field, [excluded] if isinstance(excluded, str) else excluded)
+
+        return np.array(sorted(allowed), dtype=np.int64)
+
+    # ---------- 按条件的 LRU ----------
+    def _cached(self, cache: OrderedDict, key: str):
+        with self._lock:
+            if key not in cache:
+                return False, None
+            cache.move_to_end(key)
+            return True, cache[key]
+
+    def _remember(self, cache: OrderedDict, key: str, value) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def allowed(self, filters: Optional[dict]) -> Optional[frozenset]:
+        """
+        select() 的集合形式（供 Python 侧的词法检索使用），相同条件复用结果
+        """
+        filters = canonical_filters(filters)
+        key = json.dumps(filters, ensure_ascii=False)
+        hit, result = self._cached(self._allowed, key)
+        if hit:
+            return result
+        ids = self.select(filters)
+        result = None if ids is None else frozenset(ids.tolist())
+        self._remember(self._allowed, key, result)
+        return result
+
+    def selector(self, filters: Optional[dict]):
+        """
+        把过滤条件编译为 faiss.IDSelectorBatch，在索引内部完成过滤；相同条件复用同一个 selector。
+        返回 (selector, 可选条目数)：无条件时 selector 为 None；没有任何条目满足条件时为 (None, 0)。
+        """
+        filters = canonical_filters(filters)
+        key = json.dumps(filters, ensure_ascii=False)
+        hit, sel = self._cached(self._selectors, key)
+        if hit:
+            return sel
+
+        ids = self.select(filters)
+        if ids is None:
+            sel = (None, self.total)
+        elif len(ids) == 0:
+            sel = (None, 0)
+        else:
+            import faiss
+            sel = (faiss.IDSelectorBatch(ids), len(ids))
+        self._remember(self._selectors, key, sel)
+        return sel
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 模块级配置在导入时读取环境变量：测试不读写工作目录下的缓存
+os.environ["EMBED_CACHE_DIR"] = tempfile.mkdtemp(prefix="hebei-embed-cache-")
+os.environ["ANSWER_CACHE_PATH"] = ""
+os.environ["CONVERSATION_BACKEND"] = "memory"
+
+import embedding_backend  # noqa: E402
+from build_faiss_hebei import build_documents_from_txt  # noqa: E402
+from entity_graph import EntityGraph  # noqa: E402
+
+KNOWLEDGE_TXT = os.path.join(ROOT, "hebei_knowledge.txt")
+
+
+class HashEncoder:
+    """
+    离线测试用的推理引擎：字符 bigram 哈希到定长向量再归一化，
+    与 TorchEncoder / OnnxInt8Encoder 接口一致；calls 记录每次 encode 的文本
+    """
+
+    engine = "torch"
+    dim = 64
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        texts = list(texts)
+        self.calls.append(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(vectors, texts):
+            for a, b in zip(text, text[1:]):
+                h = int(hashlib.md5((a + b).encode("utf-8")).hexdigest()[:8], 16)
+                row[h % self.dim] += 1.0
+            norm = np.linalg.norm(row)
+            if norm:
+                row /= norm
+        return vectors
+
+    @property
+    def encoded(self):
+        return sum(len(c) for c in self.calls)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def hash_encoder():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(embedding_backend, "create_encoder", lambda *args, **kwargs: HashEncoder())
+        yield
+
+
+@pytest.fixture(scope="session")
+def docs():
+    return build_documents_from_txt(KNOWLEDGE_TXT)
+
+
+@pytest.fixture(scope="session")
+def graph(docs):
+    return EntityGraph.from_metadatas(d.metadata for d in docs)
+
+
+@pytest.fixture(scope="session")
+def faiss_dir(tmp_path_factory):
+    from build_faiss_hebei import build_faiss
+
+    out_dir = str(tmp_path_factory.mktemp("faiss_hebei"))
+    build_faiss(KNOWLEDGE_TXT, out_dir=out_dir)
+    return out_dir
+
+
+@pytest.fixture
+def engine(faiss_dir):
+    """
+    指向测试向量库的新引擎（不配置任何 LLM）；用完恢复默认引擎
+    """
+    import hebei_agent_faiss_main as agent
+
+    previous = agent.engine
+    eng = agent.configure_engine(
+        faiss_dir=faiss_dir, deepseek_api_key=None, deepseek_base_url=None, uniapi_key=None, uniapi_base=None
+    )
+    yield eng
+    agent.engine = previous
+
+
+@pytest.fixture
+def llm_stub():
+    from llm_stub import LLMStubServer
+
+    server = LLMStubServer(latency=0.3, token_latency=0.0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def llm_engine(faiss_dir, llm_stub):
+    """
+    DeepSeek 指向本地桩服务的引擎；关闭回答缓存，每次问答都真正调用 LLM
+    """
+    import hebei_agent_faiss_main as agent
+
+    previous = agent.engine
+    eng = agent.configure_engine(
+        faiss_dir=faiss_dir, deepseek_api_key="stub", deepseek_base_url=llm_stub.base_url,
+        uniapi_key=None, uniapi_base=None,
+    )
+    eng.answer_cache.max_entries = 0
+    yield eng
+    agent.engine = previous
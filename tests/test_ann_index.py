@@ -0,0 +1,113 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import ann_index
+import build_faiss_hebei as builder
+import hebei_agent_faiss_main as agent
+from conftest import KNOWLEDGE_TXT
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, 2000)] + 0.1 * rng.normal(size=(2000, 32))).astype(np.float32)
+    return vectors, vectors[:50] + 0.01
+
+
+def test_resolve_params():
+    with pytest.raises(ValueError):
+        ann_index.resolve_params("annoy", 100, 32)
+    assert ann_index.resolve_params("flat", 100, 32, {"nprobe": 4}) == {}
+    hnsw = ann_index.resolve_params("hnsw", 100, 32, {"ef_search": 128, "nlist": 9, "M": None})
+    assert hnsw == {"M": 32, "ef_construction": 200, "ef_search": 128}
+
+    ivf = ann_index.resolve_params("ivf_pq", 10000, 384)
+    assert 384 % ivf["m"] == 0
+    assert ivf["nlist"] == 256 and ivf["nprobe"] == 8 and 4 <= ivf["nbits"] <= 8
+    # 条目很少时 nlist 不超过 n / 39，保证每个簇有足够的训练点
+    assert ann_index.resolve_params("ivf_flat", 100, 32)["nlist"] == 2
+
+
+@pytest.mark.parametrize("kind, knob, wide", [("hnsw", "ef_search", 256), ("ivf_flat", "nprobe", 64)])
+def test_wide_search_matches_exact(data, kind, knob, wide):
+    vectors, queries = data
+    params = ann_index.resolve_params(kind, len(vectors), vectors.shape[1])
+    index = ann_index.build_ann_index(vectors, kind, params)
+    _, truth = ann_index.build_ann_index(vectors, "flat", {}).search(queries, 5)
+    _, found = index.search(queries, 5, params=ann_index.search_parameters(index, **{knob: wide}))
+    assert ann_index.recall_at_k(truth, found, 5) >= 0.99
+
+
+def test_ivf_pq_builds_and_searches(data):
+    vectors, queries = data
+    params = ann_index.resolve_params("ivf_pq", len(vectors), vectors.shape[1])
+    index = ann_index.build_ann_index(vectors, "ivf_pq", params)
+    assert index.ntotal == len(vectors) and index.nprobe == params["nprobe"]
+    _, ids = index.search(queries, 5)
+    assert (ids >= 0).all()
+
+
+def test_search_parameters_and_selector(data):
+    import faiss
+
+    vectors, queries = data
+    hnsw = ann_index.build_ann_index(vectors, "hnsw", {"M": 16, "ef_construction": 80, "ef_search": 40})
+    assert hnsw.hnsw.efSearch == 40
+    assert ann_index.search_parameters(hnsw) is None
+    # 未显式给出的 ef_search 沿用索引当前值
+    assert ann_index.search_parameters(hnsw, faiss.IDSelectorBatch(np.arange(3, dtype=np.int64))).efSearch == 40
+
+    ivf = ann_index.build_ann_index(vectors, "ivf_flat", ann_index.resolve_params("ivf_flat", len(vectors), 32))
+    allowed = np.arange(0, len(vectors), 3, dtype=np.int64)
+    for index in (hnsw, ivf, ann_index.build_ann_index(vectors, "flat", {})):
+        params = ann_index.search_parameters(index, faiss.IDSelectorBatch(allowed))
+        _, ids = index.search(queries, 5, params=params)
+        assert set(ids[ids >= 0].tolist()) <= set(allowed.tolist())
+
+
+def test_recall_at_k():
+    truth = np.array([[1, 2, 3], [4, 5, 6]])
+    assert ann_index.recall_at_k(truth, np.array([[3, 2, 1], [4, -1, 9]]), 3) == 4 / 6
+
+
+def test_ann_report(data):
+    vectors, queries = data
+    report = ann_index.ann_report(vectors, queries[:10], ["hnsw", "ivf_flat"], k=5)
+    results = report["results"]
+    assert results[0]["type"] == "flat" and results[0]["recall"] == 1.0
+    assert {r["type"] for r in results} == {"flat", "hnsw", "ivf_flat"}
+    # 每种类型恰好有一组默认检索参数
+    assert sum(1 for r in results if r.get("default") and r["type"] == "hnsw") == 1
+    assert all(r["params"]["nprobe"] <= r["params"]["nlist"] for r in results if r["type"] == "ivf_flat")
+    assert "recall@5" in ann_index.format_ann_report(report)
+
+
+def test_switch_index_type_reuses_vectors(tmp_path, monkeypatch):
+    out_dir = str(tmp_path / "index")
+    builder.build_faiss(KNOWLEDGE_TXT, out_dir=out_dir)
+    encoded = []
+    original = builder.LocalEmbeddings.embed_documents
+    monkeypatch.setattr(
+        builder.LocalEmbeddings, "embed_documents",
+        lambda self, texts: encoded.append(len(texts)) or original(self, texts),
+    )
+
+    builder.build_faiss(KNOWLEDGE_TXT, out_dir=out_dir, index_type="ivf_flat", index_params={"nprobe": 2})
+    assert encoded == []
+    with open(os.path.join(out_dir, builder.MANIFEST_NAME), "r", encoding="utf-8") as f:
+        config = json.load(f)["index"]
+    assert config["type"] == "ivf_flat" and config["params"]["nprobe"] == 2
+    # IVF 无法从索引还原向量，原始向量另存一份
+    assert os.path.exists(os.path.join(out_dir, ann_index.VECTORS_NAME))
+
+    vs = agent.load_faiss(out_dir)
+    assert vs.index.nprobe == 2
+
+    # 切回 Flat：同样不重新向量化，多余的 vectors.npy 被删除
+    builder.build_faiss(KNOWLEDGE_TXT, out_dir=out_dir, index_type="flat")
+    assert encoded == []
+    assert not os.path.exists(os.path.join(out_dir, ann_index.VECTORS_NAME))
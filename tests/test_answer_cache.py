@@ -0,0 +1,74 @@
+import json
+
+from answer_cache import AnswerCache, normalize_query
+
+EVIDENCE = ["景点-清东陵-门票"]
+
+
+def test_normalize_query():
+    assert normalize_query("清东陵 门票？") == normalize_query("清东陵门票")
+
+
+def test_exact_hit_ignores_punctuation():
+    cache = AnswerCache(persist_path="")
+    cache.put("清东陵门票多少？", EVIDENCE, "local", "108元")
+    assert cache.get("清东陵门票多少", EVIDENCE, "local") == "108元"
+    assert cache.get("清东陵门票多少", EVIDENCE, "enhanced") is None
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_semantic_hit_embeds_outside_lock():
+    cache = AnswerCache(persist_path="", semantic_distance=0.05)
+    cache.put("清东陵门票多少", EVIDENCE, "local", "108元", query_vector=[1.0, 0.0])
+
+    def embed():
+        # 计算问题向量时缓存锁必须是空闲的
+        assert cache._lock.acquire(blocking=False)
+        cache._lock.release()
+        return [0.99, 0.01]
+
+    assert cache.get("清东陵票价", EVIDENCE, "local", embed_fn=embed) == "108元"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_semantic_lookup_skips_embed_without_candidates():
+    cache = AnswerCache(persist_path="", semantic_distance=0.05)
+
+    def embed():
+        raise AssertionError("同组没有候选时不应调用模型")
+
+    assert cache.get("清东陵票价", EVIDENCE, "local", embed_fn=embed) is None
+
+
+def test_entry_replaced_during_embed_is_not_returned():
+    cache = AnswerCache(persist_path="", semantic_distance=0.05)
+    cache.put("清东陵门票多少", EVIDENCE, "local", "旧答案", query_vector=[1.0, 0.0])
+
+    def embed():
+        cache.put("清东陵门票多少", EVIDENCE, "local", "新答案", query_vector=[0.0, 1.0])
+        return [1.0, 0.0]
+
+    assert cache.get("清东陵票价", EVIDENCE, "local", embed_fn=embed) is None
+
+
+def test_persistence_is_debounced(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = AnswerCache(persist_path=str(path), flush_interval=3600)
+    cache.put("清东陵门票", EVIDENCE, "local", "108元")
+    cache.put("山海关门票", ["景点-山海关-门票"], "local", "40元")
+    # 写入只标记脏，不在请求路径上写文件
+    assert not path.exists()
+
+    cache.flush()
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert len(data["entries"]) == 2
+
+    reloaded = AnswerCache(persist_path=str(path))
+    assert reloaded.get("山海关门票", ["景点-山海关-门票"], "local") == "40元"
+
+
+def test_flush_interval_zero_writes_synchronously(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = AnswerCache(persist_path=str(path), flush_interval=0)
+    cache.put("清东陵门票", EVIDENCE, "local", "108元")
+    assert path.exists()
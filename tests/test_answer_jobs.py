@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import hebei_agent_faiss_main as agent
+from answer_jobs import CANCELLED, DONE, ERROR, GENERATING, QUEUED, AnswerJobManager
+from llm_stub import STUB_ANSWER
+
+
+class FakeStream:
+    """
+    可控的流式问答：gate 打开前停在证据之后；记录调用与生成器是否被关闭
+    """
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+        self.closed = []
+
+    def __call__(self, query, session_id, use_llm_enhance=False, stream=False):
+        self.calls.append((query, session_id, use_llm_enhance, stream))
+        return self._events(session_id)
+
+    def _events(self, session_id):
+        try:
+            yield {"type": "evidence", "evidence": [{"title": "景点-清东陵"}]}
+            yield {"type": "delta", "text": "清东陵"}
+            self.gate.wait(5)
+            yield {"type": "delta", "text": "门票108元"}
+            yield {"type": "done", "answer": "清东陵门票108元", "ttft": 0.1, "cached": False}
+        finally:
+            self.closed.append(session_id)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fake():
+    fake = FakeStream()
+    yield fake
+    fake.gate.set()
+
+
+def test_job_streams_then_completes(fake):
+    jobs = AnswerJobManager(fake, workers=2)
+    job = jobs.submit("s1", "清东陵门票", use_llm_enhance=True)
+    wait_for(lambda: job.snapshot()["answer"] == "清东陵")
+    snap = job.snapshot()
+    assert snap["status"] == GENERATING and snap["evidence"] == [{"title": "景点-清东陵"}]
+    assert jobs.busy("s1") and jobs.collect("s1") is None
+    # 上一个问题还在生成时重复提交返回同一个任务
+    assert jobs.submit("s1", "另一个问题") is job
+
+    fake.gate.set()
+    wait_for(lambda: job.finished)
+    assert job.snapshot()["answer"] == "清东陵门票108元" and job.status == DONE
+    assert fake.calls == [("清东陵门票", "s1", True, True)]
+    assert jobs.collect("s1") is job and jobs.current("s1") is None
+
+
+def test_cancel_closes_stream(fake):
+    jobs = AnswerJobManager(fake, workers=1)
+    job = jobs.submit("s1", "清东陵门票")
+    wait_for(lambda: job.snapshot()["answer"] == "清东陵")
+    jobs.cancel("s1")
+    assert jobs.current("s1") is None
+    fake.gate.set()
+    wait_for(lambda: job.finished)
+    assert job.status == CANCELLED and job.answer == "清东陵"
+    # 生成器被关闭，不会再消费后续事件
+    wait_for(lambda: fake.closed == ["s1"])
+
+
+def test_queued_job_cancelled_before_start(fake):
+    jobs = AnswerJobManager(fake, workers=1)
+    first = jobs.submit("s1", "问题一")
+    second = jobs.submit("s2", "问题二")
+    wait_for(lambda: first.snapshot()["answer"] == "清东陵")
+    assert second.status == QUEUED
+    assert jobs.stats() == {"sessions": 2, "running": 1, "queued": 1}
+
+    jobs.cancel("s2")
+    fake.gate.set()
+    wait_for(lambda: second.finished)
+    assert second.status == CANCELLED
+    assert [c[1] for c in fake.calls] == ["s1"]
+
+
+@pytest.mark.parametrize("mid_stream", [False, True])
+def test_errors_finish_the_job(mid_stream):
+    def answer_fn(query, session_id, use_llm_enhance=False, stream=False):
+        if not mid_stream:
+            raise ConnectionError("服务不可用")
+
+        def events():
+            yield {"type": "evidence", "evidence": []}
+            raise TimeoutError("DeepSeek 超时")
+        return events()
+
+    jobs = AnswerJobManager(answer_fn, workers=1)
+    job = jobs.submit("s1", "问题")
+    wait_for(lambda: job.finished)
+    assert job.status == ERROR
+    assert job.error == ("TimeoutError: DeepSeek 超时" if mid_stream else "ConnectionError: 服务不可用")
+
+
+def test_job_against_engine(llm_engine, llm_stub):
+    jobs = AnswerJobManager(agent.get_hebei_answer, workers=2)
+    job = jobs.submit("ui-job", "秦皇岛有什么适合带孩子玩的地方")
+    wait_for(lambda: job.finished, timeout=30)
+    snap = job.snapshot()
+    assert snap["status"] == DONE and snap["answer"] == STUB_ANSWER.strip()
+    assert snap["evidence"] and snap["ttft"] is not None
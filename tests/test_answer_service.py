@@ -0,0 +1,113 @@
+import pytest
+
+from answer_backend import AnswerBackend, AnswerServiceError, LocalAnswerBackend, RemoteAnswerBackend
+from answer_service import SERVICE_MAX_TOP_K, AnswerServiceServer
+from llm_stub import STUB_ANSWER
+
+
+class FailingStatusBackend(LocalAnswerBackend):
+    def status(self):
+        raise RuntimeError("status exploded")
+
+
+class RecordingSearchBackend(LocalAnswerBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def search(self, query, user_id="default", top_k=5, filters=None):
+        self.calls.append({"top_k": top_k, "filters": filters})
+        return "", []
+
+
+@pytest.fixture
+def make_service():
+    servers = []
+
+    def make(backend=None):
+        server = AnswerServiceServer(("127.0.0.1", 0), workers=2, queue_timeout=5, backend=backend)
+        server.start()
+        servers.append(server)
+        return server, RemoteAnswerBackend(server.base_url, timeout=10)
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        AnswerBackend()
+
+
+def test_remote_answer_and_stream(llm_engine, make_service):
+    _, remote = make_service()
+    answer, evidence = remote.get_hebei_answer("秦皇岛有什么适合带孩子玩的地方", "svc", return_evidence=True)
+    assert answer == STUB_ANSWER.strip()
+    assert evidence
+
+    events = list(remote.get_hebei_answer("正定古城有哪些必吃美食", "svc", stream=True))
+    assert events[0]["type"] == "evidence"
+    assert events[-1]["type"] == "done"
+    assert events[-1]["answer"] == STUB_ANSWER.strip()
+
+
+def test_not_ready_keeps_component_timings(engine, make_service):
+    server, remote = make_service()
+    # 模拟向量库热更新后组件被卸载
+    server.backend.readiness = lambda: {"ready": False, "components": {"vectorstore": None}}
+    readiness = remote.readiness()
+    assert readiness["ready"] is False
+    assert readiness["components"] == {"vectorstore": None}
+    assert "workers" in readiness
+
+
+def test_status_error_is_json_500(engine, make_service):
+    _, remote = make_service(FailingStatusBackend())
+    with pytest.raises(AnswerServiceError) as info:
+        remote._json("GET", "/v1/status")
+    assert info.value.status == 500
+    assert "status exploded" in str(info.value)
+
+    status = remote.status()
+    assert status["ready"] is False
+    assert "status exploded" in status["error"]
+
+
+def test_unreachable_service_degrades():
+    remote = RemoteAnswerBackend("http://127.0.0.1:9", timeout=1)
+    assert remote.readiness()["ready"] is False
+    assert "error" in remote.status()
+    assert remote.last_trace("anyone") is None
+    assert remote.uniapi_enabled is False
+    # 不可达时不缓存 uniapi_enabled，服务恢复后重新查询
+    assert remote._uniapi_enabled is None
+
+
+@pytest.mark.parametrize("filters", [
+    "门票",
+    ["门票"],
+    {"type": 1},
+    {"type": ["门票", 2]},
+    {"type": {"in": ["门票"]}},
+])
+def test_invalid_filters_are_400(engine, make_service, filters):
+    server, remote = make_service(RecordingSearchBackend())
+    for path in ("/v1/search", "/v1/answer"):
+        with pytest.raises(AnswerServiceError) as info:
+            remote._json("POST", path, {"query": "清东陵门票", "filters": filters})
+        assert info.value.status == 400
+    assert server.backend.calls == []
+
+
+def test_search_top_k_is_clamped(engine, make_service):
+    server, remote = make_service(RecordingSearchBackend())
+    filters = {"type": ["门票"], "city": "承德"}
+    for top_k, expected in ((None, 5), (3, 3), ("4", 4), (10 ** 6, SERVICE_MAX_TOP_K), (0, 1), (-5, 1)):
+        remote._json("POST", "/v1/search", {"query": "清东陵门票", "top_k": top_k, "filters": filters})
+        assert server.backend.calls[-1] == {"top_k": expected, "filters": filters}
+
+    for top_k in ("many", 1.5, True):
+        with pytest.raises(AnswerServiceError) as info:
+            remote._json("POST", "/v1/search", {"query": "清东陵门票", "top_k": top_k})
+        assert info.value.status == 400
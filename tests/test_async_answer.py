@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+import hebei_agent_faiss_main as agent
+from llm_stub import STUB_ANSWER
+
+QUERIES = [
+    "秦皇岛有什么适合带孩子玩的地方",
+    "正定古城有哪些必吃美食",
+    "去白洋淀要注意哪些坑",
+    "张家口冬天滑雪去哪里",
+    "保定有什么特色小吃",
+    "邯郸有哪些历史古迹",
+]
+
+
+def test_concurrent_answers_share_the_pool(llm_engine, llm_stub):
+    async def scenario():
+        return await asyncio.gather(*(
+            agent.get_hebei_answer_async(q, user_id=f"async-{i}") for i, q in enumerate(QUERIES)
+        ))
+
+    llm_engine.warmup()
+    start = time.perf_counter()
+    answers = llm_engine.run(scenario())
+    elapsed = time.perf_counter() - start
+
+    assert answers == [STUB_ANSWER.strip()] * len(QUERIES)
+    assert llm_stub.requests == len(QUERIES)
+    # 串行需要 len(QUERIES) * latency；并发时接近一次 latency
+    assert elapsed < llm_stub.latency * len(QUERIES) / 2
+
+
+def test_sync_wrapper_from_many_threads(llm_engine, llm_stub):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        answers = list(pool.map(
+            lambda i: agent.get_hebei_answer(QUERIES[i], user_id=f"sync-{i}"), range(3)
+        ))
+    assert answers == [STUB_ANSWER.strip()] * 3
+
+
+def test_cancelled_answer_leaves_no_trace(llm_engine, llm_stub):
+    llm_stub.latency = 1.0
+    user_id = "async-cancel"
+
+    async def scenario():
+        task = asyncio.create_task(agent.get_hebei_answer_async(QUERIES[0], user_id=user_id))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    llm_engine.run(scenario())
+    # 取消的问答不写入对话记忆
+    assert agent.get_history_text(user_id) == "无"
+
+    # 取消后连接池仍可继续使用
+    llm_stub.latency = 0.0
+    assert agent.get_hebei_answer(QUERIES[1], user_id=user_id) == STUB_ANSWER.strip()
+    assert agent.get_history_text(user_id) != "无"
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+
+import batch_answer
+from llm_stub import STUB_ANSWER
+
+QUESTIONS = [
+    "秦皇岛有什么适合带孩子玩的地方",
+    "正定古城有哪些必吃美食",
+    "去白洋淀要注意哪些坑",
+    "张家口冬天滑雪去哪里",
+]
+
+
+def _write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+    return str(path)
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_read_questions_skips_bad_lines(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text(
+        '{"id": "a", "question": "问题一"}\n'
+        "不是 JSON\n"
+        '{"id": "b"}\n'
+        "\n"
+        '{"query": "问题二"}\n',
+        encoding="utf-8",
+    )
+    records = batch_answer.read_questions(str(path))
+    assert [(r["id"], r["question"]) for r in records] == [("a", "问题一"), ("5", "问题二")]
+
+
+def test_load_done_ids_retries_errors_and_partial_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(
+        '{"id": "1", "answer": "好"}\n'
+        '{"id": "2", "error": "TimeoutError: "}\n'
+        '{"id": "3", "ans',
+        encoding="utf-8",
+    )
+    assert batch_answer.load_done_ids(str(path)) == {"1"}
+    assert batch_answer.load_done_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_rate_limiter_spaces_calls():
+    async def scenario(rps, n):
+        limiter = batch_answer.RateLimiter(rps)
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(n)))
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario(20, 5)) >= 0.19
+    assert asyncio.run(scenario(0, 50)) < 0.05
+
+
+def test_answer_file_resumes(llm_engine, llm_stub, tmp_path):
+    llm_stub.latency = 0.05
+    input_path = _write_jsonl(tmp_path / "in.jsonl", [
+        {"id": str(i), "question": q} for i, q in enumerate(QUESTIONS)
+    ])
+    output_path = str(tmp_path / "out.jsonl")
+    # 上次运行已完成 0 号，1 号出错
+    _write_jsonl(tmp_path / "out.jsonl", [
+        {"id": "0", "question": QUESTIONS[0], "answer": "上次的回答"},
+        {"id": "1", "question": QUESTIONS[1], "error": "TimeoutError: "},
+    ])
+
+    summary = batch_answer.answer_file(input_path, output_path, concurrency=2, rps=0)
+    assert summary["total"] == 3 and summary["answered"] == 3 and summary["errors"] == 0
+    assert llm_stub.requests == 3
+
+    rows = _read_jsonl(output_path)
+    assert [r["id"] for r in rows[:2]] == ["0", "1"]
+    assert sorted(r["id"] for r in rows[2:]) == ["1", "2", "3"]
+    assert all(r["answer"] == STUB_ANSWER.strip() and r["evidence"] for r in rows[2:])
+
+    # 全部完成后再次运行不会重复调用 LLM
+    assert batch_answer.answer_file(input_path, output_path, rps=0)["total"] == 0
+    assert llm_stub.requests == 3
+
+
+def test_concurrency_limit(llm_engine, llm_stub, tmp_path):
+    llm_stub.latency = 0.2
+    llm_engine.warmup()
+    records = [{"id": str(i), "question": q} for i, q in enumerate(QUESTIONS)]
+    start = time.perf_counter()
+    summary = llm_engine.run(batch_answer.run_batch(records, str(tmp_path / "out.jsonl"), concurrency=2, rps=0))
+    elapsed = time.perf_counter() - start
+    assert summary["answered"] == len(QUESTIONS)
+    # 4 个问题、2 个并发位：至少两轮 latency，但远少于串行的四轮
+    assert 2 * llm_stub.latency <= elapsed < 4 * llm_stub.latency
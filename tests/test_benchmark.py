@@ -0,0 +1,87 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import benchmark_hebei as bench
+import build_faiss_hebei as builder
+import hebei_agent_faiss_main as agent
+from conftest import KNOWLEDGE_TXT
+from llm_stub import STUB_ANSWER
+
+
+@pytest.mark.parametrize("q, expected", [(0, 1), (50, 5), (95, 10), (99, 10), (100, 10)])
+def test_percentile_nearest_rank(q, expected):
+    assert bench.percentile(list(range(10, 0, -1)), q) == expected
+
+
+def test_summarize():
+    assert bench.summarize([]) == {"n": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    stats = bench.summarize([1.0, 2.0, 3.0, 4.0])
+    assert stats["n"] == 4 and stats["mean"] == 2.5 and stats["p50"] == 2.0 and stats["p99"] == 4.0
+
+
+def test_enlarge_corpus_keeps_entries_distinct(tmp_path, docs):
+    path = bench.enlarge_corpus(KNOWLEDGE_TXT, 3, str(tmp_path / "x3.txt"))
+    enlarged = builder.build_documents_from_txt(path)
+    assert len(enlarged) == 3 * len(docs)
+    assert len(set(builder.assign_entry_keys(enlarged))) == 3 * len(set(builder.assign_entry_keys(docs)))
+    assert enlarged[len(docs)].metadata["name"] == docs[0].metadata["name"] + "（副本1）"
+
+
+def test_compare_results():
+    def result(p50, p95, build):
+        return {"corpora": [{"factor": 1, "build_seconds": build, "latency_ms": {"retrieve": {"p50": p50, "p95": p95}}}]}
+
+    lines = bench.compare_results(result(10.0, 20.0, 2.0), result(5.0, 30.0, 3.0))
+    assert lines == [
+        "x1 retrieve: p50 10.0 -> 5.0ms（-50.0%），p95 20.0 -> 30.0ms（+50.0%）",
+        "x1 build: 2.0 -> 3.0s（+50.0%）",
+    ]
+    assert bench.compare_results({"corpora": []}, result(1.0, 1.0, 1.0)) == []
+
+
+def _post(url, payload):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.read().decode("utf-8")
+
+
+def test_llm_stub_speaks_openai_protocol(llm_stub):
+    llm_stub.latency = 0.0
+    url = llm_stub.base_url + "/chat/completions"
+    body = json.loads(_post(url, {"model": "m", "messages": [{"role": "user", "content": "你好"}]}))
+    assert body["choices"][0]["message"]["content"] == STUB_ANSWER
+    assert body["usage"]["prompt_tokens"] == 2
+
+    events = [
+        line[len("data: "):] for line in _post(url, {"model": "m", "messages": [], "stream": True}).splitlines()
+        if line.startswith("data: ")
+    ]
+    assert events[-1] == "[DONE]"
+    pieces = [json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1]]
+    assert "".join(pieces) == STUB_ANSWER
+    assert len(pieces) > 1 and all(len(p) <= llm_stub.chunk_chars for p in pieces)
+    assert llm_stub.requests == 2
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _post(llm_stub.base_url + "/embeddings", {})
+    assert e.value.code == 404
+
+
+def test_bench_corpus_reports_every_stage(tmp_path, llm_stub):
+    llm_stub.latency = 0.0
+    previous = agent.engine
+    try:
+        result = bench.bench_corpus(
+            KNOWLEDGE_TXT, 2, str(tmp_path), llm_stub.base_url, iterations=3, answer_iterations=2, enhance=False
+        )
+    finally:
+        agent.engine = previous
+    assert result["factor"] == 2 and result["entries"] > 0
+    assert set(result["latency_ms"]) == {"embed_query", "faiss_search", "prompt_build", "retrieve", "answer"}
+    assert all(stats["n"] in (2, 3) for stats in result["latency_ms"].values())
+    assert result["index_bytes"] > 0
@@ -0,0 +1,163 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import build_faiss_hebei as builder
+import embedding_backend
+from conftest import KNOWLEDGE_TXT, HashEncoder
+
+
+def _manifest(out_dir):
+    with open(os.path.join(out_dir, builder.MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _entry(name, content):
+    return f"【类型】景点\n【城市】测试市\n【名称】{name}\n【内容】{content}\n\n"
+
+
+def _write(path, entries):
+    path.write_text("".join(_entry(*e) for e in entries), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """
+    记录每次交给 LocalEmbeddings 向量化的文本
+    """
+    calls = []
+    original = builder.LocalEmbeddings.embed_documents
+    monkeypatch.setattr(
+        builder.LocalEmbeddings, "embed_documents",
+        lambda self, texts: calls.append(list(texts)) or original(self, texts),
+    )
+    return calls
+
+
+def test_iter_document_chunks_respects_chunk_size(docs):
+    chunks = list(builder.iter_document_chunks(KNOWLEDGE_TXT, 7))
+    assert all(len(c) <= 7 for c in chunks)
+    assert [d.page_content for c in chunks for d in c] == [d.page_content for d in docs]
+
+
+def test_scan_entries_matches_assign_entry_keys(docs):
+    entries = builder.scan_entries(iter(docs))
+    assert [e["key"] for e in entries] == builder.assign_entry_keys(docs)
+    assert [e["title"] for e in entries] == [d.metadata.get("title", "") for d in docs]
+
+
+def test_chunked_build_matches_single_chunk(tmp_path, docs, encoded):
+    chunked, whole = str(tmp_path / "chunked"), str(tmp_path / "whole")
+    builder.build_faiss(KNOWLEDGE_TXT, out_dir=chunked, chunk_size=10)
+    assert max(len(c) for c in encoded) <= 10
+    assert sum(len(c) for c in encoded) == len(docs)
+    builder.build_faiss(KNOWLEDGE_TXT, out_dir=whole, chunk_size=len(docs) + 1)
+
+    assert _manifest(chunked)["entries"] == _manifest(whole)["entries"]
+    np.testing.assert_allclose(
+        builder.load_old_vectors(chunked, len(docs)), builder.load_old_vectors(whole, len(docs))
+    )
+
+
+class _FakePool:
+    """
+    代替 spawn 进程池：在本进程里用 HashEncoder 编码，记录创建与关闭次数
+    """
+
+    created = []
+
+    def __init__(self, *args):
+        self.maps = 0
+        self.closed = False
+        _FakePool.created.append(self)
+
+    def map(self, fn, batches):
+        self.maps += 1
+        return [HashEncoder().encode(b) for b in batches]
+
+    def shutdown(self, wait=True):
+        self.closed = True
+
+
+def test_multi_worker_build_reuses_one_pool(tmp_path, monkeypatch):
+    _FakePool.created.clear()
+    monkeypatch.setattr(embedding_backend, "create_worker_pool", _FakePool)
+    # 内容带上临时目录名，避免命中其他用例写入的 embedding 缓存
+    txt = _write(tmp_path / "kb.txt", [(f"园{i}", f"{tmp_path.name} 门票{i}元") for i in range(25)])
+    out_dir = str(tmp_path / "index")
+    builder.build_faiss(txt, out_dir=out_dir, batch_size=4, workers=2, chunk_size=10)
+
+    assert len(_FakePool.created) == 1
+    pool = _FakePool.created[0]
+    assert pool.maps == 3
+    assert pool.closed
+
+    whole = str(tmp_path / "whole")
+    builder.build_faiss(txt, out_dir=whole, chunk_size=30)
+    np.testing.assert_allclose(
+        builder.load_old_vectors(out_dir, 25), builder.load_old_vectors(whole, 25), atol=1e-6
+    )
+
+
+def test_incremental_build_reuses_unchanged_entries(tmp_path, encoded, capsys):
+    out_dir = str(tmp_path / "index")
+    base = [("甲园", "门票10元"), ("乙园", "门票20元"), ("丙园", "门票30元"), ("丁园", "门票40元")]
+    builder.build_faiss(_write(tmp_path / "v1.txt", base), out_dir=out_dir)
+    assert sum(len(c) for c in encoded) == 4
+
+    encoded.clear()
+    capsys.readouterr()
+    # 修改乙园、删除丙园、新增戊园
+    changed = [base[0], ("乙园", "门票25元"), base[3], ("戊园", "门票50元")]
+    txt = _write(tmp_path / "v2.txt", changed)
+    builder.build_faiss(txt, out_dir=out_dir)
+    assert "复用 2 条，新增 1 条，修改 1 条，删除 1 条" in capsys.readouterr().out
+    assert sorted(t.split("【内容】")[1] for c in encoded for t in c) == ["门票25元", "门票50元"]
+
+    full_dir = str(tmp_path / "full")
+    builder.build_faiss(txt, out_dir=full_dir)
+    assert _manifest(out_dir)["entries"] == _manifest(full_dir)["entries"]
+    np.testing.assert_allclose(builder.load_old_vectors(out_dir, 4), builder.load_old_vectors(full_dir, 4))
+
+
+def test_unchanged_rebuild_skips_encoding(tmp_path, encoded, capsys):
+    out_dir = str(tmp_path / "index")
+    txt = _write(tmp_path / "kb.txt", [("甲园", "门票10元"), ("甲园", "门票10元")])
+    builder.build_faiss(txt, out_dir=out_dir)
+    # 内容完全重复的条目按出现序号区分 key
+    assert [e["key"][-2:] for e in _manifest(out_dir)["entries"]] == ["-0", "-1"]
+
+    encoded.clear()
+    capsys.readouterr()
+    mtimes = {name: os.stat(os.path.join(out_dir, name)).st_mtime_ns for name in os.listdir(out_dir)}
+    builder.build_faiss(txt, out_dir=out_dir)
+    assert "知识库无变化" in capsys.readouterr().out
+    assert encoded == []
+    # 已有产物原样保留
+    assert {name: os.stat(os.path.join(out_dir, name)).st_mtime_ns for name in os.listdir(out_dir)} == mtimes
+
+
+def test_missing_artifact_forces_full_build(tmp_path, encoded, capsys):
+    out_dir = str(tmp_path / "index")
+    txt = _write(tmp_path / "kb.txt", [("甲园", "门票10元"), ("乙园", "门票20元")])
+    builder.build_faiss(txt, out_dir=out_dir)
+    assert builder._index_files_exist(out_dir)
+
+    os.remove(os.path.join(out_dir, builder.LEXICAL_INDEX_NAME))
+    assert not builder._index_files_exist(out_dir)
+    capsys.readouterr()
+    builder.build_faiss(txt, out_dir=out_dir)
+    assert "改为全量构建" in capsys.readouterr().out
+    assert builder._index_files_exist(out_dir)
+
+
+def test_full_flag_reencodes_everything(tmp_path, encoded):
+    out_dir = str(tmp_path / "index")
+    txt = _write(tmp_path / "kb.txt", [("甲园", "门票10元"), ("乙园", "门票20元")])
+    builder.build_faiss(txt, out_dir=out_dir)
+    encoded.clear()
+    builder.build_faiss(txt, out_dir=out_dir, full=True)
+    assert sum(len(c) for c in encoded) == 2
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from compact_docstore import DOCSTORE_HEADER, CompactDocstore, PositionIds
+
+
+@pytest.fixture(scope="module", params=[True, False], ids=["mmap", "private"])
+def store(request, docs, tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("docstore"))
+    CompactDocstore.save(out_dir, docs)
+    return CompactDocstore.load(out_dir, mmap_files=request.param)
+
+
+def test_round_trip(store, docs):
+    assert len(store) == len(docs)
+    for pos in (0, 1, len(docs) // 2, len(docs) - 1):
+        doc = store.search(pos)
+        assert doc.page_content == docs[pos].page_content
+        assert doc.metadata == docs[pos].metadata
+    assert [m["title"] for m in store.metadatas()] == [d.metadata["title"] for d in docs]
+
+
+def test_search_out_of_range(store):
+    assert store.search(len(store)) == f"ID {len(store)} not found."
+    assert store.search(-1) == "ID -1 not found."
+
+
+def test_position_ids():
+    ids = PositionIds(3)
+    assert list(ids) == [0, 1, 2] and len(ids) == 3 and ids[2] == 2
+    with pytest.raises(KeyError):
+        ids[3]
+
+
+def test_columns_share_vocab(store, docs):
+    # 取值表只存一份：城市数远少于条目数
+    assert len(store.vocab["city"]) == len({d.metadata["city"] for d in docs}) < len(docs)
+    assert store.nbytes() < sum(len(d.page_content.encode("utf-8")) for d in docs) * 1.2
+
+
+def test_multibyte_and_empty_text(tmp_path):
+    docs = [
+        Document(page_content="", metadata={"type": "", "city": "", "name": "", "id": 7}),
+        Document(page_content="避暑山庄🏯", metadata={"type": "景点", "city": "承德", "name": "避暑山庄", "id": 8}),
+    ]
+    CompactDocstore.save(str(tmp_path), docs)
+    store = CompactDocstore.load(str(tmp_path))
+    assert store.search(0).page_content == "" and store.search(0).metadata["title"] == ""
+    assert store.search(1).page_content == "避暑山庄🏯"
+    assert store.search(1).metadata == {"type": "景点", "city": "承德", "name": "避暑山庄", "title": "景点-避暑山庄", "id": 8}
+
+
+def test_missing_or_unknown_version(tmp_path, docs):
+    assert CompactDocstore.load(str(tmp_path)) is None
+    CompactDocstore.save(str(tmp_path), docs[:2])
+    header = os.path.join(str(tmp_path), DOCSTORE_HEADER)
+    with open(header, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["version"] = 999
+    with open(header, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError):
+        CompactDocstore.load(str(tmp_path))
@@ -0,0 +1,80 @@
+import pytest
+
+from context_packing import count_tokens, pack_context, parse_entries, truncate_to_tokens
+
+
+@pytest.fixture(scope="module")
+def knowledge(docs):
+    # 与 format_results 的拼接方式一致：清东陵主条目、交通、游览建议
+    return "\n\n".join(d.page_content for d in docs[:3])
+
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens("清东陵") == 2
+    assert count_tokens("abcd") == 2
+
+
+def test_truncate_to_tokens():
+    text = "清东陵门票成人108元"
+    for limit in range(count_tokens(text) + 1):
+        cut = truncate_to_tokens(text, limit)
+        assert text.startswith(cut)
+        assert count_tokens(cut) <= limit
+    assert truncate_to_tokens(text, 100) == text
+
+
+def test_parse_entries_keeps_rank(knowledge):
+    entries = parse_entries(knowledge)
+    assert [e.name for e in entries] == ["清东陵", "清东陵-交通", "清东陵-游览建议"]
+    assert entries[1].attraction == "清东陵"
+    assert entries[1].topic == "景点·交通"
+
+
+def test_packing_groups_by_attraction_and_drops_headers(knowledge):
+    result = pack_context(knowledge, budget=0)
+    assert result.text.startswith("■ 清东陵（唐山遵化）")
+    assert "【类型】" not in result.text
+    assert result.groups == ["清东陵"]
+    assert result.entries_out == 3
+    assert result.packed_tokens < result.raw_tokens
+
+
+def test_duplicate_sentences_are_dropped(knowledge):
+    first = knowledge.split("\n\n")[0]
+    result = pack_context(knowledge + "\n\n" + first, budget=0)
+    assert result.duplicates == 1
+    assert result.entries_out == 3
+
+
+def test_budget_trims_at_sentence_boundary(knowledge):
+    full = pack_context(knowledge, budget=0)
+    result = pack_context(knowledge, budget=full.packed_tokens // 2)
+    assert result.trimmed > 0
+    assert result.packed_tokens <= result.budget + 5
+    assert result.entries_out < full.entries_out
+
+
+def test_tiny_budget_hard_truncates_first_entry(knowledge):
+    result = pack_context(knowledge, budget=30)
+    # 不能退回未打包的原文
+    assert result.text != knowledge
+    assert result.entries_out == 1
+    assert result.trimmed == 3
+    assert result.packed_tokens <= 35
+    assert "开放时间" in result.text
+
+
+@pytest.mark.parametrize("budget", [1, 5])
+def test_budget_below_header_keeps_no_empty_entry(knowledge, budget):
+    result = pack_context(knowledge, budget=budget)
+    assert result.text == ""
+    assert result.entries_out == 0
+    assert result.groups == []
+    assert result.trimmed == 3
+
+
+def test_empty_knowledge_is_returned_as_is():
+    result = pack_context("", budget=10)
+    assert result.text == ""
+    assert result.entries_in == 0
@@ -0,0 +1,127 @@
+import types
+
+import pytest
+
+import conversation_store
+from conversation_store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    SQLiteConversationStore,
+    create_conversation_store,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(conversation_store, "time", types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return SQLiteConversationStore(path=str(tmp_path / "conv.sqlite3"), sweep_interval=0, **kwargs)
+        return InMemoryConversationStore(**kwargs)
+    return make
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationStore()
+
+    class Broken(ConversationStore):
+        def append(self, session_id, query, answer):
+            pass
+
+    with pytest.raises(TypeError):
+        Broken()
+
+
+def test_keeps_last_turns(make_store):
+    store = make_store(max_turns=2)
+    for i in range(4):
+        store.append("s", f"问{i}", f"答{i}")
+    assert store.history("s") == [("问2", "答2"), ("问3", "答3")]
+    assert store.history("s", last_n=1) == [("问3", "答3")]
+    assert store.stats()["turns"] == 2
+
+
+def test_idle_session_expires(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("s", "问", "答")
+    clock.value += 30
+    assert store.history("s") == [("问", "答")]
+    # history 会刷新空闲时间
+    clock.value += 50
+    assert store.history("s") == [("问", "答")]
+    clock.value += 61
+    assert store.history("s") == []
+    assert store.stats()["evictions"]["ttl"] == 1
+
+
+def test_append_to_expired_session_starts_over(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("s", "旧问题", "旧回答")
+    clock.value += 61
+    store.append("s", "新问题", "新回答")
+    assert store.history("s") == [("新问题", "新回答")]
+    assert store.stats()["evictions"]["ttl"] == 1
+
+
+def test_purge_expired(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("a", "问", "答")
+    clock.value += 30
+    store.append("b", "问", "答")
+    clock.value += 40
+    assert store.purge_expired() == 1
+    assert store.history("a") == []
+    assert store.history("b") == [("问", "答")]
+
+
+def test_lru_cap_evicts_least_recently_used(make_store, clock):
+    store = make_store(max_sessions=2, ttl=0)
+    store.append("a", "问", "答")
+    clock.value += 1
+    store.append("b", "问", "答")
+    clock.value += 1
+    store.history("a")
+    clock.value += 1
+    store.append("c", "问", "答")
+    assert store.history("b") == []
+    assert store.history("a") and store.history("c")
+    stats = store.stats()
+    assert stats["sessions"] == 2
+    assert stats["evictions"]["lru"] == 1
+
+
+def test_memory_cap_evicts_oldest(make_store, clock):
+    store = make_store(max_mb=0.0005, ttl=0)
+    store.append("a", "问" * 100, "答" * 100)
+    clock.value += 1
+    store.append("b", "问" * 100, "答" * 100)
+    assert store.history("a") == []
+    assert store.history("b")
+    assert store.stats()["evictions"]["memory"] == 1
+
+
+def test_clear(make_store):
+    store = make_store()
+    store.append("s", "问", "答")
+    store.clear("s")
+    assert store.history("s") == []
+    assert store.stats()["evictions"] == {"lru": 0, "ttl": 0, "memory": 0}
+
+
+def test_sqlite_sessions_survive_restart(tmp_path):
+    path = str(tmp_path / "conv.sqlite3")
+    SQLiteConversationStore(path=path).append("s", "问", "答")
+    assert SQLiteConversationStore(path=path).history("s") == [("问", "答")]
+
+
+def test_factory():
+    assert isinstance(create_conversation_store("memory"), InMemoryConversationStore)
+    with pytest.raises(ValueError):
+        create_conversation_store("redis")
@@ -0,0 +1,78 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import embedding_backend
+# 会话级 fixture 会把 create_encoder 换成 HashEncoder；模块导入早于 fixture，这里拿到的是原函数
+from embedding_backend import create_encoder as real_create_encoder
+
+
+def test_cache_namespace_separates_engines():
+    assert embedding_backend.cache_namespace("torch") == embedding_backend.MODEL_NAME
+    assert embedding_backend.cache_namespace("onnx-int8") != embedding_backend.MODEL_NAME
+    emb = embedding_backend.LocalEmbeddings(engine="onnx-int8")
+    assert emb.cache.model_name == embedding_backend.cache_namespace("onnx-int8")
+
+
+def test_create_encoder():
+    encoder = real_create_encoder("torch")
+    assert isinstance(encoder, embedding_backend.TorchEncoder)
+    # 构造时不加载模型
+    assert encoder._model is None
+    with pytest.raises(ValueError):
+        real_create_encoder("tensorrt")
+    with pytest.raises(ValueError):
+        embedding_backend.LocalEmbeddings(engine="tensorrt")
+
+
+def test_onnx_encoder_checks_export(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        embedding_backend.OnnxInt8Encoder(str(tmp_path))
+    with open(tmp_path / embedding_backend.ONNX_META_NAME, "w", encoding="utf-8") as f:
+        json.dump({"model": "other-model"}, f)
+    with pytest.raises(ValueError):
+        embedding_backend.OnnxInt8Encoder(str(tmp_path))
+
+
+def test_onnx_mean_pooling_ignores_padding():
+    """
+    不依赖 onnxruntime：替换分词器与会话，只检查按 attention mask 的均值池化与分批
+    """
+    encoder = object.__new__(embedding_backend.OnnxInt8Encoder)
+    encoder.meta = {"dim": 2}
+    encoder.input_names = {"input_ids", "attention_mask"}
+    batches = []
+
+    def encode_batch(texts):
+        width = max(len(t) for t in texts)
+        return [SimpleNamespace(ids=[1] * width, attention_mask=[1] * len(t) + [0] * (width - len(t))) for t in texts]
+
+    def run(_, feeds):
+        batches.append(feeds["input_ids"].shape)
+        n, width = feeds["input_ids"].shape
+        # 第 j 个 token 的隐状态为 (j, 1)，padding 位置若参与平均会拉高第一维
+        hidden = np.stack([np.stack([np.arange(width), np.ones(width)], axis=1)] * n).astype(np.float32)
+        return [hidden]
+
+    encoder.tokenizer = SimpleNamespace(encode_batch=encode_batch)
+    encoder.session = SimpleNamespace(run=run)
+    vectors = encoder.encode(["a", "abc", "ab"], batch_size=2)
+    np.testing.assert_allclose(vectors, [[0.0, 1.0], [1.0, 1.0], [0.5, 1.0]])
+    assert batches == [(2, 3), (1, 2)]
+    assert encoder.encode([]).shape == (0, 2)
+
+
+def test_local_embeddings_load():
+    emb = embedding_backend.LocalEmbeddings()
+    assert not emb.loaded
+    assert emb.load() is emb and emb.loaded
+
+
+def test_verify_agreement_identical_engines(faiss_dir):
+    report = embedding_backend.verify_agreement(faiss_dir, engine="torch", sample=20)
+    assert report["doc_cosine"]["min"] == pytest.approx(1.0)
+    assert report["topk_overlap_query_only"] == 1.0 and report["topk_overlap_rebuilt"] == 1.0
+    text = embedding_backend.format_agreement(report)
+    assert "Top-5 重合率" in text and "100.0%" in text
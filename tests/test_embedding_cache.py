@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache
+
+
+class Encoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def _cache(tmp_path, **kwargs):
+    kwargs.setdefault("flush_interval", 3600)
+    return EmbeddingCache("test-model", cache_dir=str(tmp_path), max_mb=1, **kwargs)
+
+
+def _stamp(cache):
+    return cache._stat_index()
+
+
+def test_misses_append_to_journal_instead_of_rewriting_index(tmp_path):
+    cache, fn = _cache(tmp_path), Encoder()
+    cache.encode(["甲"], fn)
+    stamp = _stamp(cache)
+    cache.encode(["乙", "丙"], fn)
+    cache.encode(["丁"], fn)
+    assert _stamp(cache) == stamp
+    with open(cache._journal_path(), "rb") as f:
+        assert len(f.read().splitlines()) == 3
+
+
+def test_other_instance_replays_journal(tmp_path):
+    writer, reader, fn = _cache(tmp_path), _cache(tmp_path), Encoder()
+    writer.encode(["甲"], fn)
+    writer.encode(["乙乙", "丙丙丙"], fn)
+    # reader 在 writer 追加日志之前已加载过目录，再次访问时只回放新增记录
+    assert reader.encode(["乙乙", "丙丙丙"], fn) == [[2.0, 0.0], [3.0, 1.0]]
+    assert len(fn.calls) == 2
+    # 新分配的槽位不会和 writer 已写入的冲突
+    reader.encode(["戊"], fn)
+    assert len({slot for slot, _ in reader._slots.values()}) == 4
+    assert writer.encode(["戊", "甲"], fn) == reader.encode(["戊", "甲"], fn)
+
+
+def test_compaction_after_journal_max(tmp_path):
+    cache, fn = _cache(tmp_path, journal_max=2), Encoder()
+    cache.encode(["甲"], fn)
+    stamp = _stamp(cache)
+    cache.encode(["乙"], fn)
+    cache.encode(["丙"], fn)
+    assert _stamp(cache) != stamp
+    assert os.path.getsize(cache._journal_path()) == 0
+    assert set(_cache(tmp_path)._slots) == set(cache._slots)
+
+
+def test_read_hits_are_persisted(tmp_path):
+    cache, fn = _cache(tmp_path), Encoder()
+    cache.encode(["甲", "乙"], fn)
+    cache.save()
+    assert not cache._dirty
+
+    cache.encode(["甲"], fn)
+    assert cache._dirty
+    cache.save()
+    reloaded = _cache(tmp_path)
+    key_a, key_b = (k for k, _ in sorted(cache._slots.items(), key=lambda kv: kv[1][0]))
+    assert reloaded._slots[key_a][1] > reloaded._slots[key_b][1]
+
+
+@pytest.mark.parametrize("interval, flushed", [(0, True), (3600, False)])
+def test_read_ticks_flush_periodically(tmp_path, interval, flushed):
+    cache, fn = _cache(tmp_path, flush_interval=interval), Encoder()
+    cache.encode(["甲"], fn)
+    cache.save()
+    stamp = _stamp(cache)
+    cache.encode(["甲"], fn)
+    assert (_stamp(cache) != stamp) == flushed
+    assert cache._dirty != flushed
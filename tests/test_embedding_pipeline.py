@@ -0,0 +1,40 @@
+import numpy as np
+
+from conftest import HashEncoder
+from embedding_pipeline import encode_corpus, format_throughput, make_length_buckets, merge_throughput, padding_ratio
+
+TEXTS = ["短", "一段很长很长的景点介绍文字", "中等长度", "长一些的文本", "短句", "又一段相当长的游览建议与避坑提示"]
+
+
+def test_length_buckets_cover_all_and_group_similar_lengths():
+    batches = make_length_buckets(TEXTS, 2)
+    assert sorted(i for b in batches for i in b) == list(range(len(TEXTS)))
+    assert all(len(b) <= 2 for b in batches)
+    lengths = [[len(TEXTS[i]) for i in b] for b in batches]
+    assert all(max(a) <= min(b) for a, b in zip(lengths, lengths[1:]))
+
+
+def test_bucketing_reduces_padding():
+    in_order = [list(range(i, min(i + 2, len(TEXTS)))) for i in range(0, len(TEXTS), 2)]
+    assert padding_ratio(TEXTS, make_length_buckets(TEXTS, 2)) < padding_ratio(TEXTS, in_order)
+    assert padding_ratio([], []) == 0.0
+
+
+def test_encode_corpus_keeps_original_order():
+    model = HashEncoder()
+    vectors, stats = encode_corpus(TEXTS, "test-model", batch_size=4, model=model)
+    np.testing.assert_allclose(vectors, HashEncoder().encode(TEXTS))
+    assert [len(c) for c in model.calls] == [4, 2]
+    assert stats["entries"] == len(TEXTS) and stats["batches"] == 2
+    assert "向量化 6 条，2 批" in format_throughput(stats)
+
+
+def test_merge_throughput():
+    a = {"entries": 10, "batches": 1, "batch_size": 32, "workers": 1, "padding_ratio": 0.2, "seconds": 1.0}
+    b = {"entries": 30, "batches": 2, "batch_size": 32, "workers": 1, "padding_ratio": 0.6, "seconds": 1.0}
+    merged = merge_throughput([a, None, b])
+    assert merged["entries"] == 40 and merged["batches"] == 3
+    assert merged["padding_ratio"] == 0.5
+    assert merged["entries_per_sec"] == 20.0
+    assert merge_throughput([]) is None
+    assert format_throughput(None) == "本次无需向量化"
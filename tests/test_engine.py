@@ -0,0 +1,55 @@
+import threading
+import time
+
+import hebei_agent_faiss_main as agent
+
+
+def test_engine_loads_nothing_until_used(engine):
+    assert all(seconds is None for seconds in engine.startup_report().values())
+    assert not engine.is_ready()
+    assert "未加载" in engine.format_startup_report()
+
+    engine.lexical_index
+    loaded = {name for name, seconds in engine.startup_report().items() if seconds is not None}
+    assert "lexical_index" in loaded
+    assert "async_client" not in loaded and "fact_table" not in loaded
+
+
+def test_component_created_once_under_concurrent_access(engine):
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(engine._get("travel_graph", factory)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_background_warmup(llm_engine):
+    thread = llm_engine.warmup(background=True)
+    assert thread is not None
+    thread.join(timeout=30)
+    assert llm_engine.is_ready()
+    assert all(seconds is not None for seconds in llm_engine.startup_report().values())
+    # 已就绪：不再启动新的预热线程
+    assert not llm_engine.warmup(background=True).is_alive()
+
+
+def test_configure_engine_replaces_default(faiss_dir):
+    previous = agent.engine
+    try:
+        eng = agent.configure_engine(faiss_dir=faiss_dir, deepseek_api_key=None, uniapi_key=None)
+        assert agent.get_engine() is eng is not previous
+    finally:
+        agent.engine = previous
@@ -0,0 +1,90 @@
+import pytest
+
+from entity_graph import EntityGraph, entity_name, query_topics
+
+ENTRIES = [
+    ("景点", "清东陵"),          # 0
+    ("景点", "清东陵-游览建议"),  # 1
+    ("门票", "清东陵-门票"),      # 2
+    ("交通", "清东陵-交通"),      # 3
+    ("景点", "避暑山庄"),        # 4
+    ("景点", "避暑山庄-避坑"),    # 5
+    ("避坑", "避暑山庄游览避坑"),  # 6
+    ("门票", "北戴河景区-门票"),  # 7
+    ("景点", "北戴河-游览建议"),  # 8
+    ("美食", "驴肉火烧"),        # 9
+]
+
+
+@pytest.fixture(scope="module")
+def g():
+    return EntityGraph.from_metadatas({"type": t, "name": n} for t, n in ENTRIES)
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("清东陵-交通", "清东陵"),
+    ("外八庙（普宁寺等）", "外八庙"),
+    ("外八庙（普宁寺等）-门票", "外八庙"),
+    ("驴肉火烧", "驴肉火烧"),
+])
+def test_entity_name(name, expected):
+    assert entity_name(name) == expected
+
+
+def test_query_topics():
+    assert query_topics("清东陵门票多少钱，怎么去") == ["门票", "交通"]
+    assert query_topics("清东陵好玩吗") == []
+
+
+def test_grouping(g):
+    assert g.entity(3) == "清东陵"
+    # 没有“-”的名称按最长已知景点前缀归类，“景区”后缀去掉
+    assert g.entity(6) == "避暑山庄"
+    assert g.entity(7) == g.entity(8) == "北戴河"
+    assert g.entity(9) == "驴肉火烧"
+    # 父条目排在最前
+    assert g.members[g.entity_of[2]] == [0, 1, 2, 3]
+    assert g.siblings(5) == [4, 6]
+
+
+def test_collapse_limits_one_entity(g):
+    # 清东陵占满前四名：最多保留两条，空出的名额给其他景点
+    assert g.arrange([0, 1, 2, 3, 4, 9], 4, max_per=2) == [0, 1, 4, 9]
+
+
+def test_focus_entity_is_not_collapsed(g):
+    assert g.arrange([0, 1, 2, 3, 4], 4, focus="清东陵", max_per=2) == [0, 1, 2, 3]
+
+
+def test_expand_topic_sibling_after_first_hit(g):
+    # 问门票时，清东陵-门票紧跟在清东陵的第一条命中之后补入
+    assert g.arrange([0, 4, 9, 5], 3, query="清东陵门票多少钱") == [0, 2, 4]
+
+
+def test_expand_respects_allowed(g):
+    assert g.arrange([0, 4, 9], 3, query="清东陵门票多少钱", allowed={0, 4, 9}) == [0, 4, 9]
+
+
+def test_focus_without_hits_puts_siblings_first(g):
+    assert g.arrange([4, 9], 3, query="清东陵怎么去", focus="清东陵") == [3, 4, 9]
+
+
+def test_refill_when_collapsed_short(g):
+    assert g.arrange([0, 1, 2], 3, max_per=1) == [0, 1, 2]
+    assert g.arrange([], 3) == []
+    assert g.arrange([0, 1], 0) == []
+
+
+def test_save_load_round_trip(g, tmp_path):
+    g.save(str(tmp_path))
+    loaded = EntityGraph.load(str(tmp_path))
+    assert loaded.members == g.members and loaded.topics == g.topics
+    assert loaded.arrange([0, 4, 9, 5], 3, query="清东陵门票多少钱") == [0, 2, 4]
+    assert EntityGraph.load(str(tmp_path / "missing")) is None
+
+
+def test_knowledge_base_siblings(graph, docs):
+    title = {d.metadata["title"]: i for i, d in enumerate(docs)}
+    pos = title["景点-清东陵-门票"]
+    sibling_titles = {docs[p].metadata["title"] for p in graph.siblings(pos)}
+    assert {"景点-清东陵", "景点-清东陵-交通", "景点-清东陵-避坑"} <= sibling_titles
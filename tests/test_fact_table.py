@@ -0,0 +1,63 @@
+import pytest
+
+from fact_table import FactTable, parse_clause
+
+
+@pytest.fixture(scope="module")
+def table(docs, graph):
+    return FactTable.from_documents(docs, graph)
+
+
+@pytest.mark.parametrize("clause, expected", [
+    ("成人108元/人", {"price_min": 108, "price_max": 108, "unit": "人", "audience": "成人", "label": "成人"}),
+    ("学生及60–69岁老人半价54元/人", {"price_min": 54, "price_max": 54, "audience": "学生,老人"}),
+    ("旺季（4–10月）130元/人", {"season": "旺季", "month_from": 4, "month_to": 10, "price_min": 130, "label": None}),
+    ("8:30–17:00（16:00停止入园）", {"open_at": "8:30", "close_at": "17:00", "last_entry": "16:00"}),
+    ("出租车约15–30元", {"price_min": 15, "price_max": 30, "mode": "出租车"}),
+    ("免费", {"price_min": 0, "price_max": 0}),
+    ("公交车程约20分钟", {"minutes": 20, "mode": "公交"}),
+])
+def test_parse_clause(clause, expected):
+    row = parse_clause(clause)
+    assert {k: row.get(k) for k in expected} == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("清东陵门票多少钱", (["清东陵"], ["门票"], None, None)),
+    ("避暑山庄几点开门", (["避暑山庄"], ["开放时间"], None, None)),
+    ("避暑山庄几点关门", (["避暑山庄"], ["开放时间"], None, None)),
+    # “山海关”里的“关”不能和“门票”拼成“关门”
+    ("山海关门票学生多少钱", (["山海关"], ["门票"], "学生", None)),
+    ("山海关交通费多少", (["山海关"], ["交通费用"], None, None)),
+    ("承德站到避暑山庄打车多少钱", (["避暑山庄"], ["交通费用"], None, None)),
+    ("白洋淀观光车多少钱", (["白洋淀"], ["观光车"], None, None)),
+    ("清东陵门票要多少钱？", (["清东陵"], ["门票"], None, None)),
+    ("12月去避暑山庄门票多少", (["避暑山庄"], ["门票"], None, 12)),
+    ("老人去清东陵门票多少钱", (["清东陵"], ["门票"], "老人", None)),
+])
+def test_route_fact_questions(table, query, expected):
+    assert table.route(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "清东陵门票和交通",
+    "清东陵怎么去",
+    "河北3日游怎么安排？",
+    "适合老人去的景点有哪些？",
+    "避暑山庄门票多少钱，附近有什么好吃的推荐一下",
+    # 票务流程：预约 / 退票 / 购买渠道
+    "清东陵门票怎么预约",
+    "山海关门票能退吗",
+    "避暑山庄门票退票规则",
+    "避暑山庄门票在哪买",
+    "避暑山庄门票不要了退款吗",
+    # 混合诉求：只答开放时间会漏掉停车问题
+    "清东陵几点开门停车方便吗",
+])
+def test_route_falls_back_to_retrieval(table, query):
+    assert table.route(query) is None
+
+
+def test_fallback_questions_reach_retrieval(table):
+    assert table.answer("避暑山庄门票在哪买") is None
+    assert table.answer("避暑山庄门票多少钱") is not None
@@ -0,0 +1,92 @@
+import pytest
+
+import hebei_agent_faiss_main as agent
+from metadata_index import DEFAULT_FILTERS, MetadataIndex, canonical_filters
+
+
+@pytest.fixture(scope="module")
+def meta(docs):
+    return MetadataIndex.from_metadatas(d.metadata for d in docs)
+
+
+def _positions(docs, predicate):
+    return {i for i, d in enumerate(docs) if predicate(d.metadata)}
+
+
+def test_select_semantics(meta, docs):
+    assert meta.select(None) is None
+    assert meta.select({"type": []}) is None
+    # 类型按前缀匹配：“交通”同时命中“交通费用”
+    assert set(meta.select({"type": "交通"}).tolist()) == _positions(docs, lambda m: m["type"].startswith("交通"))
+    # 同字段“或”、跨字段“且”，城市按包含匹配
+    selected = set(meta.select({"type": ["门票", "开放时间"], "city": ["承德"]}).tolist())
+    assert selected and selected == _positions(
+        docs, lambda m: m["type"] in ("门票", "开放时间") and "承德" in m["city"]
+    )
+    excluded = set(meta.select(DEFAULT_FILTERS).tolist())
+    assert excluded == _positions(docs, lambda m: m["type"] != "城市")
+
+
+def test_selector_edge_cases(meta):
+    assert meta.selector(None) == (None, meta.total)
+    assert meta.selector({"city": "不存在的城市"}) == (None, 0)
+    sel, count = meta.selector({"type": "门票"})
+    assert sel is not None and count == len(meta.select({"type": "门票"}))
+    # 相同条件复用同一个 selector
+    assert meta.selector({"type": "门票"})[0] is sel
+
+
+def test_canonical_filters():
+    assert canonical_filters(None) is None
+    assert canonical_filters({"type": [], "unknown": ["门票"]}) is None
+    assert canonical_filters({"city": "承德", "type": ["交通", "门票", "交通"], "foo": "bar"}) == {
+        "type": ["交通", "门票"], "city": ["承德"],
+    }
+
+
+def test_filter_caches_are_bounded_lru(docs):
+    meta = MetadataIndex.from_metadatas(d.metadata for d in docs)
+    meta.cache_size = 2
+    sel, _ = meta.selector({"type": "门票"})
+    # 取值写法、无关字段不产生新的缓存项
+    assert meta.selector({"type": ["门票"], "page": 3})[0] is sel
+    assert len(meta._selectors) == 1
+
+    meta.selector({"type": "交通"})
+    meta.selector({"type": "门票"})  # 刷新为最近使用
+    meta.selector({"city": "承德"})
+    assert len(meta._selectors) == 2
+    assert meta.selector({"type": "门票"})[0] is sel
+
+    for i in range(10):
+        meta.allowed({"city": f"城市{i}"})
+    assert len(meta._allowed) == 2
+
+
+def test_save_load_round_trip(meta, tmp_path):
+    meta.save(str(tmp_path))
+    loaded = MetadataIndex.load(str(tmp_path))
+    assert loaded.total == meta.total
+    assert loaded.select({"city": "承德"}).tolist() == meta.select({"city": "承德"}).tolist()
+    assert MetadataIndex.load(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.parametrize("filters", [
+    {"type": ["门票", "交通"]},
+    {"city": ["秦皇岛"], "exclude_type": ["城市"]},
+])
+def test_filtered_search_returns_k_allowed_hits(engine, filters):
+    allowed = set(engine.meta_index.select(filters).tolist())
+    vector = engine.embeddings.embed_query("门票多少钱，怎么去")
+    hits = agent.filtered_search(vector, 5, filters)
+    # 过滤在索引内部完成：结果全部满足条件，且不会因为过滤而少于 k 条
+    assert len(hits) == 5
+    assert set(hits) <= allowed
+
+
+def test_filtered_search_caps_k_and_handles_no_candidates(engine):
+    vector = engine.embeddings.embed_query("应急")
+    allowed = engine.meta_index.select({"type": "应急"}).tolist()
+    assert agent.filtered_search(vector, 5, {"type": "应急"}) == allowed
+    assert agent.filtered_search(vector, 5, {"city": "不存在的城市"}) == []
+    assert agent.filtered_search_batch([], 5) == []
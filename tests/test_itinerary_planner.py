@@ -0,0 +1,87 @@
+import pytest
+
+from itinerary_planner import MAX_PLAN_DAYS, Stop, TravelGraph, extract_requested_days
+
+
+@pytest.fixture(scope="module")
+def travel_graph(docs, graph):
+    return TravelGraph.from_documents(docs, graph)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("河北3日游", 3),
+    ("亲子4日游", 4),
+    ("三天两晚", 3),
+    ("两天", 2),
+    ("周末去哪", 2),
+    ("十天", 10),
+    ("十一日游", 11),
+    ("十二天行程", 12),
+    ("二十天", 20),
+    ("二十三天", 23),
+    # 日期里的“日”不是天数
+    ("5月1日出发", None),
+    ("十月一日出发玩三天", 3),
+    ("一二天", None),
+    ("0天", None),
+    ("适合老人", None),
+])
+def test_extract_requested_days(text, expected):
+    assert extract_requested_days(text) == expected
+
+
+@pytest.mark.parametrize("query, days, profile", [
+    ("河北3日游怎么安排？", 3, ""),
+    ("带老人去承德玩三天", 3, "老人"),
+    ("河北十二天行程怎么安排", MAX_PLAN_DAYS, ""),
+])
+def test_plan_for_query(travel_graph, query, days, profile):
+    plan = travel_graph.plan_for_query(query)
+    assert (plan.days, len(plan.day_plans), plan.profile) == (days, days, profile)
+
+
+@pytest.mark.parametrize("query", ["清东陵门票多少钱", "适合老人去的景点有哪些？"])
+def test_plan_for_query_ignores_other_questions(travel_graph, query):
+    assert travel_graph.plan_for_query(query) is None
+
+
+def test_plan_avoids_legs_without_data(travel_graph):
+    plan = travel_graph.plan_for_query("从北京出发河北5日游情侣")
+    legs = [travel_graph.leg(a, b) for a, b in zip(plan.route, plan.route[1:])]
+    assert plan.route[0] == "北京"
+    assert legs and not any(leg.estimated for leg in legs)
+    assert "估算" not in plan.to_prompt()
+
+
+def test_estimated_leg_is_last_resort_and_labelled(travel_graph):
+    legs = [travel_graph.leg(a, b) for a in travel_graph.hubs for b in travel_graph.hubs if a != b]
+    known = max(leg.hours for leg in legs if not leg.estimated)
+    leg = travel_graph.leg("北京", "邢台")
+    assert leg.estimated and leg.hours > known
+
+    # 只能去孤立城市时才使用估算路段，并在骨架中标注
+    plan = travel_graph.plan(2, hubs=["邢台"], start="北京")
+    assert plan.route == ["北京", "邢台"]
+    assert "北京→邢台" in plan.to_prompt() and "（估算）" in plan.to_prompt()
+
+
+def _stop(name, hub):
+    return Stop(name=name, hub=hub, city=hub, visit_hours=2.0, access_hours=0.5, access_cost=None,
+                ticket=20.0, popularity=1.0, profiles={}, positions=[0])
+
+
+def test_day_spanning_two_hubs_keeps_both_legs():
+    edges = [{"a": "北京", "b": "甲市", "hours": 1.0, "price": 50.0},
+             {"a": "甲市", "b": "乙市", "hours": 0.5, "price": 10.0}]
+    stops = [_stop("甲园", "甲市"), _stop("甲湖", "甲市"), _stop("乙园", "乙市")]
+    plan = TravelGraph(["北京", "甲市", "乙市"], edges, stops).plan(2, start="北京")
+
+    first, second = plan.day_plans
+    assert [s.name for s in first.stops] == ["甲园"]
+    assert [s.name for s in second.stops] == ["甲湖", "乙园"]
+    assert [(leg.src, leg.dst) for leg in first.legs + second.legs] == [("北京", "甲市"), ("甲市", "乙市")]
+    assert second.hours == 2 * 2.5 + 0.5
+    prompt = plan.to_prompt()
+    assert "Day 1｜北京→甲市 约1.0小时，约50元：甲园" in prompt
+    assert "Day 2｜甲市：甲湖（游览约2小时，门票20元，甲市市内/到达约0.5小时） → 甲市→乙市 约0.5小时，约10元 → 乙园" in prompt
+    assert "城市间交通约60元/人" in prompt
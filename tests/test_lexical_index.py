@@ -0,0 +1,53 @@
+import pytest
+
+from lexical_index import LexicalIndex
+
+
+@pytest.fixture(scope="module")
+def index(docs):
+    return LexicalIndex.from_documents(docs)
+
+
+def _titles(docs, positions):
+    return [docs[p].metadata["title"] for p in positions]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("清东陵门票", "清东陵"),
+    ("山海关避坑有哪些？", "山海关"),
+    ("避暑山庄", "避暑山庄"),
+    ("清东陵和避暑山庄哪个更适合带老人去玩一整天呢", "避暑山庄"),
+    ("河北3日游怎么安排？", None),
+    ("适合老人去的景点有哪些？", None),
+])
+def test_match_entity(index, query, expected):
+    assert index.match_entity(query) == expected
+
+
+@pytest.mark.parametrize("query, top", [
+    ("清东陵门票", "景点-清东陵-门票"),
+    ("山海关避坑有哪些？", "景点-山海关-避坑"),
+])
+def test_fast_path_ranks_own_sub_entry_first(index, docs, query, top):
+    assert _titles(docs, index.fast_path(query, 3))[0] == top
+
+
+def test_fast_path_bare_name_returns_own_entries(index, docs):
+    titles = _titles(docs, index.fast_path("避暑山庄", 3))
+    assert all(t.startswith("景点-避暑山庄") for t in titles)
+
+
+@pytest.mark.parametrize("query", [
+    "河北3日游怎么安排？",
+    "适合老人去的景点有哪些？",
+    # 景点名之外字数太多，交给完整检索
+    "清东陵和避暑山庄哪个更适合带老人去玩一整天呢",
+])
+def test_fast_path_declines(index, query):
+    assert index.fast_path(query, 3) is None
+
+
+def test_fast_path_respects_allowed(index, docs):
+    allowed = set(range(0, len(docs), 2))
+    assert set(index.fast_path("清东陵门票", 3, allowed=allowed)) <= allowed
+    assert index.fast_path("清东陵门票", 3, allowed=set()) is None
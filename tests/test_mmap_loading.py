@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import hebei_agent_faiss_main as agent
+import memory_report
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="依赖 /proc/<pid>/smaps")
+
+
+def test_mmap_load_matches_private_load(faiss_dir):
+    private = agent.load_faiss(faiss_dir, mmap=False)
+    mapped = agent.load_faiss(faiss_dir, mmap=True)
+    assert mapped.index.ntotal == private.index.ntotal
+    x = np.asarray([private.index.reconstruct(i) for i in range(0, private.index.ntotal, 50)], dtype=np.float32)
+    np.testing.assert_array_equal(mapped.index.search(x, 5)[1], private.index.search(x, 5)[1])
+    key = mapped.index_to_docstore_id[3]
+    assert mapped.docstore.search(key).page_content == private.docstore.search(key).page_content
+
+
+def test_missing_index_dir(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        agent.load_faiss(str(tmp_path / "missing"))
+
+
+@linux_only
+def test_memory_report_lists_mapped_index(faiss_dir):
+    previous = agent.engine
+    try:
+        eng = agent.configure_engine(faiss_dir=faiss_dir, deepseek_api_key=None, uniapi_key=None, mmap=True)
+        eng.vectorstore
+        report = eng.memory_report()
+    finally:
+        agent.engine = previous
+    assert report["mmap"] is True
+    assert report["rss_mb"] > 0
+    assert os.path.join(faiss_dir, "index.faiss") in report["index_files"]
+
+
+def test_summarize_splits_unique_and_shared():
+    kb = memory_report._parse_kb([
+        "Rss:               10240 kB",
+        "Pss:                6144 kB",
+        "Shared_Clean:       4096 kB",
+        "Private_Clean:      1024 kB",
+        "Private_Dirty:      5120 kB",
+        "VmFlags: rd wr mr",
+    ])
+    mem = memory_report._summarize(kb)
+    assert mem["rss_mb"] == 10.0 and mem["pss_mb"] == 6.0
+    assert mem["unique_mb"] == 6.0 and mem["shared_mb"] == 4.0
+
+    text = memory_report.format_memory_report({1: mem, 2: None})
+    assert "无法读取" in text and "合计 PSS：6.0MB" in text
@@ -0,0 +1,39 @@
+import pytest
+
+import hebei_agent_faiss_main as agent
+
+
+@pytest.fixture
+def encoder(engine):
+    enc = engine.embeddings.encoder
+    enc.calls.clear()
+    return enc
+
+
+def _answer(engine, query):
+    ctx = engine.run(agent.prepare_answer(query, "test-user", False, None))
+    if ctx.early_answer is None:
+        engine.run(agent.finish_answer(ctx, f"回答：{query}"))
+    return ctx
+
+
+def test_fast_path_answer_never_calls_encoder(engine, encoder):
+    assert engine.answer_cache.semantic_enabled
+    ctx = _answer(engine, "山海关避坑有哪些？")
+    assert ctx.early_answer is None
+    assert ctx.query_vector is None
+    assert engine.retrieval_stats()["fast"]["count"] == 1
+    assert encoder.calls == []
+
+    # 精确缓存仍然生效
+    again = _answer(engine, "山海关避坑有哪些")
+    assert again.cached
+    assert encoder.calls == []
+
+
+def test_hybrid_answer_embeds_for_semantic_cache(engine, encoder):
+    ctx = _answer(engine, "适合老人去的景点有哪些？")
+    assert engine.retrieval_stats()["hybrid"]["count"] == 1
+    assert ctx.query_vector is not None
+    texts = [t for call in encoder.calls for t in call]
+    assert agent.normalize_query("适合老人去的景点有哪些？") in texts
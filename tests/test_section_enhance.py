@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+import hebei_agent_faiss_main as agent
+from llm_stub import STUB_ANSWER
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Day 1：上午\nDay 2：下午", [0, 9]),
+    ("开场白\nDay 1：上午", [0, 4]),
+    ("没有分天的回答", [0]),
+    ("", [0]),
+])
+def test_section_starts(text, expected):
+    assert agent.section_starts(text) == expected
+
+
+@pytest.fixture
+def polished(monkeypatch):
+    """
+    把 UniAPI 润色替换为给原文加标记，记录每次提交的片段
+    """
+    calls = []
+
+    async def polish(prompt, fallback):
+        calls.append(fallback)
+        await asyncio.sleep(0.01)
+        return f"<{fallback}>"
+
+    monkeypatch.setattr(agent, "_polish_with_uniapi", polish)
+    return calls
+
+
+def test_sections_launch_while_streaming(engine, polished):
+    async def scenario():
+        enhancer = agent.SectionEnhancer("两日游")
+        enhancer.feed("Day 1：清东陵")
+        enhancer.feed("，门票108元\nDa")
+        assert polished == []
+        # 下一段标题出现时上一段已完整，立即提交润色
+        enhancer.feed("y 2：避暑山庄")
+        await asyncio.sleep(0)
+        assert polished == ["Day 1：清东陵，门票108元"]
+        return await enhancer.finish()
+
+    assert engine.run(scenario()) == "<Day 1：清东陵，门票108元>\n\n<Day 2：避暑山庄>"
+    assert polished == ["Day 1：清东陵，门票108元", "Day 2：避暑山庄"]
+
+
+def test_single_section_is_polished_whole(engine, monkeypatch):
+    prompts = []
+
+    async def polish(prompt, fallback):
+        prompts.append(prompt)
+        return fallback
+
+    monkeypatch.setattr(agent, "_polish_with_uniapi", polish)
+
+    async def scenario():
+        enhancer = agent.SectionEnhancer("清东陵门票")
+        enhancer.feed("清东陵成人门票108元。")
+        return await enhancer.finish()
+
+    assert engine.run(scenario()) == "清东陵成人门票108元。"
+    assert prompts == [agent.build_enhance_prompt("清东陵成人门票108元。", "清东陵门票")]
+
+
+def test_failed_section_falls_back_to_original(engine, monkeypatch):
+    async def polish(prompt, fallback):
+        if "Day 2" in fallback:
+            return fallback
+        return f"<{fallback}>"
+
+    monkeypatch.setattr(agent, "_polish_with_uniapi", polish)
+
+    async def scenario():
+        enhancer = agent.SectionEnhancer("两日游")
+        enhancer.feed("Day 1：甲\nDay 2：乙\nDay 3：丙")
+        return await enhancer.finish()
+
+    assert engine.run(scenario()) == "<Day 1：甲>\n\nDay 2：乙\n\n<Day 3：丙>"
+
+
+def test_pipelined_answer_against_stub(faiss_dir, llm_stub):
+    previous = agent.engine
+    try:
+        eng = agent.configure_engine(
+            faiss_dir=faiss_dir, deepseek_api_key="stub", deepseek_base_url=llm_stub.base_url,
+            uniapi_key="stub", uniapi_base=llm_stub.base_url,
+        )
+        eng.answer_cache.max_entries = 0
+        answer = agent.get_hebei_answer("秦皇岛有什么适合带孩子玩的地方", user_id="pipelined", use_llm_enhance=True)
+    finally:
+        agent.engine = previous
+    # 桩服务的回答有两个 Day 段：DeepSeek 一次 + 每段润色一次，按原顺序拼回
+    assert llm_stub.requests == 3
+    assert answer == "\n\n".join([STUB_ANSWER.strip()] * 2)
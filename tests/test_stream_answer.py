@@ -0,0 +1,47 @@
+import time
+
+import hebei_agent_faiss_main as agent
+from llm_stub import STUB_ANSWER
+
+QUERY = "秦皇岛有什么适合带孩子玩的地方"
+
+
+def test_stream_events_arrive_in_order(llm_engine, llm_stub):
+    llm_stub.token_latency = 0.02
+    llm_engine.warmup()
+    start = time.perf_counter()
+    events, arrivals = [], []
+    for event in agent.get_hebei_answer(QUERY, user_id="stream-order", stream=True):
+        events.append(event)
+        arrivals.append(time.perf_counter() - start)
+    total = time.perf_counter() - start
+
+    kinds = [e["type"] for e in events]
+    assert kinds[0] == "evidence" and events[0]["evidence"]
+    assert kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"delta"} and len(kinds) > 3
+
+    text = "".join(e["text"] for e in events if e["type"] == "delta")
+    assert text.strip() == events[-1]["answer"] == STUB_ANSWER.strip()
+    # 首个增量在整段回答生成完之前就已到达
+    done = events[-1]
+    assert llm_stub.latency <= done["ttft"] < total
+    assert arrivals[1] < total - llm_stub.token_latency * 5
+    assert llm_engine.ttft_stats()["count"] == 1
+    assert agent.get_history_text("stream-order") != "无"
+
+
+def test_stream_early_answer_skips_llm(llm_engine, llm_stub):
+    events = list(agent.stream_hebei_answer("河北旅游", user_id="stream-early"))
+    assert [e["type"] for e in events] == ["evidence", "delta", "done"]
+    assert events[1]["text"] == events[2]["answer"] == agent.precheck_query("河北旅游")
+    assert llm_stub.requests == 0
+
+
+def test_abandoned_stream_leaves_no_history(llm_engine, llm_stub):
+    llm_stub.token_latency = 0.05
+    stream = agent.stream_hebei_answer(QUERY, user_id="stream-abandon")
+    assert next(stream)["type"] == "evidence"
+    assert next(stream)["type"] == "delta"
+    stream.close()
+    assert agent.get_history_text("stream-abandon") == "无"
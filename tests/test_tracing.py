@@ -0,0 +1,38 @@
+import hebei_agent_faiss_main as agent
+import tracing
+
+
+def test_spans_attach_to_trace_and_breakdown_sums():
+    with tracing.trace("answer", key="trace-user") as t:
+        with tracing.span("encode"):
+            tracing.annotate(embed_cache_hits=1)
+        with tracing.span("uniapi"):
+            pass
+        with tracing.span("uniapi"):
+            pass
+    assert [s.name for s in t.spans] == ["encode", "uniapi", "uniapi"]
+    assert t.spans[0].attrs["embed_cache_hits"] == 1
+    assert set(t.breakdown()) == {"encode", "uniapi"}
+    assert tracing.last_trace("trace-user") is t
+
+
+def test_span_records_error():
+    try:
+        with tracing.trace("answer") as t:
+            with tracing.span("deepseek"):
+                raise TimeoutError("slow")
+    except TimeoutError:
+        pass
+    assert t.spans[0].attrs["error"] == "TimeoutError: slow"
+
+
+def test_warmup_failure_is_quiet_unless_verbose(tmp_path, capsys, monkeypatch):
+    eng = agent.HebeiEngine(faiss_dir=str(tmp_path / "missing"), deepseek_api_key=None, uniapi_key=None)
+    eng._components["embeddings"] = object()
+
+    eng.warmup(background=True).join()
+    assert capsys.readouterr().out == ""
+
+    monkeypatch.setattr(tracing, "VERBOSE", True)
+    eng.warmup(background=True).join()
+    assert "[预热失败] vectorstore" in capsys.readouterr().out
@@ -0,0 +1,243 @@
+from __future__ import annotations
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+# =========================
+# 0) 配置
+# =========================
+# 打印检索命中、UniAPI 失败原因等调试信息（默认关闭，热路径不写控制台）
+VERBOSE = os.getenv("HEBEI_VERBOSE", "").lower() in ("1", "true", "yes")
+# 每次问答的完整 trace 以 JSON 行追加到该文件；为空时不落盘
+TRACE_LOG = os.getenv("HEBEI_TRACE_LOG", "")
+TRACE_SAMPLES = 512
+RECENT_TRACES = 256
+
+T = TypeVar("T")
+
+
+def log(*args) -> None:
+    if VERBOSE:
+        print(*args)
+
+
+# =========================
+# 1) Span / Trace
+# =========================
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration_ms: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            **self.attrs,
+        }
+
+
+@dataclass
+class Trace:
+    """
+    一次问答的全部阶段：fact_router / planner / history / encode / filter / faiss_search / lexical / entity /
+    answer_cache / context_pack / prompt_build / deepseek / uniapi
+    """
+    name: str
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start: float = field(default_factory=time.perf_counter)
+    wall_time: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    spans: List[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self) -> Dict[str, float]:
+        """
+        各阶段累计耗时（毫秒）；同名阶段（如多段润色）求和
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+        return {k: round(v, 3) for k, v in totals.items()}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.wall_time)),
+            "duration_ms": round(self.duration_ms, 3),
+            **self.attrs,
+            "spans": [s.to_dict(self.start) for s in spans],
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("hebei_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("hebei_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+# =========================
+# 2) 进程内指标
+# =========================
+class MetricsRegistry:
+    """
+    按阶段汇总的调用次数、平均 / p50 / p95 耗时，以及 token、缓存命中等计数器
+    """
+
+    def __init__(self, samples: int = TRACE_SAMPLES):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._totals: Dict[str, float] = {}
+        self._counters: Dict[str, float] = {}
+        self._max_samples = samples
+
+    def observe(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self._max_samples)
+            self._samples[name].append(duration_ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._totals[name] = self._totals.get(name, 0.0) + duration_ms
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                stages[name] = {
+                    "count": self._counts[name],
+                    "avg_ms": round(self._totals[name] / self._counts[name], 3),
+                    "p50_ms": round(ordered[len(ordered) // 2], 3),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                }
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+metrics = MetricsRegistry()
+
+_recent: "OrderedDict[str, Trace]" = OrderedDict()
+_recent_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def last_trace(key: str) -> Optional[Trace]:
+    """
+    某个 user_id 最近一次完成的问答 trace（UI 调试面板使用）
+    """
+    with _recent_lock:
+        return _recent.get(key)
+
+
+# =========================
+# 3) 埋点接口
+# =========================
+def _reset(var: contextvars.ContextVar, token: contextvars.Token) -> None:
+    # 异步生成器被其他任务关闭时 token 不属于当前上下文，此时直接清空
+    try:
+        var.reset(token)
+    except ValueError:
+        var.set(None)
+
+
+@contextlib.contextmanager
+def trace(name: str, key: Optional[str] = None, **attrs) -> Iterator[Trace]:
+    """
+    开启一次 trace；其内部（含线程池、异步任务）产生的 span 都挂在它下面。
+    结束时记录为 key 的最近一次 trace，并按需追加写入 HEBEI_TRACE_LOG。
+    """
+    t = Trace(name=name, attrs=attrs)
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _reset(_current_trace, token)
+        t.duration_ms = (time.perf_counter() - t.start) * 1000
+        metrics.observe(name, t.duration_ms)
+        if key is not None:
+            with _recent_lock:
+                _recent.pop(key, None)
+                _recent[key] = t
+                while len(_recent) > RECENT_TRACES:
+                    _recent.popitem(last=False)
+        if TRACE_LOG:
+            line = json.dumps(t.to_dict(), ensure_ascii=False, default=str)
+            with _log_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    记录一个阶段的耗时；attrs 与 annotate() 写入的 token 数、缓存命中等一并保存。
+    没有外层 trace 时只计入进程内指标。
+    """
+    s = Span(name=name, start=time.perf_counter(), attrs=attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _reset(_current_span, token)
+        s.duration_ms = (time.perf_counter() - s.start) * 1000
+        metrics.observe(name, s.duration_ms)
+        t = _current_trace.get()
+        if t is not None:
+            t.add(s)
+
+
+def annotate(**attrs) -> None:
+    """
+    给当前 span 追加属性；数值型的 *_tokens / *_hits / *_misses 同时累加到计数器
+    """
+    s = _current_span.get()
+    if s is not None:
+        s.attrs.update(attrs)
+    for k, v in attrs.items():
+        if isinstance(v, (int, float)) and not isinstance(v, bool) and k.endswith(("_tokens", "_hits", "_misses")):
+            metrics.incr(k, v)
+        elif v is True and k.endswith("_hit"):
+            metrics.incr(k + "s")
+
+
+async def carry_context(coro: Awaitable[T], ctx: contextvars.Context) -> T:
+    """
+    把调用方的 trace / span 带到另一个事件循环上执行的协程里
+    """
+    _current_trace.set(ctx.get(_current_trace))
+    _current_span.set(ctx.get(_current_span))
+    return await coro
@@ -1,16 +1,11 @@
 from __future__ import annotations
-import re
+import time
 import uuid
+from typing import List, Optional
 import streamlit as st
-from hebei_agent_faiss_main import get_hebei_answer, UNIAPI_ENABLED
-
-# =========================
-def extract_requested_days_from_text(text: str):
-    """
-    从用户输入中提取 X 日游
-    """
-    m = re.search(r"(\\d+)\\s*日", text)
-    return int(m.group(1)) if m else None
+from answer_backend import AnswerBackend, create_answer_backend
+from answer_jobs import UI_POLL_SECONDS, AnswerJobManager
+from itinerary_planner import DAY_SPLIT_PATTERN, extract_requested_days
 
 # =========================
 # 页面配置
@@ -213,34 +208,134 @@ button[kind="secondary"]:hover, .stButton>button:hover{
 
 
 # =========================
-# 把回答拆成 Day 卡片
+# 把回答拆成 Day 卡片（DAY_SPLIT_PATTERN 与分段润色共用）
 # =========================
-DAY_SPLIT_PATTERN = re.compile(r"(Day\s*\d+\s*[:：])", re.IGNORECASE)
-
-
-def render_answer_cards(answer: str):
+def answer_cards_html(answer: str) -> Optional[str]:
+    """
+    回答 -> Day 卡片 HTML；没有 Day 分段时返回 None（按普通 Markdown 显示）
+    """
     parts = DAY_SPLIT_PATTERN.split(answer)
-
     if len(parts) <= 1:
-        st.markdown(answer)
-        return
+        return None
 
+    cards = []
     for i in range(1, len(parts), 2):
         day_title = parts[i].strip()
         day_body = parts[i + 1].strip() if i + 1 < len(parts) else ""
         day_body_html = day_body.replace("\n", "<br>")
-
-        st.markdown(
+        cards.append(
             f"""
             <div class="day-card">
               <div class="day-title">{day_title}</div>
               <div class="day-body">{day_body_html}</div>
             </div>
-            """,
-            unsafe_allow_html=True
+            """
         )
+    return "".join(cards)
 
 
+def render_answer_cards(answer: str, html: Optional[str] = None):
+    html = answer_cards_html(answer) if html is None else html
+    if html is None:
+        st.markdown(answer)
+    else:
+        st.markdown(html, unsafe_allow_html=True)
+
+
+def render_message(msg: dict):
+    """
+    历史消息：Day 卡片 HTML 首次渲染时解析并存进消息本身，之后每次重跑直接复用
+    """
+    if msg["role"] != "assistant":
+        st.markdown(msg["content"])
+        return
+    if "html" not in msg:
+        msg["html"] = answer_cards_html(msg["content"])
+    if msg["html"] is None:
+        st.markdown(msg["content"])
+    else:
+        st.markdown(msg["html"], unsafe_allow_html=True)
+    for caption in msg.get("captions", ()):
+        st.caption(caption)
+
+
+# =========================
+# 问答后端：默认同进程加载引擎；设置 ANSWER_SERVICE_URL 后只作为推理服务的瘦客户端
+# =========================
+@st.cache_resource
+def get_backend() -> AnswerBackend:
+    return create_answer_backend()
+
+
+# =========================
+# 后台回答任务（整个进程共用一个线程池，按会话区分）
+# =========================
+@st.cache_resource
+def get_answer_jobs() -> AnswerJobManager:
+    return AnswerJobManager(get_backend().get_hebei_answer)
+
+
+def submit_question(question: str, use_llm_enhance: bool):
+    st.session_state.messages.append({"role": "user", "content": question})
+    get_answer_jobs().submit(st.session_state.user_id, question, use_llm_enhance=use_llm_enhance)
+
+
+def answer_captions(query: str, answer: str, use_llm_enhance: bool, ttft: Optional[float]) -> List[str]:
+    captions = []
+    if use_llm_enhance:
+        captions.append("🧠 本次回答：已启用 UniAPI 语言增强（仅润色，不新增事实）")
+    else:
+        captions.append("📘 本次回答：知识库驱动（可控可解释）")
+    if ttft is not None:
+        captions.append(f"⚡ 首字耗时：{ttft:.2f}s")
+
+    # X 日游问题：核对回答的天数与用户要求是否一致
+    requested_days = extract_requested_days(query)
+    answered_days = len(DAY_SPLIT_PATTERN.findall(answer))
+    if requested_days and answered_days:
+        if answered_days == requested_days:
+            captions.append(f"🗺 已按 {requested_days} 天排好路线与分天")
+        else:
+            captions.append(f"⚠️ 你要的是 {requested_days} 天，本次回答给出了 {answered_days} 天，可以让我重新安排")
+    return captions
+
+
+def collect_answer():
+    """
+    后台任务完成后，把结果写入消息历史（每个任务只取走一次）
+    """
+    job = get_answer_jobs().collect(st.session_state.user_id)
+    if job is None:
+        return
+    snap = job.snapshot()
+    if snap["status"] == "error":
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": "抱歉，生成答案时出错了，请稍后重试。",
+            "captions": [f"❌ {snap['error']}"],
+        })
+        return
+    st.session_state.last_evidence = snap["evidence"]
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": snap["answer"],
+        "captions": answer_captions(snap["query"], snap["answer"], job.use_llm_enhance, snap["ttft"]),
+    })
+
+
+def stop_answer():
+    job = get_answer_jobs().current(st.session_state.user_id)
+    if job is None:
+        return
+    snap = job.snapshot()
+    get_answer_jobs().cancel(st.session_state.user_id)
+    if snap["answer"]:
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": snap["answer"],
+            "captions": ["⏹ 已停止生成"],
+        })
+
 
 # =========================
 # 会话初始化
@@ -252,6 +347,13 @@ if "messages" not in st.session_state:
 if "last_evidence" not in st.session_state:
     st.session_state.last_evidence = []
 
+# 页面先渲染，模型与向量库在后台预热（已加载时不会重复加载；瘦客户端模式由推理服务自行预热）
+get_backend().warmup()
+
+# 上一次提交的问题若已答完，先并入历史
+collect_answer()
+answering = get_answer_jobs().busy(st.session_state.user_id)
+
 
 # =========================
 # Sidebar：系统控制台
@@ -268,7 +370,7 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### 🧠 模式设置")
 
-    if UNIAPI_ENABLED:
+    if get_backend().uniapi_enabled:
         use_llm_enhance = st.toggle("启用 UniAPI 语言增强", value=False)
     else:
         use_llm_enhance = False
@@ -290,22 +392,28 @@ with st.sidebar:
         "山海关避坑有哪些？",
     ]
     for q in demo_questions:
-        if st.button(q, use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": q})
-
-            answer, evidence = get_hebei_answer(
-                q,
-                st.session_state.user_id,
-                use_llm_enhance=use_llm_enhance,
-                return_evidence=True
-            )
-            st.session_state.last_evidence = evidence
-            st.session_state.messages.append({"role": "assistant", "content": answer})
+        # 只提交后台任务，不在这里等答案；生成期间禁用，避免同一会话并发提问
+        if st.button(q, use_container_width=True, disabled=answering):
+            submit_question(q, use_llm_enhance)
+            answering = True
+
+    st.markdown("---")
+    with st.expander("⏱ 启动耗时", expanded=False):
+        readiness = get_backend().readiness()
+        if "components" not in readiness:
+            st.caption("推理服务未就绪或无法连接")
+        for name, seconds in readiness.get("components", {}).items():
+            st.caption(f"{name}：{'加载中 / 未加载' if seconds is None else f'{seconds:.2f}s'}")
+
+    show_debug = st.toggle("🛠 调试面板（分阶段耗时）", value=False)
 
     st.markdown("---")
     if st.button("🗑 清空对话", use_container_width=True):
+        get_answer_jobs().cancel(st.session_state.user_id)
+        answering = False
         st.session_state.messages = []
         st.session_state.last_evidence = []
+        get_backend().clear_history(st.session_state.user_id)
 
 
 # =========================
@@ -341,6 +449,7 @@ if page == "🗺 Roadmap（产品规划）":
     st.markdown("### Stage 3｜平台级智能体（长期）")
     st.markdown("- 🔜 接入实时数据：开放时间、票价、天气、拥挤度\n- 🔜 多 Agent 协作：行程 / 预算 / 风险 / 偏好学习\n- 🔜 ToB 文旅局 / 景区咨询导览；ToC 会员与定制")
 
+    # 切到 Roadmap 时后台任务照常进行，回到 Chat 页再取结果
     st.stop()
 
 
@@ -365,12 +474,29 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# 输入框固定在页面底部，先处理提交，本次重跑即可显示新问题与进度
+user_input = st.chat_input(
+    "请输入问题，例如：河北3日游 / 亲子4日游 / 清东陵门票 / 山海关避坑",
+    disabled=answering,
+)
+if user_input and not answering:
+    submit_question(user_input, use_llm_enhance)
+    answering = True
+
 for msg in st.session_state.messages:
     with st.chat_message("user" if msg["role"] == "user" else "assistant"):
-        if msg["role"] == "assistant":
-            render_answer_cards(msg["content"])
-        else:
-            st.markdown(msg["content"])
+        render_message(msg)
+
+# 正在生成的回答：每次轮询按当前已到达的文本刷新一次
+job = get_answer_jobs().current(st.session_state.user_id)
+if job is not None:
+    snap = job.snapshot()
+    with st.chat_message("assistant"):
+        st.caption(f"{snap['status_text']}（{snap['elapsed']:.1f}s）")
+        if snap["answer"]:
+            render_answer_cards(snap["answer"])
+        if not snap["finished"]:
+            st.button("⏹ 停止生成", on_click=stop_answer)
 
 if st.session_state.last_evidence:
     with st.expander("📎 本次回答的 Top-K 检索证据（可截图）", expanded=False):
@@ -382,28 +508,54 @@ if st.session_state.last_evidence:
             lines.append(f"**[命中{i}]** {title}  ｜ {typ} ｜ {city}")
         st.markdown('<div class="evidence-box">' + "<br>".join(lines) + "</div>", unsafe_allow_html=True)
 
-user_input = st.chat_input("请输入问题，例如：河北3日游 / 亲子4日游 / 清东陵门票 / 山海关避坑")
 
-if user_input:
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    with st.chat_message("user"):
-        st.markdown(user_input)
+# =========================
+# Sidebar：调试面板（放在最后渲染，展示的是刚完成的这次回答）
+# =========================
+if show_debug:
+    with st.sidebar:
+        info = get_backend().last_trace(st.session_state.user_id)
+        st.markdown("### 🛠 最近一次回答")
+        if info is None:
+            st.caption("暂无记录，先提一个问题吧。")
+        else:
+            st.caption(
+                f"总耗时 {info['duration_ms']:.0f}ms ｜ 模式 {info.get('mode', '-')}"
+                f" ｜ 回答缓存 {'命中' if info.get('cached') else '未命中'}"
+                f" ｜ 路径 {info.get('route', '-')}"
+            )
+            st.dataframe(
+                [{"阶段": k, "耗时(ms)": v} for k, v in info["breakdown"].items()],
+                use_container_width=True,
+                hide_index=True,
+            )
+            with st.expander("Span 明细", expanded=False):
+                st.json(info["spans"])
+
+        status = get_backend().status()
+        if "error" in status:
+            st.caption(f"推理服务状态不可用：{status['error']}")
+        mem = status.get("memory")
+        if mem is not None:
+            st.caption(
+                f"进程内存：RSS {mem['rss_mb']}MB ｜ 独占 {mem['unique_mb']}MB ｜ 共享 {mem['shared_mb']}MB"
+                f"{' ｜ 索引 mmap' if mem['mmap'] else ''}"
+            )
 
-    with st.spinner("🔍 正在检索知识库并生成答案..."):
-        answer, evidence = get_hebei_answer(
-            user_input,
-            st.session_state.user_id,
-            use_llm_enhance=use_llm_enhance,
-            return_evidence=True
-        )
+        store = status.get("conversations")
+        if store is not None:
+            st.caption(
+                f"会话存储（{store['backend']}）：{store['sessions']} 个会话，"
+                f"{store['turns']} 轮，约 {store['bytes'] / 1024:.1f}KB"
+            )
 
-    st.session_state.last_evidence = evidence
-    st.session_state.messages.append({"role": "assistant", "content": answer})
+        jobs = get_answer_jobs().stats()
+        st.caption(f"后台任务：生成中 {jobs['running']} ｜ 排队 {jobs['queued']}")
 
-    with st.chat_message("assistant"):
-        render_answer_cards(answer)
 
-    if use_llm_enhance:
-        st.caption("🧠 本次回答：已启用 UniAPI 语言增强（仅润色，不新增事实）")
-    else:
-        st.caption("📘 本次回答：知识库驱动（可控可解释）")
+# =========================
+# 轮询：有任务在跑时隔一小段时间重跑页面，期间侧边栏与输入仍可操作
+# =========================
+if get_answer_jobs().current(st.session_state.user_id) is not None:
+    time.sleep(UI_POLL_SECONDS)
+    st.rerun()